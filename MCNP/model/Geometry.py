@@ -73,13 +73,15 @@ class Geometry(BaseModel):
         if universes is None:
             universes = []
         self.universes = universes
-        self.univ_dict = {}
         if cells is None:
             cells = []
-        self.cells = cells
-        if cell_dict:
-            cell_dict = {}
-        self.cell_dict = cell_dict
+        self.cells = []
+        # {universe id: list of cells in the universe}, in the order of appearance
+        self.univ_dict = {}
+        # {cell id: cell}
+        self.cell_dict = {}
+        for cell in cells:
+            self.add_cell(cell)
         self.unparsed = unparsed
 
     def check(self):
@@ -88,6 +90,11 @@ class Geometry(BaseModel):
     def add_universe(self, univ):
         self.universes.append(univ)
 
+    def add_cell(self, cell):
+        self.cells.append(cell)
+        self.cell_dict[cell.number] = cell
+        self.univ_dict.setdefault(cell.universe, []).append(cell)
+
     def get_univ(self, uid):
         return self.univ_dict[uid]
 
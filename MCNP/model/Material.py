@@ -14,14 +14,22 @@ class Materials(BaseModel):
         if mats is None:
             mats = []
         self.mats = mats
+        # {material id: material}
+        self.mat_dict = {}
+        for mat in self.mats:
+            self.mat_dict.setdefault(mat.mat_id, mat)
         if mts is None:
             mts = []
         self.mts = mts
         self._unparsed = unparsed  # ceace, mgace, etc.
 
     def add_mat(self, mat):
-        if mat not in self.mats:
+        if mat.mat_id not in self.mat_dict:
             self.mats.append(mat)
+            self.mat_dict[mat.mat_id] = mat
+
+    def get_mat(self, mat_id):
+        return self.mat_dict.get(mat_id)
 
     def add_mt(self, mt):
         if mt not in self.mts:
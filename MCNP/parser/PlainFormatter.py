@@ -4,6 +4,22 @@
 
 import re
 
+# the blank characters which will be replaced by ' '
+_BLANK = re.compile(r'[\t\r\f\v]')
+# the positions where a blank is required, e.g.
+# 'fill=1' to 'fill = 1', '(3:4):(-5:-7)' to '( 3 : 4 ) : ( -5 : -7 )'
+_SEPARATOR = re.compile(r'(?<=[^ ])(?==)|(?<==)(?=[^ ])'
+                        r'|(?<=[0-9\)\+\-\.])(?=\:)|(?<=\:)(?=[0-9\)\+\-\.\(])'
+                        r'|(?<=\))(?=[0-9\)\+\-\.\(])|(?<=[0-9\)\+\-\.\(])(?=\()'
+                        r'|(?<=\()(?=[0-9\)\+\-\.\(])|(?<=[0-9\)\+\-\.\(])(?=\))')
+# the exponent without 'e', like '1.5-3'
+_EXPONENT = re.compile(r'(?<=[0-9\.])-(?=[0-9])')
+_SPACES = re.compile(r' {2,}')
+_NUMBER = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$')
+# the shorthand entries, like '4R', 'R', '2I', '3LOG', '3ILOG', '2J' and '0.5M'
+_SHORTHAND = re.compile(r'(?P<count>\d*)(?P<type>R|I|ILOG|LOG|J)$'
+                        r'|(?P<factor>(?:\d+\.?\d*|\.\d+)(?:E[+-]?\d+)?)M$', re.I)
+
 
 class PlainFormatter:
     def __init__(self, file_name):
@@ -12,7 +28,7 @@ class PlainFormatter:
         self._s_changed = True
         self._formatted = False
         self._read = False
-        self._special_define_processed = True
+        self._terminated = False
 
     def read(self):
         if self._read:
@@ -25,96 +41,180 @@ class PlainFormatter:
         return self._s_changed
 
     def format(self):
-        self.read()
-
-        while self._s_changed:
-            self._s_changed = False
-            changed_inp = re.sub(r'[\t\r\f\v]', ' ', self.content)
-            changed_inp = re.sub(r'(?P<char>[^ ])=', '\g<char> =', changed_inp)
-            changed_inp = re.sub(r'=(?P<char>[^ ])', '= \g<char>', changed_inp)
-            # (3: 4):(-5: -7) to ( 3 : 4 ) : ( -5 : -7 )
-            changed_inp = re.sub(r'(?P<char>[0-9\)\+\-\.\)])\:', '\g<char> :', changed_inp)
-            changed_inp = re.sub(r'\:(?P<char>[0-9\)\+\-\.\(])', ': \g<char>', changed_inp)
-            changed_inp = re.sub(r'\)(?P<char>[0-9\)\+\-\.\(\)])', ') \g<char>', changed_inp)
-            changed_inp = re.sub(r'(?P<char>[0-9\)\+\-\.\(\)])\(', '\g<char> (', changed_inp)
-            changed_inp = re.sub(r'\((?P<char>[0-9\)\+\-\.\(\)])', '( \g<char>', changed_inp)
-            changed_inp = re.sub(r'(?P<char>[0-9\)\+\-\.\(\)])\)', '\g<char> )', changed_inp)
-
-            changed_inp = changed_inp.replace('  ', ' ')
-            changed_inp = changed_inp.replace('\n\n\n', '\n\n')
-            changed_inp = re.sub(r'[ ]+\n', '\n', changed_inp)
-            # Remove the comments that occupy the whole line.
-            # Note that even if the comment mark 'c' is following some blanks,
-            # this will not be regarded as a blank line.
-            changed_inp = re.sub(r'\n[ ]*[cC$][^\n]*\n', '\n', changed_inp)
-            # remove the '$' comments lines
-            # Remove the inline comments.
-            changed_inp = re.sub(r'\n(?P<content>[ ]*[^ ]+.*?)\$[^\n]*\n', '\n\g<content>\n', changed_inp)
-            changed_inp = re.sub(r'(?P<front>[0-9\.]+)-(?P<back>[0-9]+)', '\g<front>e-\g<back>', changed_inp)
-            self._s_changed = (changed_inp != self.content)
-            self.content = changed_inp
-
-        # Remove the comment at the head and too many line-end signs at the end of the file.
-        self.content = re.sub(r'.*\n', '', self.content, count=1)  # remove the first line
-        self.content = re.sub(r'^[\n]+', '', self.content)
-        self.content = re.sub(r'[\n]+$', '\n', self.content)
-
-        changed_inp = self.content
-        while self._special_define_processed:  # process the %d nR / ni / nm pattern
-            self._special_define_processed = False
-
-            reg = r'([0-9\.]+) ([1-9]*)[Rr][ \n]'   # like '2 4R '
-            searched = re.search(reg, changed_inp)
-            if searched:
-                rep_index = list(searched.span())
-                rep_str = searched.group()
-                rep_str1 = searched.group(1)
-                if searched.group(2) == '':
-                    rep_str2 = 1
-                else:
-                    rep_str2 = int(searched.group(2))  # '4'
-                rep_new = rep_str1
-                for i in range(rep_str2):
-                    rep_new += ' ' + rep_str1
-                rep_new += rep_str[-1]
-                changed_inp = self.replace_string(changed_inp, rep_index, rep_new)
-                self._special_define_processed = (changed_inp != self.content)
-                continue
+        """
+        Format the MCNP input in a single sweep over its lines:
+        0: replace tabs and other blank characters with a single blank;
+        1: delete the comment lines ('c' or '$' as the first non-blank character)
+           and the '$' inline comments;
+        2: add blanks around '=', ':', '(' and ')';
+        3: repair the exponents without 'e', like '1.5-3' to '1.5e-3';
+        4: delete the title line, the redundant blank lines and blanks;
+        5: expand the nR / nI / nM pattern.
 
-            reg = r'([0-9\.]+) ([1-9]*)[Ii] ([0-9\.]+)'  # like '1 4I 6'
-            searched = re.search(reg, changed_inp)
-            if searched:
-                rep_index = list(searched.span())
-                rep_str = searched.group()
-                rep_str1 = float(searched.group(1))  # '1'
-                if searched.group(2) == '':
-                    rep_str2 = 1
-                else:
-                    rep_str2 = int(searched.group(2))  # '4'
-                rep_str3 = float(searched.group(3))  # '6'
-                internal = (rep_str3-rep_str1)/(rep_str2+1)
-                rep_new = str(rep_str1)
-                for i in range(rep_str2+1):
-                    rep_new += ' ' + str(rep_str1 + (i+1)*internal)
-                changed_inp = self.replace_string(changed_inp, rep_index, rep_new)
-                self._special_define_processed = (changed_inp != self.content)
+        :return: string after formatting
+        """
+        lines = self._expand_shorthand(self._format_lines())
+        self.content = self._join(lines)
+        self._formatted = True
+        return self.content
+
+    def _format_plain(self):
+        """
+        Format the input without processing the nR / nI / nM pattern.
+        :return: string after formatting
+        """
+        return self._join(self._format_lines())
+
+    def _format_lines(self):
+        with open(self.file_name, 'r') as f:
+            lines = self._collapse_blank_lines(self._lex(f))
+        self._s_changed = False
+        return lines
+
+    def _join(self, lines):
+        content = '\n'.join(lines)
+        if lines and self._terminated:
+            content += '\n'
+        return content
+
+    def _lex(self, raw_lines):
+        """
+        Format the input line by line.
+        :param raw_lines: iterable of the lines in the input, like a file object.
+        :return: generator of the formatted lines, comment lines and the title line excluded.
+        """
+        self._terminated = False
+        title = None
+        for number, raw_line in enumerate(raw_lines):
+            self._terminated = raw_line.endswith('\n')
+            line = raw_line[:-1] if self._terminated else raw_line
+            if title is None:
+                # The first line is the title, which is deleted unless it is not terminated
+                # by a line-end sign, i.e., it is the only line of the input.
+                title = line
                 continue
+            line = _BLANK.sub(' ', line)
+            if self._terminated:
+                # Remove the comments that occupy the whole line.
+                # Note that even if the comment mark 'c' is following some blanks,
+                # this will not be regarded as a blank line.
+                if line.lstrip(' ')[:1] in ('c', 'C', '$'):
+                    continue
+                # Remove the inline comments.
+                line = line.split('$', 1)[0]
+            yield self._format_line(line, head=False, terminated=self._terminated)
+        if title is not None and number == 0 and not self._terminated:
+            yield self._format_line(_BLANK.sub(' ', title), head=True, terminated=False)
 
-            reg = r'([0-9\.]+) ([1-9\.]+)[Mm][ \n]'  # like '2 4m '
-            searched = re.search(reg, changed_inp)
-            if searched:
-                rep_index = list(searched.span())
-                rep_str = searched.group()
-                rep_str1 = float(searched.group(1))
-                rep_str2 = float(searched.group(2))
-                rep_new = str(rep_str1) + ' ' + str(rep_str1*rep_str2) + rep_str[-1]
-                changed_inp = self.replace_string(changed_inp, rep_index, rep_new)
-                self._special_define_processed = (changed_inp != self.content)
+    @staticmethod
+    def _format_line(line, head, terminated):
+        line = _EXPONENT.sub('e-', line)
+        line = _SEPARATOR.sub(' ', line)
+        if not head and line.startswith('='):
+            # a '=' at the beginning of the line is separated from the line-end sign before.
+            line = ' ' + line
+        line = _SPACES.sub(' ', line)
+        # the blanks at the end of the input without a line-end sign are kept.
+        return line.rstrip(' ') if terminated else line
+
+    def _collapse_blank_lines(self, lines):
+        """
+        Remove the blank lines at the head and the end of the input,
+        and replace continuous blank lines with a single one.
+        :return: list of the lines.
+        """
+        collapsed = []
+        for line in lines:
+            if line == '' and (not collapsed or collapsed[-1] == ''):
                 continue
+            collapsed.append(line)
+        if collapsed and collapsed[-1] == '':
+            collapsed.pop()
+            self._terminated = True
+        return collapsed
 
-        self.content = changed_inp
-        self._formatted = True
-        return self.content
+    def _expand_shorthand(self, lines):
+        """
+        Expand the shorthand entries in a single pass over the tokens of each card entry:
+        'x nR' repeats x for n times, 'x nI y' and 'x nLOG y' ('x nILOG y') insert n linear
+        and logarithmic interpolates between x and y, 'x fM' is x followed by x * f,
+        and 'nJ' jumps over n entries, which are kept as 'J'.
+        Note that n can be omitted for 1.
+        :param lines: list of the formatted lines.
+        :return: list of the expanded lines.
+        """
+        expanded = []
+        start = 0
+        while start < len(lines):
+            # a card entry is a line together with its continuation lines.
+            end = start + 1
+            while end < len(lines) and lines[end].startswith(' '):
+                end += 1
+            expanded.extend(self._expand_entry(lines[start:end]))
+            start = end
+        return expanded
+
+    @staticmethod
+    def _expand_entry(lines):
+        tokens = [(index, token) for index, line in enumerate(lines) for token in line.split()]
+        new_lines = [[] for _ in lines]
+        changed = [False for _ in lines]
+        previous = None
+        for pos, (index, token) in enumerate(tokens):
+            values = None
+            shorthand = _SHORTHAND.match(token)
+            if shorthand is not None:
+                following = tokens[pos + 1][1] if pos + 1 < len(tokens) else None
+                values = PlainFormatter._expand_token(shorthand, previous, following)
+            if values is None:
+                new_lines[index].append(token)
+                previous = token if _NUMBER.match(token) else None
+            else:
+                new_lines[index].extend(values)
+                changed[index] = True
+                if values and values[-1] != 'J':
+                    previous = values[-1]
+                elif values:
+                    previous = None
+
+        for index, line in enumerate(lines):
+            if changed[index]:
+                lines[index] = (' ' if line.startswith(' ') else '') + ' '.join(new_lines[index])
+        return lines
+
+    @staticmethod
+    def _expand_token(shorthand, previous, following):
+        """
+        :param shorthand: match of the shorthand entry.
+        :param previous: the entry before the shorthand, None if it is not a number.
+        :param following: the entry after the shorthand.
+        :return: list of the expanded entries, None if the shorthand can not be expanded.
+        """
+        if shorthand.group('factor') is not None:
+            if previous is None:
+                return None
+            return [str(float(previous) * float(shorthand.group('factor')))]
+
+        kind = shorthand.group('type').upper()
+        count = int(shorthand.group('count')) if shorthand.group('count') else 1
+        if kind == 'J':
+            return ['J'] * count
+        if previous is None:
+            return None
+        if kind == 'R':
+            return [previous] * count
+
+        if following is None or not _NUMBER.match(following):
+            return None
+        start = float(previous)
+        end = float(following)
+        if kind == 'I':
+            interval = (end - start) / (count + 1)
+            return [str(start + (i + 1) * interval) for i in range(count)]
+        if start <= 0 or end <= 0:
+            return None
+        ratio = (end / start) ** (1.0 / (count + 1))
+        return [str(start * ratio ** (i + 1)) for i in range(count)]
 
     def format_and_output(self, output_file_name):
         """
@@ -130,17 +230,38 @@ class PlainFormatter:
     def format_to_cards(self):
         if not self._formatted:
             self.format()
-        '''    
-        cards = self.content.split('\n\n')
-
-        lines = cards[0].split('\n')
-        cards[0] = '\n'.join([line.strip() for line in lines])
-        lines = cards[1].split('\n')
-        cards[1] = '\n'.join([line.strip() for line in lines])
-        self.content = '\n\n'.join(cards)
-        '''
         # each card will be split into the element of a list.
-        return self.content.replace('\n ', ' ').split('\n\n')
+        return list(self._cards(self.content.split('\n')))
+
+    @staticmethod
+    def _cards(lines):
+        """
+        Group the formatted lines into cards. The cards are separated by a blank line,
+        and a line beginning with a blank is joined to the line before.
+        :param lines: iterable of the formatted lines.
+        :return: generator of the cards.
+        """
+        card = []
+        blank = False
+        for line in lines:
+            if line == '':
+                blank = True
+                continue
+            if line.startswith(' ') and blank:
+                # the blank line is absorbed by the continuation line.
+                blank = False
+                card.append(line)
+            elif line.startswith(' ') and card:
+                card[-1] += line
+            else:
+                if blank:
+                    yield '\n'.join(card)
+                    card = []
+                    blank = False
+                card.append(line)
+        if blank:
+            card.append('')
+        yield '\n'.join(card)
 
     def clear(self):
         self.content = ""
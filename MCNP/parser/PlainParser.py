@@ -3,12 +3,16 @@
 # date: 2021-07-20
 
 import re
-import copy
 from MCNP.parser.PlainFormatter import PlainFormatter
 from MCNP.model.base import Model as InputModel
 from MCNP.model.Geometry import *
 from MCNP.model.Material import *
 
+# the beginning of the options in a cell card, the geometry description ends before it.
+_CELL_OPTION = re.compile('|'.join(Cell.card_option_types), re.I)
+# the options which are parsed in a cell card
+_CELL_CARD_OPTIONS = {key: val for key, val in Cell.card_option_types.items() if key != 'TRCL'}
+
 
 class PlainParser:
     def __init__(self, inp):
@@ -165,69 +169,47 @@ class PlainParser:
     @staticmethod
     def __parse_geometry(content):
         cells = []
-        universes = []
         geo_unparsed = ''
         for cell in content:
-            cell_len = len(cell.split())
-            cell_id = int(cell.split()[0])
-            unparsed = ''
+            # each cell card is split into words only once, and the words are walked through by index.
+            words = cell.split()
+            cell_len = len(words)
+            cell_id = int(words[0])
 
-            if cell.split()[1].upper() != 'LIKE':  # like 'j m d geom params'
-                index = 0
+            if words[1].upper() != 'LIKE':  # like 'j m d geom params'
                 # 解析几何中的材料信息
-                mat_id = int(cell.split()[1])
+                mat_id = int(words[1])
                 mat_density = None
                 if mat_id == 0:
                     index = 2
                 else:
                     index = 3
-                    mat_density = float(cell.split()[2])
+                    mat_density = float(words[2])
 
                 # 解析几何中的面信息
-                cell_geom = ''
-                geom_no_end = True
-                while geom_no_end:
-                    options = cell.split()[index:]
-                    for param in Cell.card_option_types:
-                        if re.match(param, options[0], re.I):
-                            geom_no_end = False
-                            break
-                    if not geom_no_end:
+                # the surfaces are intersected by '&', which is removed before ':', '(' and ')'.
+                cell_geom = []
+                while index < cell_len:
+                    word = words[index]
+                    if _CELL_OPTION.match(word):
                         break
-                    if options[0] in [':', '(', ')']:
-                        cell_geom = cell_geom[0:len(cell_geom) - 1]
-                        cell_geom += options[0] + ' '
+                    if word in [':', '(', ')']:
+                        if cell_geom and cell_geom[-1] == '&':
+                            cell_geom.pop()
+                        cell_geom.append(word)
                     else:
-                        cell_geom += '(' + options[0] + ')' + '&'
+                        cell_geom.append('(' + word + ')')
+                        cell_geom.append('&')
                     index += 1
-                    if index >= cell_len:
-                        geom_no_end = False
-                        break
-
-                cell_geom = cell_geom[0:len(cell_geom) - 1].replace(' ', '')
-                cell_geom = cell_geom.replace(')(', ')&(')
+                if cell_geom and cell_geom[-1] == '&':
+                    cell_geom.pop()
+                cell_geom = ''.join(cell_geom).replace(')(', ')&(')
 
                 # 解析几何中的其他选项
                 cell_dict = {}
-                cell_card_options = copy.deepcopy(Cell.card_option_types)
-                cell_card_options.pop('TRCL')
+                unparsed = ''
                 if index != cell_len:
-                    unparsed_items = ' '.join(cell.split()[index:])
-                    while unparsed_items is not '':
-                        if 'LAT' in cell_dict and 'FILL' in cell_card_options:
-                            cell_card_options.pop('FILL')
-                        [cell_dict_item, unparsed_items_new] = PlainParser._parse_option(unparsed_items,
-                                                                                         cell_card_options)
-                        if cell_dict_item:
-                            cell_dict[unparsed_items.split()[0].upper()] = cell_dict_item[
-                                unparsed_items.split()[0].upper()]
-                        if unparsed_items_new is '':
-                            unparsed_items = unparsed_items_new
-                        elif unparsed_items.split()[0] == unparsed_items_new.split()[0]:
-                            unparsed += ' ' + unparsed_items.split()[0]
-                            unparsed_items = ' '.join(unparsed_items.split()[1:])
-                        else:
-                            unparsed_items = unparsed_items_new
+                    unparsed = PlainParser.__parse_cell_options(words[index:], cell_dict)
 
                 parsed_cell = Cell(cell_id, material=mat_id, density=mat_density, bounds=cell_geom, unparsed=unparsed)
                 parsed_cell.add_options(cell_dict)
@@ -237,6 +219,58 @@ class PlainParser:
                 geo_unparsed += cell + '\n'
         return [cells, geo_unparsed]
 
+    @staticmethod
+    def __parse_cell_options(words, cell_dict):
+        """
+        Parse the options of a cell card by walking through the words with an index.
+        The '=' between an option and its value is skipped after the first option given in
+        lower case or parsed, and the unparsed words are kept in the same form as before.
+        :param words: list of the words of the options, like ['u', '=', '1', 'imp:n', '=', '1'].
+        :param cell_dict: dict where the parsed options are saved.
+        :return: string of the unparsed words.
+        """
+        unparsed = ''
+        last = len(words) - 1
+        skip_equal = False
+
+        def next_index(idx, skip):
+            idx += 1
+            while skip and idx < last and words[idx] == '=':
+                idx += 1
+            return idx
+
+        index = 0
+        while index <= last:
+            word = words[index]
+            name = word.upper()
+            if name in _CELL_CARD_OPTIONS and not (name == 'FILL' and 'LAT' in cell_dict):
+                dtype = _CELL_CARD_OPTIONS[name]
+                value_index = next_index(index, True)
+                if dtype[0] == 'list':
+                    options = [name] + [words[i] for i in range(value_index, last + 1)
+                                        if words[i] != '=' or i == last]
+                    [opt_val, opt_len] = PlainParser._parse_list(options, dtype[1])
+                else:
+                    [opt_val, opt_len] = PlainParser._parse_val([name, words[value_index]], dtype[0])
+                new_index = value_index
+                for i in range(opt_len - 1):
+                    new_index = next_index(new_index, True)
+                cell_dict[name] = opt_val
+                if new_index > last:
+                    break
+                if words[new_index] == word:
+                    unparsed += ' ' + word
+                    index = next_index(index, skip_equal)
+                else:
+                    skip_equal = True
+                    index = new_index
+            else:
+                unparsed += ' ' + name
+                if word != name:
+                    skip_equal = True
+                index = next_index(index, skip_equal)
+        return unparsed
+
     @staticmethod
     def _parse_option(content, cards):
         options = content.replace(' = ', ' ').split()
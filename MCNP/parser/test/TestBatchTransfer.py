@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import MCNPtoRMC as M2R
+import runner
+
+
+class TestBatchTransfer(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.files = []
+        for name in ['inp1', 'inp2']:
+            self.files.append(os.path.join(self.work_dir, name))
+            shutil.copy('resources/inp', self.files[-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def check(self, workers):
+        report = os.path.join(self.work_dir, 'report.txt')
+        results = M2R.batch_transfer(self.files, workers=workers, report=report)
+        self.assertEqual([result['file'] for result in results], self.files)
+        self.assertTrue(all(result['success'] for result in results))
+        for file in self.files:
+            self.assertTrue(os.path.isfile(file + '_parsed_RMC_model'))
+        with open(report) as f:
+            self.assertIn('2 files processed, 0 failed', f.read())
+
+    def test_serial(self):
+        self.check(workers=1)
+
+    def test_pool(self):
+        self.check(workers=2)
+
+    def test_failed(self):
+        with open(self.files[1], 'w') as f:
+            f.write('not an MCNP input\n')
+        results = M2R.batch_transfer(self.files, workers=2)
+        self.assertTrue(results[0]['success'])
+        self.assertFalse(results[1]['success'])
+        self.assertIsNotNone(results[1]['error'])
+
+    def test_workers(self):
+        self.assertEqual(runner._argparse(['inp', '--workers', '2']).workers, 2)
+        self.assertIsNone(runner._argparse(['inp']).workers)
+        for workers in ['0', '-1', 'a']:
+            with self.assertRaises(SystemExit):
+                runner._argparse(['inp', '--workers', workers])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import re
+import time
+import unittest
+from MCNP.parser.PlainFormatter import PlainFormatter
+
+
+def fixed_point_format(content):
+    """The former fixed-point regex formatting, used as the reference of the single-pass lexer."""
+    changed = True
+    while changed:
+        changed_inp = re.sub(r'[\t\r\f\v]', ' ', content)
+        changed_inp = re.sub(r'(?P<char>[^ ])=', r'\g<char> =', changed_inp)
+        changed_inp = re.sub(r'=(?P<char>[^ ])', r'= \g<char>', changed_inp)
+        changed_inp = re.sub(r'(?P<char>[0-9\)\+\-\.\)])\:', r'\g<char> :', changed_inp)
+        changed_inp = re.sub(r'\:(?P<char>[0-9\)\+\-\.\(])', r': \g<char>', changed_inp)
+        changed_inp = re.sub(r'\)(?P<char>[0-9\)\+\-\.\(\)])', r') \g<char>', changed_inp)
+        changed_inp = re.sub(r'(?P<char>[0-9\)\+\-\.\(\)])\(', r'\g<char> (', changed_inp)
+        changed_inp = re.sub(r'\((?P<char>[0-9\)\+\-\.\(\)])', r'( \g<char>', changed_inp)
+        changed_inp = re.sub(r'(?P<char>[0-9\)\+\-\.\(\)])\)', r'\g<char> )', changed_inp)
+        changed_inp = changed_inp.replace('  ', ' ')
+        changed_inp = changed_inp.replace('\n\n\n', '\n\n')
+        changed_inp = re.sub(r'[ ]+\n', '\n', changed_inp)
+        changed_inp = re.sub(r'\n[ ]*[cC$][^\n]*\n', '\n', changed_inp)
+        changed_inp = re.sub(r'\n(?P<content>[ ]*[^ ]+.*?)\$[^\n]*\n', r'\n\g<content>\n', changed_inp)
+        changed_inp = re.sub(r'(?P<front>[0-9\.]+)-(?P<back>[0-9]+)', r'\g<front>e-\g<back>', changed_inp)
+        changed = (changed_inp != content)
+        content = changed_inp
+    content = re.sub(r'.*\n', '', content, count=1)
+    content = re.sub(r'^[\n]+', '', content)
+    content = re.sub(r'[\n]+$', '\n', content)
+    return content
+
+
+def iterative_repeat(content):
+    """The former nR expansion, which rebuilds the whole content for each match."""
+    searched = re.search(r'([0-9\.]+) ([1-9]*)[Rr][ \n]', content)
+    while searched:
+        rep_new = ' '.join([searched.group(1)] * (int(searched.group(2)) + 1)) + searched.group()[-1]
+        content = content[:searched.start()] + rep_new + content[searched.end():]
+        searched = re.search(r'([0-9\.]+) ([1-9]*)[Rr][ \n]', content)
+    return content
+
+
+class TestPlainFormatter(unittest.TestCase):
+    file_name = 'resources/inp'
+
+    def test_format_identical(self):
+        with open(self.file_name, 'r') as f:
+            reference = fixed_point_format(f.read())
+        formatter = PlainFormatter(self.file_name)
+        self.assertEqual(formatter._format_plain(), reference)
+
+    def test_format_to_cards(self):
+        formatter = PlainFormatter(self.file_name)
+        cards = formatter.format_to_cards()
+        self.assertEqual(len(cards), 3)
+        self.assertEqual(cards[0].split('\n')[5],
+                         '6 0 -5 6 -7 8 lat = 1 u = 3 imp:n = 1 fill = -1 : 1 -1 : 1 0 : 0 1 1 1 1 2 1 1 1 1')
+        self.assertEqual(cards[0].split('\n')[-1], '9 4 1.2e-2 ( -15 : 16 ) ( 17 -18 ) imp:n = 1')
+        self.assertEqual(cards[2].split('\n')[0], 'm1 92235.70c 7.0803e-4 92238.70c 2.2604e-2 8016.70c 4.6624e-2')
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_benchmark(self):
+        """Compare the single-pass lexer with the fixed-point regex loop on a synthetic deck."""
+        deck_name = 'resources/benchmark_inp'
+        with open(self.file_name, 'r') as f:
+            content = f.read()
+        cells, others = content.split('\n\n', 1)
+        lines = [cells]
+        for i in range(2000):
+            lines.append('%d 1 -10.3 -1 u=%d imp:n=1 $ fuel\n     vol=1.0-2' % (100 + i, 10 + i))
+            lines.append('c comment line %d' % i)
+        with open(deck_name, 'w') as f:
+            f.write('\n'.join(lines) + '\n\n' + others)
+
+        start = time.time()
+        with open(deck_name, 'r') as f:
+            reference = fixed_point_format(f.read())
+        fixed_point_time = time.time() - start
+
+        start = time.time()
+        formatted = PlainFormatter(deck_name)._format_plain()
+        lexer_time = time.time() - start
+
+        print('fixed-point regex loop: %.3fs, single-pass lexer: %.3fs' % (fixed_point_time, lexer_time))
+        self.assertEqual(formatted, reference)
+        os.remove(deck_name)
+
+    def test_expand_shorthand(self):
+        formatter = PlainFormatter(self.file_name)
+        lines = ['sp1 0 2 3r', 'si1 1 3i 5 10 2ilog 1000', 'x 2 2m 0.5M r', 'a -2 R 2J 1',
+                 'fill 1 2', ' 3r 1 2i', ' 4', 'm1 1001.70c 1 10r', 'b 2r']
+        self.assertEqual(formatter._expand_shorthand(lines),
+                         ['sp1 0 2 2 2 2', 'si1 1 2.0 3.0 4.0 5 10 46.415888336127786 215.4434690031883 1000',
+                          'x 2 4.0 2.0 2.0', 'a -2 -2 J J 1',
+                          'fill 1 2', ' 2 2 2 1 2.0 3.0', ' 4', 'm1 1001.70c 1' + ' 1' * 10, 'b 2r'])
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_expand_benchmark(self):
+        """The expansion time should scale linearly with the number of repeats."""
+        for repeats in [250, 500, 1000]:
+            lines = ['fill=0:%d' % (repeats * 10)] + [' %d 9r' % (i % 7 + 1) for i in range(repeats)]
+            content = '\n'.join(lines) + '\n'
+
+            start = time.time()
+            reference = iterative_repeat(content)
+            iterative_time = time.time() - start
+
+            start = time.time()
+            expanded = PlainFormatter(self.file_name)._expand_shorthand(lines)
+            single_pass_time = time.time() - start
+
+            print('%d repeats: iterative %.3fs, single-pass %.3fs' % (repeats, iterative_time, single_pass_time))
+            self.assertEqual('\n'.join(expanded) + '\n', reference)
+
+
+if __name__ == '__main__':
+    unittest.main()
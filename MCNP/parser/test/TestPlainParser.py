@@ -0,0 +1,55 @@
+import os
+import time
+from unittest import TestCase, skipUnless
+
+from MCNP.parser.PlainParser import PlainParser
+
+
+def synthetic_cells(number):
+    return ['%d %d -10.4 -%d %d : ( -%d %d ) u = %d imp:n = 1 vol = 1.0' %
+            (i, i % 5 + 1, i, i + 1, i + 2, i + 3, i % 100 + 1) for i in range(1, number + 1)]
+
+
+class TestPlainParser(TestCase):
+    def test_indexes(self):
+        test_case = 'resources/inp'
+        model = PlainParser(test_case).parsed
+        geometry = model['geometry']
+        self.assertEqual(list(geometry.univ_dict.keys()), [1, 2, 3, 0])
+        self.assertEqual([cell.number for cell in geometry.get_univ(1)], [1, 2, 3, 4])
+        self.assertEqual([cell.number for cell in geometry.get_univ(0)], [7, 8, 9])
+        self.assertEqual(geometry.get_cell(6).lat, 1)
+        self.assertEqual(model['materials'].get_mat(3).mat_id, 3)
+        self.assertIsNone(model['materials'].get_mat(5))
+
+    def test_parse_cell(self):
+        [cells, unparsed] = PlainParser._PlainParser__parse_geometry(synthetic_cells(2) + ['3 LIKE 1 BUT u = 2'])
+        self.assertEqual(cells[0].bounds, '(-1)&(2):((-3)&(4))')
+        self.assertEqual(cells[0].universe, 2)
+        self.assertEqual(cells[1].impn, 1)
+        self.assertEqual(cells[1].unparsed, ' VOL 1.0')
+        self.assertEqual(unparsed, '3 LIKE 1 BUT u = 2\n')
+
+        [cells, unparsed] = PlainParser._PlainParser__parse_geometry(
+            ['9 0 -1 2 lat = 1 u = 9 fill = -1 : 1 0 : 0 0 : 0 1 2 1'])
+        self.assertEqual(cells[0].bounds, '(-1)&(2)')
+        self.assertEqual([cells[0].lat, cells[0].universe], [1, 9])
+        self.assertEqual(cells[0].unparsed, ' FILL -1 : 1 0 : 0 0 : 0 1 2 1')
+
+    @skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_parse_benchmark(self):
+        """The parsing time should scale linearly with the number of cells."""
+        times = []
+        for number in [10000, 100000]:
+            cards = synthetic_cells(number)
+            start = time.time()
+            [cells, unparsed] = PlainParser._PlainParser__parse_geometry(cards)
+            times.append(time.time() - start)
+            self.assertEqual(len(cells), number)
+            print('%d cells: %.3fs' % (number, times[-1]))
+        self.assertLess(times[1], times[0] * 30)
+
+        lattice = ['9 0 -1 lat = 1 u = 9 fill = -99 : 100 -99 : 100 0 : 0 ' + ' '.join(['1'] * 40000)]
+        start = time.time()
+        PlainParser._PlainParser__parse_geometry(lattice)
+        print('lattice cell with 40000 elements: %.3fs' % (time.time() - start))
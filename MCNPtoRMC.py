@@ -3,6 +3,12 @@
 # date: 2021-07-23
 
 
+import io
+import time
+import contextlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
 import RMC.model.input.Material as RMCMat
 import RMC.model.input.Geometry as RMCGeometry
 import RMC.model.input.Criticality as RMCCriticality
@@ -31,13 +37,14 @@ def transfer(inp_MCNP):
 
     # transfer material block
     R_materials = []
+    M_materials = M_model.model['materials']
     for cell in M_model.model['geometry'].cells:
         tmp_mat_id = cell.material
         if tmp_mat_id == 0:
             continue
-        for index in range(len(M_model.model['materials'].mats)):
-            if M_model.model['materials'].mats[index].mat_id == tmp_mat_id:
-                M_model.model['materials'].mats[index].densities.append(cell.density)
+        mat = M_materials.get_mat(tmp_mat_id)
+        if mat is not None:
+            mat.densities.append(cell.density)
 
     duplicate_mats = []
     for mat in M_model.model['materials'].mats:
@@ -59,38 +66,22 @@ def transfer(inp_MCNP):
     test2 = str(R_materials_model)
 
     # transfer geometry block
-    R_cells = []
     R_universes = []
-    R_universes_ids = []
-    for cell in M_model.model['geometry'].cells:
-        out_universe_id = 0
-        if cell.universe:
-            out_universe_id = cell.universe
-        R_cell = RMCGeometry.Cell(number=cell.number, bounds=cell.bounds.replace('#', '!'), material=cell.material,
-                                  fill=cell.fill, impn=cell.impn)
-
-        established_univ = False
-        for index in range(len(R_universes_ids)):
-            if R_universes_ids[index] == out_universe_id:
-                R_universes[index].cells.append(R_cell)
-                established_univ = True
-
-        if not established_univ:
-            R_lattice = None
-            if cell.lat:
-                R_lattice = RMCGeometry.Lattice(type=cell.lat)
-                R_universe1 = RMCGeometry.Universe(number=out_universe_id, lattice=R_lattice)
-                R_universe2 = RMCGeometry.Universe(number=out_universe_id * 1000 + 1)
-                R_universe2.cells.append(R_cell)
-                R_universes.append(R_universe2)
-                R_universes_ids.append(out_universe_id * 1000 + 1)
-                R_universes.append(R_universe1)
-                R_universes_ids.append(out_universe_id)
-            else:
-                R_universe = RMCGeometry.Universe(number=out_universe_id, lattice=R_lattice)
-                R_universe.cells.append(R_cell)
-                R_universes.append(R_universe)
-                R_universes_ids.append(out_universe_id)
+    for out_universe_id, cells in M_model.model['geometry'].univ_dict.items():
+        R_cells = [RMCGeometry.Cell(number=cell.number, bounds=cell.bounds.replace('#', '!'), material=cell.material,
+                                    fill=cell.fill, impn=cell.impn) for cell in cells]
+
+        if cells[0].lat:
+            # the lattice cell is moved into a new universe filling the lattice,
+            # and the other cells in the universe are kept in the lattice universe.
+            R_lattice = RMCGeometry.Lattice(type=cells[0].lat)
+            R_universe1 = RMCGeometry.Universe(number=out_universe_id, lattice=R_lattice, cells=R_cells[1:])
+            R_universe2 = RMCGeometry.Universe(number=out_universe_id * 1000 + 1, cells=R_cells[:1])
+            R_universes.append(R_universe2)
+            R_universes.append(R_universe1)
+        else:
+            R_universe = RMCGeometry.Universe(number=out_universe_id, cells=R_cells)
+            R_universes.append(R_universe)
 
     # 调整 universe 顺序
     R_universes = sorted(R_universes, key=lambda x: x.number)
@@ -112,3 +103,69 @@ def transfer(inp_MCNP):
         f.write(str(R_model))
 
     print('file: [' + inp_MCNP + '] have been processed!')
+
+
+def _transfer_one(inp_MCNP):
+    """
+    Transfer a single file, the messages printed and the exceptions are captured.
+    :param inp_MCNP: the name of the MCNP input file.
+    :return: dict of the file name, success, warnings, time cost and error message.
+    """
+    buffer = io.StringIO()
+    start = time.time()
+    error = None
+    try:
+        with contextlib.redirect_stdout(buffer):
+            transfer(inp_MCNP)
+    except Exception:
+        error = traceback.format_exc()
+    elapsed = time.time() - start
+
+    warnings = [line for line in buffer.getvalue().split('\n') if 'Warning' in line]
+    if error is None:
+        # the unparsed parts are listed as warnings in the parsed MCNP model file.
+        with open(inp_MCNP + '_parsed_MCNP_model', 'r') as f:
+            warnings.extend(line.rstrip('\n') for line in f
+                            if 'Warning' in line and not line.startswith('Warning: No parsed blocks'))
+    return {'file': inp_MCNP, 'success': error is None, 'warnings': warnings, 'time': elapsed, 'error': error}
+
+
+def batch_transfer(files, workers=None, report=None):
+    """
+    Transfer a batch of files in a process pool. A failed file does not stop the others.
+    :param files: list of the names of the MCNP input files.
+    :param workers: the number of processes, default to the number of CPUs. 1 for serial transfer.
+    :param report: the name of the file to write the summary report, None for not writing.
+    :return: list of the results of each file, see _transfer_one.
+    """
+    if workers == 1:
+        results = [_transfer_one(file) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_transfer_one, files))
+
+    summary = format_report(results)
+    print(summary)
+    if report is not None:
+        with open(report, 'w') as f:
+            f.write(summary)
+    return results
+
+
+def format_report(results):
+    width = max([len(result['file']) for result in results] + [4])
+    s = '%-*s  %-7s  %8s  %8s\n' % (width, 'file', 'status', 'warnings', 'time(s)')
+    for result in results:
+        s += '%-*s  %-7s  %8d  %8.3f\n' % (width, result['file'], 'success' if result['success'] else 'failed',
+                                          len(result['warnings']), result['time'])
+    n_failed = len([result for result in results if not result['success']])
+    s += '%d files processed, %d failed, %.3f s in total.\n' % (
+        len(results), n_failed, sum(result['time'] for result in results))
+
+    for result in results:
+        if result['warnings']:
+            s += '\nWarnings in file [' + result['file'] + ']:\n'
+            s += '\n'.join(result['warnings']) + '\n'
+        if not result['success']:
+            s += '\nError in file [' + result['file'] + ']:\n' + result['error']
+    return s
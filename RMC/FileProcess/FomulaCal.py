@@ -1,10 +1,126 @@
 import re
-import RMC.FileProcess.Base as FB
-from numpy import *
+import ast
+import builtins
+import functools
+import numpy
+
+# 公式中可以使用的函数，与原先的 from numpy import * 一致，numpy中没有的使用python内置函数
+FUNCTIONS = ['sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2', 'asin', 'acos', 'atan', 'atan2',
+             'sinh', 'cosh', 'tanh', 'arcsinh', 'arccosh', 'arctanh', 'hypot', 'degrees', 'radians',
+             'deg2rad', 'rad2deg', 'exp', 'exp2', 'expm1', 'log', 'log2', 'log10', 'log1p', 'sqrt', 'cbrt',
+             'square', 'power', 'pow', 'abs', 'absolute', 'fabs', 'sign', 'floor', 'ceil', 'trunc', 'rint',
+             'fix', 'round', 'around', 'mod', 'fmod', 'remainder', 'maximum', 'minimum', 'max', 'min',
+             'sum', 'prod', 'mean', 'int', 'float']
+# 公式中可以使用的常量
+CONSTANTS = ['pi', 'e', 'inf', 'nan']
+
+# 整数乘方结果的比特数上限，防止9**9**9这样的公式耗尽时间和内存
+MAX_POWER_BITS = 65536
+
+
+class _PowerTooLarge(Exception):
+    pass
+
+
+def _power(base, exponent):
+    """乘方运算，整数的结果过大时抛出_PowerTooLarge"""
+    if isinstance(base, int) and isinstance(exponent, int) and abs(base) > 1 and \
+            exponent * base.bit_length() > MAX_POWER_BITS:
+        raise _PowerTooLarge()
+    return base ** exponent
+
+
+_NAMESPACE = {name: getattr(numpy, name) if hasattr(numpy, name) else getattr(builtins, name)
+              for name in FUNCTIONS + CONSTANTS}
+if _NAMESPACE['pow'] is builtins.pow:
+    # 较早版本的numpy中没有pow，使用python内置的pow时同样限制结果的大小
+    _NAMESPACE['pow'] = _power
+# 公式中的乘方运算替换为调用_power，该名称不能出现在公式中
+_POWER = '__power'
+# 公式中允许出现的语法：数字、常量、函数调用以及算术运算
+_NODES = (ast.Expression, ast.Constant, ast.Name, ast.Load, ast.Call, ast.BinOp, ast.UnaryOp,
+          ast.Tuple, ast.List, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+          ast.UAdd, ast.USub)
+# 公式的方括号和换行符，公式不能跨行
+_BRACKETS = re.compile(r'[\[\]\n]')
+
+
+class _GuardPower(ast.NodeTransformer):
+    """把乘方运算a ** b替换为_power(a, b)"""
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            return ast.copy_location(ast.Call(func=ast.Name(id=_POWER, ctx=ast.Load()),
+                                              args=[node.left, node.right], keywords=[]), node)
+        return node
+
+
+@functools.lru_cache(maxsize=65536)
+def evaluate(formula):
+    """
+    计算一个公式，相同的公式只计算一次
+
+    :param formula: 方括号中的公式，不区分大小写
+    :return: 计算结果的字符串
+    """
+    expression = formula.lower()
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError:
+        raise ValueError('Formula [{}] can not be parsed.'.format(formula))
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ValueError('Formula [{}] contains unsupported syntax: {}'.format(formula, type(node).__name__))
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, complex)):
+            raise ValueError('Formula [{}] contains non-numeric constant: {!r}'.format(formula, node.value))
+        if isinstance(node, ast.Name) and node.id not in _NAMESPACE:
+            raise ValueError('Formula [{}] contains unknown name: {}'.format(formula, node.id))
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords):
+            raise ValueError('Formula [{}] contains unsupported function call.'.format(formula))
+    tree = ast.fix_missing_locations(_GuardPower().visit(tree))
+    code = compile(tree, '<formula>', 'eval')
+    namespace = dict(_NAMESPACE)
+    namespace[_POWER] = _power
+    try:
+        return str(eval(code, {'__builtins__': {}}, namespace))
+    except _PowerTooLarge:
+        raise ValueError('Formula [{}] contains too large power.'.format(formula))
+
+
+def calculate(content):
+    """
+    从左到右一次计算输入卡中所有方括号中的公式，嵌套的方括号先计算内层
+
+    :param content: 输入卡内容
+    :return: 公式替换为计算结果后的输入卡内容
+    """
+    pieces = []
+    opened = []  # 尚未配对的'['之后的内容在pieces中的起始位置
+    position = 0
+    for match in _BRACKETS.finditer(content):
+        pieces.append(content[position:match.start()])
+        position = match.end()
+        char = match.group()
+        if char == '[':
+            pieces.append(char)
+            opened.append(len(pieces))
+        elif char == ']' and opened:
+            start = opened.pop()
+            result = evaluate(''.join(pieces[start:]))
+            del pieces[start - 1:]
+            pieces.append(result)
+        else:
+            # 换行符，或者没有配对的']'，未配对的'['保持原样
+            pieces.append(char)
+            if char == '\n':
+                opened = []
+    pieces.append(content[position:])
+    return ''.join(pieces)
 
 
 class FomulaCal:
-    def __init__(self, inp):
+    def __init__(self, inp=None):
         self.file_name = inp
         self.content = ''
 
@@ -14,18 +130,23 @@ class FomulaCal:
         print(' performing Formula calculating...')
         '''
         公式计算思路：
-        循环查找[], 并调用python中的eval函数计算其中的内容
+        从左到右遍历一次方括号，遇到']'时计算与其配对的'['之间的公式（内层公式已经替换为计算结果），
+        公式经过语法检查后只能使用数字、FUNCTIONS中的函数和CONSTANTS中的常量
         '''
-        fomula_find = re.search(r'\[([^\n\[]*?)\]', self.content)
-        while fomula_find:
-            indexs = fomula_find.span()
-            self.content = FB.Base.replace_string(self.content, indexs, str(eval(fomula_find.group(1).lower())))
-            fomula_find = re.search(r'\[([^\n\[]*?)\]', self.content)
+        self.content = self.process(self.content)
 
         print(' Formula calculating finished')
 
         self._write_file()
 
+    @staticmethod
+    def process(content):
+        """
+        :param content: 输入卡内容
+        :return: 公式替换为计算结果后的输入卡内容
+        """
+        return calculate(content)
+
     def _read_in(self):
         with open(self.file_name, 'r') as f:
             self.content = f.read()
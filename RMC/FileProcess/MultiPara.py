@@ -2,16 +2,33 @@ import re
 import os
 import RMC.FileProcess.Base as FB
 import itertools
+import random
 import numpy as np
 import shutil
 
+# 方案的抽样方式：
+# 'product'：所有变量取值的全部组合；
+# 'random'：从全部组合中无放回地随机抽取若干个方案；
+# 'lhs'：拉丁超立方抽样，每个变量的取值在各个方案中尽量均匀分布
+SAMPLINGS = ['product', 'random', 'lhs']
+
+
+def _peak_memory():
+    """
+    :return: 当前进程的内存使用峰值（MB），不支持的平台上为None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
 
 class MultiPara:
     def __init__(self, filename):
         self.file_name = os.path.abspath(filename)
         self.content = ""
         self.paralist = []  # 变量表
-        self.devided = []  # 依据各变量的划分方案，生成输入卡列表
         self.prioritynum = 90  # 若未指定展开次序，则从90开始编号
         self.prioritylist = []  # 各变量的优先序列号列表
 
@@ -19,12 +36,30 @@ class MultiPara:
         with open(self.file_name, 'r') as f:
             self.content = f.read()
 
-    def _write_files(self):
-        for i in range(len(self.devided)):
-            with open('inp' + str(i + 1), 'w+') as f:
-                f.write(self.devided[i])
+    def devide(self, clean=True, sampling='product', samples=None, seed=None):
+        """
+        分析多重变量，并把各个方案的输入卡写入MultiParainps目录
+
+        :param clean: 是否清空已有的MultiParainps目录。为False时只替换其中的输入卡，
+            保留先前的计算结果，用于接续中断的多方案计算
+        :param sampling: 方案的抽样方式，见SAMPLINGS
+        :param samples: 'random'和'lhs'抽样的方案数
+        :param seed: 随机数种子
+        """
+        multi_state = self.analyse()
+        if multi_state.processed:
+            for _ in self.iter_cases(clean, sampling, samples, seed):
+                pass
+            os.chdir(os.path.dirname(self.file_name))
+            print("Multi-value variable analysing finished.\n")
+        return multi_state
 
-    def devide(self):
+    def analyse(self):
+        """
+        分析输入卡中的多重变量，构造多重变量表
+
+        :return: MultiState
+        """
         self._read_in()
         print('Analysing Multi-value variable ...')
         '''
@@ -167,47 +202,111 @@ class MultiPara:
             print('Multi-value variable exists, splitting input files...')
             self.prioritylist = sorted(self.prioritylist, key=lambda x: x[0], reverse=True)
 
-            _iterlist = []
-            for _prinum, _valuenum in self.prioritylist:
-                _iterlist.append(range(_valuenum))
-
-            planindexs = list(itertools.product(*_iterlist))
-            print('Total number of input files is' + str(len(planindexs)))  # 方案总数
-
-            totalplans = []
-            for indexs in planindexs:
-                plan = list(range(len(self.paralist)))
-                for i in range(len(indexs)):
-                    index = indexs[i]
-                    for j in range(len(self.paralist)):
-                        para = self.paralist[j]
-                        if para[2] == self.prioritylist[i][0]:
-                            plan[j] = para[0][index]
-                totalplans.append(plan)
-
-            for plan in totalplans:
-                i = len(self.paralist)
-                tempcontent = self.content
-                for paravalue in reversed(plan):
-                    tempcontent = FB.Base.replace_string(tempcontent, self.paralist[i - 1][1], paravalue)
-                    i = i - 1
-                self.devided.append(tempcontent)
-
-            if not os.path.exists(os.path.join(os.path.dirname(self.file_name), "MultiParainps")):
-                os.mkdir(os.path.dirname(self.file_name) + "/MultiParainps")
-            else:
-                shutil.rmtree(os.path.dirname(self.file_name) + "/MultiParainps")
-                os.mkdir(os.path.dirname(self.file_name) + "/MultiParainps")
-            os.chdir(os.path.dirname(self.file_name) + "/MultiParainps")
-            self._write_files()
-            os.chdir(os.path.dirname(self.file_name))
-            print("Multi-value variable analysing finished.\n")
+            print('Total number of input files is' + str(self.plan_number))  # 方案总数
             return MultiState(True)
 
         else:
             print('Multi-value variable does not exist. ')
             return MultiState(False)
 
+    @property
+    def plan_number(self):
+        """所有变量取值的组合数"""
+        number = 1
+        for _prinum, _valuenum in self.prioritylist:
+            number *= _valuenum
+        return number
+
+    def iter_plans(self, sampling='product', samples=None, seed=None):
+        """
+        逐个生成方案，不在内存中保存全部方案
+
+        :param sampling: 方案的抽样方式，见SAMPLINGS
+        :param samples: 'random'和'lhs'抽样的方案数
+        :param seed: 随机数种子
+        :return: 生成器，每次给出[方案序号, 各个多重变量的取值]。方案序号为在全部组合中的序号（从1开始），
+            因此同一方案在不同的抽样中序号相同
+        """
+        if sampling not in SAMPLINGS:
+            raise ValueError('Sampling {} is not supported, available samplings: {}'.format(sampling, SAMPLINGS))
+        sizes = [_valuenum for _prinum, _valuenum in self.prioritylist]
+        if sampling == 'product':
+            for number, indexs in enumerate(itertools.product(*[range(size) for size in sizes])):
+                yield [number + 1, self._plan(indexs)]
+            return
+
+        if samples is None:
+            raise ValueError('The number of samples is required for {} sampling'.format(sampling))
+        total = self.plan_number
+        if sampling == 'random':
+            # 在序号的range上抽样，不需要生成全部组合
+            numbers = sorted(random.Random(seed).sample(range(total), min(samples, total)))
+        else:
+            # 拉丁超立方：把每个变量的取值范围等分为samples层，每层恰好抽取一次，各变量的分层随机配对
+            rng = np.random.default_rng(seed)
+            levels = []
+            for size in sizes:
+                strata = (rng.permutation(samples) + rng.random(samples)) / samples
+                levels.append(np.minimum((strata * size).astype(int), size - 1))
+            numbers = sorted(set(int(number) for number in np.ravel_multi_index(levels, sizes)))
+        for number in numbers:
+            yield [number + 1, self._plan(np.unravel_index(number, sizes))]
+
+    def _plan(self, indexs):
+        """
+        :param indexs: 各个展开次序下的取值序号
+        :return: 各个多重变量的取值
+        """
+        # 各个多重变量所属的展开次序，同一次序的变量同步取值
+        priorities = [_prinum for _prinum, _valuenum in self.prioritylist]
+        return [para[0][indexs[priorities.index(para[2])]] for para in self.paralist]
+
+    def substitute(self, plan):
+        """
+        :param plan: 各个多重变量的取值
+        :return: 方案的输入卡
+        """
+        # 各个多重变量的替换区间依次排列、互不重叠，按顺序拼接即可
+        pieces = []
+        start = 0
+        for para, paravalue in zip(self.paralist, plan):
+            pieces.append(self.content[start:para[1][0]])
+            pieces.append(paravalue)
+            start = para[1][1]
+        pieces.append(self.content[start:])
+        return ''.join(pieces)
+
+    def iter_cases(self, clean=True, sampling='product', samples=None, seed=None):
+        """
+        逐个生成方案的输入卡MultiParainps/inpN，写入后再给出，可以边生成边计算
+
+        :param clean: 是否清空已有的MultiParainps目录，见devide
+        :param sampling: 方案的抽样方式，见SAMPLINGS
+        :param samples: 'random'和'lhs'抽样的方案数
+        :param seed: 随机数种子
+        :return: 生成器，每次给出一个方案输入卡的文件名
+        """
+        multi_dir = os.path.join(os.path.dirname(self.file_name), "MultiParainps")
+        if not os.path.exists(multi_dir):
+            os.mkdir(multi_dir)
+        elif clean:
+            shutil.rmtree(multi_dir)
+            os.mkdir(multi_dir)
+        else:
+            # 删除先前的输入卡，方案数目可能发生了变化
+            for filename in os.listdir(multi_dir):
+                if re.fullmatch(r'inp\d+', filename) and os.path.isfile(os.path.join(multi_dir, filename)):
+                    os.remove(os.path.join(multi_dir, filename))
+
+        for number, plan in self.iter_plans(sampling, samples, seed):
+            filename = os.path.join(multi_dir, 'inp' + str(number))
+            with open(filename, 'w+') as f:
+                f.write(self.substitute(plan))
+            memory = _peak_memory()
+            if memory is not None:
+                print(' Input file inp{} written, peak memory {:.1f} MB'.format(number, memory))
+            yield filename
+
     def _remove_nosense_brace(self):
         # 处理多余括号，例如{1,{2,3,4}}
         reg = r'{.*?,[^\*\n\{\},]*?{([^\*\n\{]*?)}.*?}'
@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+"""
+输入卡预处理的流水线
+
+各个处理步骤（常量替换、变量代换、公式计算）在内存中依次处理输入卡的内容，
+只读入一次原始输入卡、写出一次处理后的输入卡，并统计各步骤所用的时间。
+
+>>> from RMC.FileProcess.Pipeline import Pipeline
+>>> pipeline = Pipeline()
+>>> pipeline.process_file('inp', 'inp_cal')
+>>> print(pipeline.report())
+"""
+
+import os
+import time
+
+from RMC.FileProcess.ConstNum import ConstNum
+from RMC.FileProcess.VarNum import VarNum
+from RMC.FileProcess.FomulaCal import FomulaCal
+
+
+class Pipeline:
+    def __init__(self, stages=None, constants=None):
+        """
+        :param stages: 处理步骤的列表，每个步骤为带有process(content)方法的对象，
+            默认依次为ConstNum、VarNum、FomulaCal
+        :param constants: 附加的常量，仅用于默认的ConstNum步骤，见ConstNum
+        """
+        if stages is None:
+            stages = [ConstNum(constants=constants), VarNum(), FomulaCal()]
+        self.stages = stages
+        # {步骤名: [累计时间（秒）, 处理次数]}
+        self.timings = {self.stage_name(stage): [0.0, 0] for stage in stages}
+
+    @staticmethod
+    def stage_name(stage):
+        return type(stage).__name__
+
+    def stage(self, stage_type):
+        """
+        :param stage_type: 步骤的类型，例如VarNum
+        :return: 该类型的第一个步骤，没有时为None
+        """
+        for stage in self.stages:
+            if isinstance(stage, stage_type):
+                return stage
+        return None
+
+    def process(self, content):
+        """
+        :param content: 输入卡内容
+        :return: 依次经过各个步骤处理后的输入卡内容
+        """
+        for stage in self.stages:
+            start = time.perf_counter()
+            content = stage.process(content)
+            timing = self.timings.setdefault(self.stage_name(stage), [0.0, 0])
+            timing[0] += time.perf_counter() - start
+            timing[1] += 1
+        return content
+
+    def process_file(self, source, target=None):
+        """
+        :param source: 原始输入卡的文件名，或者可读的文件对象
+        :param target: 处理后输入卡的文件名，或者可写的文件对象；默认覆盖原始输入卡的文件
+        :return: 处理后的输入卡内容
+        """
+        if hasattr(source, 'read'):
+            if target is None:
+                raise ValueError('Target must be given when the source is a stream.')
+            content = source.read()
+        else:
+            with open(os.fspath(source), 'r') as f:
+                content = f.read()
+        if target is None:
+            target = source
+
+        content = self.process(content)
+
+        if hasattr(target, 'write'):
+            target.write(content)
+        else:
+            with open(os.fspath(target), 'w') as f:
+                f.write(content)
+        return content
+
+    def merge_timings(self, timings):
+        """
+        累加其他流水线（例如多方案计算中各个方案）的时间统计
+
+        :param timings: {步骤名: [累计时间（秒）, 处理次数]}
+        """
+        for name, [seconds, count] in timings.items():
+            timing = self.timings.setdefault(name, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += count
+
+    def report(self):
+        """
+        :return: 各步骤时间统计的文本
+        """
+        total = sum(seconds for seconds, count in self.timings.values())
+        lines = ['{:<12}{:>8}{:>12}{:>12}{:>8}'.format('Stage', 'Calls', 'Total(s)', 'Mean(ms)', '%')]
+        for name, [seconds, count] in self.timings.items():
+            lines.append('{:<12}{:>8d}{:>12.3f}{:>12.3f}{:>8.1f}'.format(
+                name, count, seconds, seconds / count * 1e3 if count else 0.0,
+                seconds / total * 100 if total > 0 else 0.0))
+        return '\n'.join(lines)
@@ -0,0 +1,196 @@
+# -*- coding:utf-8 -*-
+"""
+多方案并行计算的调度
+
+每个方案在独立的工作目录中、独立的进程中计算，同时运行的方案所占用的CPU核数不超过给定的总数。
+每个方案完成后会留下完成标记，中断后再次计算时跳过已经完成的方案。
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import hashlib
+import multiprocessing
+from multiprocessing.connection import wait
+
+# 超算平台上按整节点分配CPU
+HPC_PLATFORMS = ['tianhe', 'yinhe', 'bscc']
+# 只读的截面库和燃耗库文件，各方案的工作目录共享源目录中的这些文件
+LINKED_FILES = ['xsdir', 'DepthMainLib']
+
+
+def case_cores(n_mpi=None, n_threads=None, ctf_n_mpi=0, platform='linux', proc_per_node=None, **kwargs):
+    """
+    计算一个方案占用的CPU核数
+
+    :param n_mpi: RMC的MPI进程数
+    :param n_threads: RMC每个进程的OpenMP线程数
+    :param ctf_n_mpi: CTF的MPI进程数，CTF与RMC交替运行，取两者的最大值
+    :param platform: 计算平台，超算平台上按整节点占用
+    :param proc_per_node: 超算单节点的CPU数，默认与RMC.Job相同
+    :return: CPU核数
+    """
+    cores = (n_mpi or 1) * (n_threads or 1)
+    cores = max(cores, ctf_n_mpi or 0)
+    if platform in HPC_PLATFORMS:
+        if proc_per_node is None:
+            proc_per_node = {'bscc': 64, 'yinhe': 20}.get(platform, 24)
+        proc_per_node = int(proc_per_node)
+        cores = -(-cores // proc_per_node) * proc_per_node
+    return cores
+
+
+def file_hash(file_name):
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class Case:
+    """一个计算方案"""
+
+    def __init__(self, name, inp, work_dir, marker, target, args=(), cores=1, setup=None):
+        """
+        :param name: 方案名，例如inp1
+        :param inp: 方案的输入卡，用于判断完成标记是否对应于当前的输入
+        :param work_dir: 方案独立的工作目录
+        :param marker: 完成标记文件
+        :param target: 在子进程中执行的函数，工作目录为work_dir
+        :param args: target的参数
+        :param cores: 方案占用的CPU核数
+        :param setup: 启动方案之前在主进程中执行的函数，例如建立工作目录
+        """
+        self.name = name
+        self.inp = inp
+        self.work_dir = work_dir
+        self.marker = marker
+        self.target = target
+        self.args = args
+        self.cores = cores
+        self.setup = setup
+
+    def finished(self):
+        """
+        :return: 方案是否已经以当前的输入卡完成计算
+        """
+        try:
+            with open(self.marker) as f:
+                return json.load(f)['hash'] == file_hash(self.inp)
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def mark_finished(self, elapsed):
+        tmp_file = self.marker + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'hash': file_hash(self.inp), 'time': elapsed}, f)
+        os.replace(tmp_file, self.marker)
+
+
+def _run_case(case):
+    """在子进程中计算一个方案，输出写入工作目录下的case.log"""
+    os.chdir(case.work_dir)
+    log = open('case.log', 'a', buffering=1)
+    sys.stdout = log
+    sys.stderr = log
+    case.target(*case.args)
+    log.flush()
+
+
+class Scheduler:
+    def __init__(self, max_cores=None, poll_interval=1.0):
+        """
+        :param max_cores: 同时运行的方案所占用的CPU核数之和的上限，默认为本机的CPU数
+        :param poll_interval: 检查方案是否结束的时间间隔（秒）
+        """
+        self.max_cores = max_cores if max_cores is not None else (os.cpu_count() or 1)
+        self.poll_interval = poll_interval
+
+    def run(self, cases, resume=False):
+        """
+        按顺序启动各个方案，CPU核数不足时等待已经启动的方案结束。
+        单个方案占用的核数超过上限时，等其他方案都结束后单独运行。
+
+        :param cases: 方案的列表或者生成器，生成器只在有空闲的核时才取出下一个方案
+        :param resume: 是否跳过已经完成的方案
+        :return: {方案名: 结果}，结果为'finished'、'skipped'或者'failed'
+        """
+        results = {}
+        cases = iter(cases)
+        case = self._next_case(cases, resume, results)
+
+        running = {}  # {sentinel: [case, process, start time]}
+        used_cores = 0
+        while case is not None or running:
+            # 启动核数允许的方案
+            while case is not None and (not running or used_cores + case.cores <= self.max_cores):
+                if case.setup is not None:
+                    case.setup()
+                os.makedirs(case.work_dir, exist_ok=True)
+                print('Starting case {} with {} cores in {}'.format(case.name, case.cores, case.work_dir), flush=True)
+                process = multiprocessing.Process(target=_run_case, args=(case,), name=case.name)
+                process.start()
+                running[process.sentinel] = [case, process, time.time()]
+                used_cores += case.cores
+                case = self._next_case(cases, resume, results)
+
+            for sentinel in wait(list(running.keys()), timeout=self.poll_interval):
+                finished_case, process, start = running.pop(sentinel)
+                process.join()
+                used_cores -= finished_case.cores
+                elapsed = time.time() - start
+                if process.exitcode == 0:
+                    finished_case.mark_finished(elapsed)
+                    results[finished_case.name] = 'finished'
+                    print('Case {} finished in {:.1f}s'.format(finished_case.name, elapsed), flush=True)
+                else:
+                    results[finished_case.name] = 'failed'
+                    print('Case {} failed with exit code {}, see {}'.format(
+                        finished_case.name, process.exitcode,
+                        os.path.join(finished_case.work_dir, 'case.log')), flush=True)
+        return results
+
+    @staticmethod
+    def _next_case(cases, resume, results):
+        """
+        :return: 下一个需要计算的方案，没有时为None
+        """
+        for case in cases:
+            if resume and case.finished():
+                print('Skipping finished case ' + case.name)
+                results[case.name] = 'skipped'
+                continue
+            if os.path.exists(case.marker):
+                os.remove(case.marker)
+            return case
+        return None
+
+
+def prepare_work_dir(work_dir, source_dir, excludes=(), links=LINKED_FILES):
+    """
+    建立方案的工作目录，把源目录中的文件放到工作目录中。
+    只有只读的截面库、燃耗库等文件链接到工作目录中，不支持符号链接时复制；
+    其他文件（材料文件、接续文件等）会在计算中被改写，都复制到工作目录中，避免改写源目录和其他方案中的文件。
+
+    :param work_dir: 工作目录，已经存在时先删除
+    :param source_dir: 源目录，只处理其中的文件，不包括子目录
+    :param excludes: 不需要放到工作目录中的文件名
+    :param links: 链接到工作目录中的只读文件名
+    """
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+    for file in os.listdir(source_dir):
+        source = os.path.join(source_dir, file)
+        if file in excludes or not os.path.isfile(source):
+            continue
+        if file in links:
+            try:
+                os.symlink(os.path.abspath(source), os.path.join(work_dir, file))
+                continue
+            except OSError:
+                pass
+        shutil.copy(source, os.path.join(work_dir, file))
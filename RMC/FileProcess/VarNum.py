@@ -1,64 +1,114 @@
 import re
-import RMC.FileProcess.Base as FB
+
+# 变量名前后必须是非字母、数字、下划线的字符
+_WORD_CHARS = 'a-zA-Z0-9_'
+# 变量定义：@变量名 = 变量值，变量值到换行符、'@'或者'/'为止
+_DEFINITION = re.compile(r'@(?P<name>[^=\n]*)=[ ]*(?P<value>[^\n][^\n@/]*)')
 
 
 class VarNum:
-    def __init__(self, inp):
+    def __init__(self, inp=None):
         self.file_name = inp
         self.content = ''
+        # 按首次定义的顺序排列的变量名
         self.varlist = []
+        # 输入卡中实际使用的变量，{变量名: [使用的变量值]}，
+        # 使用的变量及其值都相同的方案，处理后的输入卡除变量定义行以外相同
+        self.used_variables = {}
 
     def repvar(self):
         self._read_in()
         print(' replacing variables...')
-        _startindex = 0  # _startindex为查找新定义变量时使用
         '''
         变量代换思路：
-        1. 从头开始查找一个变量定义
-        2. 找到一个变量定义后，查找其是否重复定义；若没有找到变量定义，则退出
-        3. 若重复定义，则将第一次定义到第二次定义之间的变量名用变量值代换，继续步骤2
-        4. 若无重复定义，则将第一次定义到文档末尾之间的变量名用变量值代换，继续步骤1
+        1. 找出所有的变量定义，由全部变量名组成一个正则表达式
+        2. 从头到尾遍历一次输入卡，依次遇到变量定义和变量名：
+           遇到变量定义时，先用当前的变量值代换定义中的变量名，再把该变量加入（或者覆盖）变量表；
+           遇到变量名时，用变量表中当前的值代换，尚未定义的变量不代换
+        因此重复定义的变量只影响其后的内容，重复定义中也可以使用该变量之前的值
         '''
-        _find_var = True
-        while _find_var:
-            var = re.search(r'@(.*?)=[ ]*(.+?)[\n@/]', self.content[_startindex:], re.M | re.I)
-            _find_var = var
-            if var is None:
-                break
-            varname = ''.join(list(filter(None, var.group(1).split())))
-            varvalue = ''.join(list(filter(None, var.group(2).split())))
-            varvalue = varvalue.replace(' ', '')
-            startindex = _startindex  # startindex为检查一个变量是否重复定义时使用
+        self.content = self.process(self.content)
+        print(' variable replacing finished.')
+        self._write_file()
 
-            if varname not in self.varlist:
-                self.varlist.append(varname)
-            else:
-                '''
-                已处理过的变量则跳过
-                '''
-                _startindex = var.span()[1] + _startindex
+    def process(self, content):
+        """
+        :param content: 输入卡内容
+        :return: 代换变量后的输入卡内容
+        """
+        self.varlist = []
+        self.used_variables = {}
+        for definition in _DEFINITION.finditer(content):
+            name = ''.join(definition.group('name').split())
+            if name and name not in self.varlist:
+                self.varlist.append(name)
+        if not self.varlist:
+            return content
+        names = sorted(self.varlist, key=len, reverse=True)
+        token = re.compile('(?P<definition>@[^=\n]*=[ ]*(?=[^\n]))|(?<=[^{0}])(?P<name>{1})(?=[^{0}])'.format(
+            _WORD_CHARS, '|'.join(re.escape(name) for name in names)))
+
+        scope = {}  # {变量名: [变量值, 变量值中使用的变量{变量名: 变量值}]}
+        pieces = []
+        position = 0
+        pending = None  # 正在读取变量值的定义：[变量名, 变量值的结束位置, 变量值在pieces中的起始位置, 使用的变量]
+
+        def define():
+            # 变量值已经代换完毕，加入变量表
+            nonlocal position, pending
+            name, end, start, used = pending
+            pieces.append(content[position:end])
+            position = end
+            scope[name] = [''.join(''.join(pieces[start:]).split()), used]
+            pending = None
+
+        for match in token.finditer(content):
+            if pending is not None and match.start() >= pending[1]:
+                define()
+            if match.group('definition') is not None:
+                definition = _DEFINITION.match(content, match.start())
+                name = ''.join(definition.group('name').split())
+                pieces.append(content[position:match.end()])
+                position = match.end()
+                if name:
+                    pending = [name, definition.end('value'), len(pieces), {}]
                 continue
 
-            while var:
-                varlater = re.search('@[^=\na-zA-Z0-9_]*?' + varname + '[^=\na-zA-Z0-9_]*?=',
-                                     self.content[var.span()[1] + startindex:], re.M | re.I)
-                if varlater:
-                    self.content = FB.Base.sub_string(self.content, [var.span()[1] + startindex,
-                                                                     varlater.span()[0] + var.span()[1] + startindex],
-                                                      varname, varvalue)
-                else:
-                    self.content = FB.Base.sub_string(self.content,
-                                                      [var.span()[1] + startindex, len(list(self.content))], varname,
-                                                      varvalue)
-                startindex = startindex + var.span()[1]
-                var = re.search('@[^=\na-zA-Z0-9_]*?' + varname + '[^=\na-zA-Z0-9_]*?=(.*?)[\n@/]', self.content[startindex:],
-                                re.M | re.I)
-                if var:
-                    varvalue = ''.join(list(filter(None, var.group(1).split())))
-                    varvalue = varvalue.replace(' ', '')
+            name = self._defined_name(match, scope)
+            if name is None:
+                continue
+            value, dependencies = scope[name]
+            pieces.append(content[position:match.start()])
+            pieces.append(value)
+            position = match.start() + len(name)
+            used = dict(dependencies)
+            used[name] = value
+            if pending is not None:
+                pending[3].update(used)
+            else:
+                for used_name, used_value in used.items():
+                    values = self.used_variables.setdefault(used_name, [])
+                    if used_value not in values:
+                        values.append(used_value)
+        if pending is not None:
+            define()
+        pieces.append(content[position:])
+        return ''.join(pieces)
 
-        print(' variable replacing finished.')
-        self._write_file()
+    @staticmethod
+    def _defined_name(match, scope):
+        """
+        :return: 该位置上已经定义的最长的变量名，没有时为None
+        """
+        name = match.group('name')
+        if name in scope:
+            return name
+        # 较长的变量名尚未定义时，该位置上可能是已经定义的较短的变量名
+        for shorter in sorted(scope.keys(), key=len, reverse=True):
+            if len(shorter) < len(name) and name.startswith(shorter) and \
+                    re.match('[^' + _WORD_CHARS + ']', name[len(shorter)]):
+                return shorter
+        return None
 
     def _read_in(self):
         with open(self.file_name, 'r') as f:
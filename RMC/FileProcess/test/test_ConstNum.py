@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+
+import os
+import re
+import time
+import random
+import shutil
+import tempfile
+
+import unittest
+from unittest import TestCase
+from RMC.FileProcess.ConstNum import ConstNum, ConstantTable, load_constants, default_table
+
+
+def random_deck(rng, names, length):
+    words = names + ['x', 'PIX', 'H1_', '1H1', 'var1', '3.0', '[PI*2]', 'U235', 'u235']
+    separators = [' ', '  ', '\n', '*', '/', '-', '(', ')', '[', ']', '=', ',', '+']
+    return ''.join(rng.choice(words) + rng.choice(separators) for _ in range(length))
+
+
+class TestConstNum(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_repconstnum(self):
+        for case in os.listdir(os.path.join('..', '..', 'testsuit')):
+            inp = os.path.join(self.work_dir, case)
+            shutil.copy(os.path.join('..', '..', 'testsuit', case, 'inp'), inp)
+            with open(inp) as f:
+                content = f.read()
+            ConstNum(inp).repconstnum()
+            with open(inp) as f:
+                result = f.read()
+            if case != '复杂输入卡':
+                # 其他输入卡中没有常量
+                self.assertEqual(result, content)
+                continue
+            for original, replaced in [
+                    ('+ROUND(PI)]', '+ROUND(3.141592653589793)]'),
+                    ('{1.64e-46,PI,2*  {NA,', '{1.64e-46,3.141592653589793,2*  {6.02214076e+23,'),
+                    ('{8, 10.0, -PI}#2', '{8, 10.0, -3.141592653589793}#2')]:
+                self.assertIn(original, content)
+                content = content.replace(original, replaced)
+            self.assertEqual(result, content)
+
+    def test_substitute(self):
+        cases = [
+            ('mat 1 -1.0 H1 2 O16 1\n', 'mat 1 -1.0 1.00782 2 15.994914 1\n'),
+            # 常量名前后是字母、数字、下划线时不替换，区分大小写
+            (' PIX H1_ 1H1 _U235 u235 Pu239\n', ' PIX H1_ 1H1 _U235 u235 239.0521636\n'),
+            # 输入卡开头和结尾的常量
+            ('PI', '3.141592653589793'),
+            ('NA*2\n', '6.02214076e+23*2\n'),
+            # 同一常量仅以一个字符分隔的相邻出现全部替换，原先逐个常量的替换只替换其中的前一个
+            (' PI*PI\n', ' 3.141592653589793*3.141592653589793\n'),
+            (' U235+U235\n', ' 235.0439301+235.0439301\n'),
+            (' PI PI PI\n', ' 3.141592653589793 3.141592653589793 3.141592653589793\n'),
+        ]
+        for content, expected in cases:
+            self.assertEqual(default_table.substitute(content), expected, repr(content))
+            self.assertEqual(ConstNum().process(content), expected, repr(content))
+
+    def test_fuzz(self):
+        rng = random.Random(0)
+        names = ['PI', 'NA', 'H1', 'U235', 'U238', 'Pu239', 'O16']
+        pattern = re.compile(r'(?<![a-zA-Z0-9_])(?:{})(?![a-zA-Z0-9_])'.format('|'.join(names)))
+        for _ in range(300):
+            content = random_deck(rng, names, rng.randint(1, 40))
+            result = default_table.substitute(content)
+            # 替换后不再有常量，其余的内容不变
+            self.assertIsNone(pattern.search(result), repr(content))
+            self.assertEqual(pattern.sub(lambda match: str(default_table.constants[match.group()]), content),
+                             result, repr(content))
+
+    def test_constants_file(self):
+        constants_file = os.path.join(self.work_dir, 'constants')
+        with open(constants_file, 'w') as f:
+            f.write('# user constants\nRHO_H2O 0.7  # 高温水密度\nPI 3.0\n')
+        self.assertEqual(load_constants(constants_file), {'RHO_H2O': 0.7, 'PI': 3.0})
+
+        inp = os.path.join(self.work_dir, 'inp')
+        with open(inp, 'w') as f:
+            f.write('mat 1 -RHO_H2O H1 2 O16 1 PI\n')
+        ConstNum(inp, constants=constants_file).repconstnum()
+        with open(inp) as f:
+            self.assertEqual(f.read(), 'mat 1 -0.7 1.00782 2 15.994914 1 3.0\n')
+        self.assertEqual(default_table.constants['PI'], 3.141592653589793)
+
+        with open(constants_file, 'a') as f:
+            f.write('BAD\n')
+        self.assertRaises(ValueError, load_constants, constants_file)
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_benchmark(self):
+        content = random_deck(random.Random(1), list(default_table.constants.keys()), 20000)
+        start = time.time()
+        result = default_table.substitute(content)
+        new_time = time.time() - start
+        self.assertNotIn(' PI ', result)
+        print('%d constants, %.1f kB deck: single pass %.4fs' %
+              (len(default_table.constants), len(content) / 1e3, new_time))
+        table = ConstantTable({})
+        self.assertEqual(table.substitute(content), content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+
+import os
+import math
+import time
+import random
+import shutil
+import tempfile
+
+import numpy
+import unittest
+from unittest import TestCase
+from RMC.FileProcess.ConstNum import ConstNum
+from RMC.FileProcess.VarNum import VarNum
+from RMC.FileProcess.FomulaCal import FomulaCal, calculate, evaluate
+
+def random_formula(rng, depth=0):
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice(['1', '2.5', '-3', '0.1', 'PI', '1e-3'])
+    choice = rng.random()
+    if choice < 0.5:
+        return '{} {} {}'.format(random_formula(rng, depth + 1), rng.choice(['+', '-', '*', '/', '**']),
+                                 random_formula(rng, depth + 1))
+    elif choice < 0.8:
+        return '{}({})'.format(rng.choice(['SIN', 'cos', 'EXP', 'abs', 'round', 'sqrt']),
+                               random_formula(rng, depth + 1))
+    return '[{}]'.format(random_formula(rng, depth + 1))
+
+
+class TestFomulaCal(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_calfomula(self):
+        for case in os.listdir(os.path.join('..', '..', 'testsuit')):
+            inp = os.path.join(self.work_dir, case)
+            shutil.copy(os.path.join('..', '..', 'testsuit', case, 'inp'), inp)
+            ConstNum(inp).repconstnum()
+            VarNum(inp).repvar()
+            reference = os.path.join('resources', case, 'reference_fomulacal')
+            if not os.path.exists(reference):
+                # 未经MultiPara处理的多值变量{...}不能计算
+                with open(inp) as f:
+                    self.assertRaises(ValueError, calculate, f.read())
+                continue
+            FomulaCal(inp).calfomula()
+            with open(inp) as f, open(reference) as reference:
+                self.assertEqual(f.read(), reference.read())
+
+    def test_calculate(self):
+        cases = [
+            ('[1 + 2]', '3'), ('[2 ** 3]', '8'), ('[1 / 4]', '0.25'), ('[-3 - 0.1]', '-3.1'), ('[1e-3 * 2]', '0.002'),
+            ('[SIN(0)]', '0.0'), ('[EXP(0)]', '1.0'), ('[sqrt(4)]', '2.0'), ('[abs(-3)]', '3'), ('[round(2.5)]', '2.0'),
+            ('[PI * 2]', '6.283185307179586'), ('[cos(PI)]', '-1.0'),
+            ('surf 1 cz [1] // [2 * [3]]\n[ 2\n', 'surf 1 cz 1 // 6\n[ 2\n'),
+        ]
+        for content, expected in cases:
+            self.assertEqual(calculate(content), expected, content)
+        self.assertRaises(ZeroDivisionError, calculate, '[1 / 0]')
+        self.assertRaises(OverflowError, calculate, '[10.0 ** 400]')
+        with numpy.errstate(all='ignore'):
+            self.assertEqual(calculate('[sqrt(-1)]'), 'nan')
+
+    def test_fuzz(self):
+        rng = random.Random(0)
+        with numpy.errstate(all='ignore'):
+            for _ in range(300):
+                content = 'surf 1 cz [{}] // [{}]\n[ 2\n'.format(random_formula(rng), random_formula(rng))
+                try:
+                    result = calculate(content)
+                except (ArithmeticError, ValueError):
+                    continue
+                # 所有的公式都被计算，只留下未闭合的方括号
+                self.assertRegex(result, r'^surf 1 cz [^\[\]]+ // [^\[\]]+\n\[ 2\n$', content)
+
+    def test_nested(self):
+        self.assertEqual(calculate('a [1 + [2 * [3]]] b] [c\n[POWER(2, 3)]\n'), 'a 7 b] [c\n8\n')
+
+    def test_unsafe(self):
+        for formula in ['__import__("os").system("ls")', 'numpy.pi', '(1).real', 'open("inp")',
+                        'lambda: 1', '"a" * 3', 'sin(x=1)', '[1 2]', 'x', '9**9**9', '9**9**7', '-(2**10)**7000']:
+            self.assertRaises(ValueError, evaluate, formula)
+        # 结果不太大的乘方照常计算
+        self.assertEqual(evaluate('2**10**2'), str(2 ** 100))
+        self.assertEqual(evaluate('9.0**-2 * 81'), '1.0')
+        self.assertEqual(evaluate('(-2)**3'), '-8')
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_benchmark(self):
+        rng = random.Random(1)
+        terms = [[rng.randint(1, 20), rng.choice(['PI', '2', '0.5']), rng.randint(1, 50)] for _ in range(5000)]
+        formulas = ['[{} * {} + SIN({})]'.format(*term) for term in terms]
+        content = '\n'.join('surf {} cz {}'.format(index, formula) for index, formula in enumerate(formulas)) + '\n'
+        evaluate.cache_clear()
+        start = time.time()
+        result = calculate(content)
+        new_time = time.time() - start
+        values = [float(line.split()[-1]) for line in result.splitlines()]
+        expected = [a * {'PI': math.pi, '2': 2, '0.5': 0.5}[b] + math.sin(c) for a, b, c in terms]
+        numpy.testing.assert_allclose(values, expected, rtol=1e-12)
+        info = evaluate.cache_info()
+        self.assertEqual(info.misses, len(set(formula.lower() for formula in formulas)))
+        print('%d formulas (%d distinct): single pass %.4fs' % (len(formulas), info.misses, new_time))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import tracemalloc
+import itertools
+
+import unittest
+from unittest import TestCase
+import numpy as np
+from RMC.FileProcess.MultiPara import MultiPara
+
+
+class TestMultiPara(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.inp = os.path.join(self.work_dir, 'inp')
+        shutil.copy(os.path.join('..', '..', 'testsuit', '循环变量定义', 'inp'), self.inp)
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.work_dir)
+
+    def test_iter_cases(self):
+        with open(self.inp) as f:
+            content = f.read()
+        multi_para = MultiPara(self.inp)
+        self.assertTrue(multi_para.analyse().processed)
+        self.assertEqual(multi_para.plan_number, 144)
+
+        case_files = multi_para.iter_cases()
+        first = next(case_files)
+        # 输入卡逐个生成，取出第一个方案时只写入了一个文件
+        self.assertEqual(os.listdir(os.path.dirname(first)), ['inp1'])
+        case_files = [first] + list(case_files)
+        self.assertEqual(len(case_files), 144)
+        for index, case_file in enumerate(case_files):
+            self.assertEqual(os.path.basename(case_file), 'inp%d' % (index + 1))
+
+        # 展开次序#90最外层，#2其次，#1的各变量同时取值
+        definitions = ['{10: 30: 5, 35} #1', '{15, 20: 40: 5} #1', '{2*51 , 2*{50 : + : 2 : 2}} #2',
+                       '{3*{-2,-4}}#1', '6*{-1} #1', '{2000, 3000, 4000}']
+        cases = {1: ['10.0', '15', '51', '-2', '-1', '2000'],
+                 2: ['15.0', '20.0', '51', '-4', '-1', '2000'],
+                 50: ['15.0', '20.0', '51', '-4', '-1', '3000'],
+                 144: ['35', '40.0', '54.0', '-4', '-1', '4000']}
+        for number, values in cases.items():
+            expected = content
+            for definition, value in zip(definitions, values):
+                self.assertIn(definition, expected)
+                expected = expected.replace(definition, value, 1)
+            with open(case_files[number - 1]) as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_sampling(self):
+        multi_para = MultiPara(self.inp)
+        multi_para.analyse()
+        product = dict((number, plan) for number, plan in multi_para.iter_plans())
+
+        plans = list(multi_para.iter_plans('random', samples=20, seed=1))
+        self.assertEqual(len(set(number for number, plan in plans)), 20)
+        for number, plan in plans:
+            self.assertEqual(plan, product[number])
+        self.assertEqual(plans, list(multi_para.iter_plans('random', samples=20, seed=1)))
+
+        # 拉丁超立方抽样：样本数等于某个展开次序的取值个数时，该次序的每个取值恰好出现一次
+        sizes = [_valuenum for _prinum, _valuenum in multi_para.prioritylist]
+        samples = min(sizes)
+        plans = list(multi_para.iter_plans('lhs', samples=samples, seed=2))
+        self.assertEqual(len(plans), samples)
+        dimension = sizes.index(samples)
+        levels = [np.unravel_index(number - 1, sizes)[dimension] for number, plan in plans]
+        self.assertEqual(sorted(levels), list(range(samples)))
+        for number, plan in plans:
+            self.assertEqual(plan, product[number])
+
+        self.assertRaises(ValueError, lambda: list(multi_para.iter_plans('sobol', samples=3)))
+        self.assertRaises(ValueError, lambda: list(multi_para.iter_plans('random')))
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_lazy_benchmark(self):
+        """5个变量、各20个取值的320万个方案，逐个生成时内存不随方案数增长"""
+        with open(self.inp, 'w') as f:
+            f.write('SURFACE\n')
+            for index in range(5):
+                f.write('surf %d CZ {%s}\n' % (index + 1, ', '.join(str(value) for value in range(1, 21))))
+        multi_para = MultiPara(self.inp)
+        multi_para.analyse()
+        self.assertEqual(multi_para.plan_number, 20 ** 5)
+
+        tracemalloc.start()
+        start = time.time()
+        plans = multi_para.iter_plans()
+        for number, plan in itertools.islice(plans, 100000):
+            multi_para.substitute(plan)
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        start = time.time()
+        plans = list(multi_para.iter_plans('random', samples=100, seed=0))
+        sample_time = time.time() - start
+        tracemalloc.stop()
+        print('100000 cases: %.2fs, peak memory %.2f MB; 100 random samples of 3.2M cases: %.4fs' %
+              (elapsed, peak / 1e6, sample_time))
+        self.assertLess(peak, 1e6)
+        self.assertEqual(len(plans), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+
+import io
+import os
+import json
+import shutil
+import tempfile
+
+import unittest
+from unittest import TestCase, mock
+from RMC.FileProcess.ConstNum import ConstNum
+from RMC.FileProcess.VarNum import VarNum
+from RMC.FileProcess.FomulaCal import FomulaCal
+from RMC.FileProcess.Pipeline import Pipeline
+from RMC.run_fileprocess import JobFileProc, VARIABLES_FILE, TIMINGS_FILE
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_process_file(self):
+        for case in ['变量重复定义']:
+            source = os.path.join('..', '..', 'testsuit', case, 'inp')
+            # 原先逐个步骤读写文件的处理结果
+            inp = os.path.join(self.work_dir, case)
+            shutil.copy(source, inp)
+            ConstNum(inp).repconstnum()
+            VarNum(inp).repvar()
+            FomulaCal(inp).calfomula()
+            with open(inp) as f:
+                reference = f.read()
+
+            target = os.path.join(self.work_dir, case + '_cal')
+            pipeline = Pipeline()
+            self.assertEqual(pipeline.process_file(source, target), reference)
+            with open(target) as f:
+                self.assertEqual(f.read(), reference)
+
+            output = io.StringIO()
+            with open(source) as f:
+                pipeline.process_file(f, output)
+            self.assertEqual(output.getvalue(), reference)
+            self.assertEqual([count for seconds, count in pipeline.timings.values()], [2, 2, 2])
+            self.assertEqual(list(pipeline.timings.keys()), ['ConstNum', 'VarNum', 'FomulaCal'])
+
+        self.assertRaises(ValueError, Pipeline().process_file, io.StringIO(''))
+
+    def test_stages(self):
+        var_num = VarNum()
+        pipeline = Pipeline([ConstNum(constants={'R': 0.5}), var_num, FomulaCal()])
+        content = pipeline.process('@d = [R * 2]\n@h = 3\nsurf 1 cz [d / 2]\n')
+        self.assertEqual(content, '@d = 1.0\n@h = 3\nsurf 1 cz 0.5\n')
+        self.assertIs(pipeline.stage(VarNum), var_num)
+        self.assertEqual(var_num.used_variables, {'d': ['[0.5*2]']})
+
+        pipeline.merge_timings({'VarNum': [1.0, 3], 'Other': [2.0, 1]})
+        self.assertEqual(pipeline.timings['VarNum'][1], 4)
+        report = pipeline.report().splitlines()
+        self.assertEqual(len(report), 5)
+        self.assertTrue(report[4].startswith('Other'))
+
+    def test_sweep(self):
+        inp = os.path.join(self.work_dir, 'sweep')
+        with open(inp, 'w') as f:
+            f.write('@r = {1, 2}\n@h = {3, 4}\nsurf 1 cz [r * 2]\n')
+        JobFileProc(inp=inp, run=False, max_cores=2).run()
+        multi_dir = os.path.join(self.work_dir, 'MultiParainps')
+        for index in range(1, 5):
+            work_dir = os.path.join(multi_dir, 'inp%d-work' % index)
+            with open(os.path.join(work_dir, 'inp%d' % index)) as f:
+                self.assertIn('surf 1 cz ', f.read())
+            with open(os.path.join(work_dir, VARIABLES_FILE)) as f:
+                self.assertEqual(list(json.load(f).keys()), ['r'])
+            with open(os.path.join(work_dir, TIMINGS_FILE)) as f:
+                self.assertEqual(list(json.load(f).keys()), ['ConstNum', 'VarNum', 'FomulaCal'])
+
+    def test_case_cores(self):
+        inp = os.path.join(self.work_dir, 'sweep')
+        with open(inp, 'w') as f:
+            f.write('@r = {1, 2}\nsurf 1 cz [r * 2]\n')
+        cases = []
+
+        def run(run_cases, resume):
+            cases.extend(run_cases)
+            return {}
+
+        with mock.patch('RMC.run_fileprocess.Scheduler.run', side_effect=run):
+            JobFileProc(inp=inp, n_mpi=2, n_threads=3, max_cores=12).run()
+        # 换料的进程数不超过方案占用的核数
+        self.assertEqual([case.cores for case in cases], [6, 6])
+        self.assertEqual([case.args[2]['refuel_processes'] for case in cases], [6, 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding:utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+
+import unittest
+from unittest import TestCase
+from functools import partial
+from RMC.FileProcess.Scheduler import Scheduler, Case, case_cores, prepare_work_dir, file_hash
+from RMC.controller.rmc import RMCController
+from RMC.controller.test.test_campaign import fake_run
+
+CAMPAIGN_INP = os.path.join(os.path.dirname(__file__), '..', '..', 'controller', 'test', 'resources', 'campaign', 'inp')
+
+
+def sleep_case(duration, fail=False):
+    """记录开始和结束时间，用于检查同时运行的方案"""
+    start = time.time()
+    time.sleep(duration)
+    with open('times', 'w') as f:
+        f.write('%f %f' % (start, time.time()))
+    if fail:
+        raise RuntimeError('case failed')
+
+
+def burnup_case(steps):
+    """计算到第1燃耗步，复制上个燃耗步的材料文件和核素信息文件，并像RMC一样原地改写工作目录中的文件"""
+    controller = RMCController('inp', 'archive')
+    propt = {'inp': 'inp'}
+    for _ in range(steps):
+        controller.continuing(None, propt)
+        fake_run(controller)
+    for file in os.listdir('.'):
+        if os.path.isfile(file) and file not in ['xsdir', 'DepthMainLib']:
+            with open(file, 'a') as f:
+                f.write('changed by the case')
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def make_cases(self, cores, fail=None):
+        cases = []
+        for index, core in enumerate(cores):
+            name = 'inp%d' % (index + 1)
+            inp = os.path.join(self.work_dir, name)
+            with open(inp, 'w') as f:
+                f.write('case %d' % index)
+            cases.append(Case(name, inp, os.path.join(self.work_dir, name + '-work'),
+                              os.path.join(self.work_dir, name + '.done'), sleep_case,
+                              (0.5, name == fail), core))
+        return cases
+
+    def read_times(self, case):
+        with open(os.path.join(case.work_dir, 'times')) as f:
+            return [float(value) for value in f.read().split()]
+
+    def test_case_cores(self):
+        self.assertEqual(case_cores(), 1)
+        self.assertEqual(case_cores(n_mpi=4, n_threads=2), 8)
+        self.assertEqual(case_cores(n_mpi=2, ctf_n_mpi=6), 6)
+        self.assertEqual(case_cores(n_mpi=30, platform='tianhe'), 48)
+        self.assertEqual(case_cores(n_mpi=30, platform='bscc', proc_per_node='16'), 32)
+
+    def test_core_budget(self):
+        cases = self.make_cases([2, 2, 2, 4])
+        start = time.time()
+        results = Scheduler(max_cores=4, poll_interval=0.05).run(cases)
+        elapsed = time.time() - start
+        self.assertEqual(set(results.values()), {'finished'})
+        times = [self.read_times(case) for case in cases]
+        # 在任意时刻，同时运行的方案的核数之和不超过4
+        for moment, _ in times:
+            used = sum(case.cores for case, (begin, end) in zip(cases, times) if begin <= moment < end)
+            self.assertLessEqual(used, 4)
+        # 前两个方案同时运行
+        self.assertLess(abs(times[0][0] - times[1][0]), 0.4)
+        self.assertLess(elapsed, 0.5 * 4)
+
+    def test_resume(self):
+        cases = self.make_cases([1, 1, 1], fail='inp2')
+        results = Scheduler(max_cores=3, poll_interval=0.05).run(cases)
+        self.assertEqual(results, {'inp1': 'finished', 'inp2': 'failed', 'inp3': 'finished'})
+        self.assertIn('case failed', open(os.path.join(cases[1].work_dir, 'case.log')).read())
+
+        # 接续计算时只重新计算失败的方案，以及输入卡改变了的方案
+        cases = self.make_cases([1, 1, 1])
+        with open(cases[2].inp, 'a') as f:
+            f.write(' changed')
+        results = Scheduler(max_cores=3, poll_interval=0.05).run(cases, resume=True)
+        self.assertEqual(results, {'inp1': 'skipped', 'inp2': 'finished', 'inp3': 'finished'})
+
+    def test_work_dir(self):
+        source_dir = os.path.join(self.work_dir, 'source')
+        os.makedirs(source_dir)
+        shutil.copy(CAMPAIGN_INP, os.path.join(source_dir, 'inp'))
+        for file in ['xsdir', 'DepthMainLib', 'material', 'inp.burnup.1.couple.1.State.h5']:
+            with open(os.path.join(source_dir, file), 'w') as f:
+                f.write('original ' + file)
+        hashes = {file: file_hash(os.path.join(source_dir, file)) for file in os.listdir(source_dir)}
+
+        cases = []
+        for name in ['inp1', 'inp2']:
+            work_dir = os.path.join(self.work_dir, name + '-work')
+            cases.append(Case(name, os.path.join(source_dir, 'inp'), work_dir,
+                              os.path.join(self.work_dir, name + '.done'), burnup_case, (7,),
+                              setup=partial(prepare_work_dir, work_dir, source_dir)))
+        results = Scheduler(max_cores=2, poll_interval=0.05).run(cases)
+        self.assertEqual(results, {'inp1': 'finished', 'inp2': 'finished'})
+
+        # 只有只读的库文件是链接，源目录中的文件没有被改写
+        for case in cases:
+            self.assertTrue(os.path.islink(os.path.join(case.work_dir, 'xsdir')))
+            self.assertFalse(os.path.islink(os.path.join(case.work_dir, 'material')))
+            with open(os.path.join(case.work_dir, 'inp.burnup.1.couple.1.State.h5')) as f:
+                self.assertIn('state of inp.burnup.0.couple.6', f.read())
+        self.assertEqual(sorted(os.listdir(source_dir)), sorted(hashes))
+        for file, file_hash_value in hashes.items():
+            self.assertEqual(file_hash(os.path.join(source_dir, file)), file_hash_value)
+
+
+if __name__ == '__main__':
+    unittest.main()
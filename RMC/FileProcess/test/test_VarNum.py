@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+
+import os
+import time
+import random
+import shutil
+import tempfile
+
+import unittest
+from unittest import TestCase
+from RMC.FileProcess.ConstNum import ConstNum
+from RMC.FileProcess.VarNum import VarNum
+
+
+def random_deck(rng, names, lines):
+    """变量值中只使用首次定义更早的其他变量，同一行中的词以两个字符分隔"""
+    defined = []
+    content = []
+    for _ in range(lines):
+        if rng.random() < 0.3:
+            name = rng.choice(names)
+            others = defined[:defined.index(name)] if name in defined else list(defined)
+            words = [str(rng.randint(-50, 50))] + rng.sample(others, min(len(others), rng.randint(0, 2)))
+            content.append('@{} = [ {} ]  //comment {}'.format(name, ' + '.join(words), rng.choice(names)))
+            if name not in defined:
+                defined.append(name)
+        else:
+            words = ['surf', str(rng.randint(1, 100)), 'cz'] + \
+                    [rng.choice(names + ['x', 'var', '1.5', 'var1_b']) for _ in range(rng.randint(1, 6))]
+            content.append('  '.join(words))
+    return '\n'.join(content) + '\n'
+
+
+class TestVarNum(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_repvar(self):
+        for case in os.listdir(os.path.join('..', '..', 'testsuit')):
+            inp = os.path.join(self.work_dir, case)
+            shutil.copy(os.path.join('..', '..', 'testsuit', case, 'inp'), inp)
+            ConstNum(inp).repconstnum()
+            VarNum(inp).repvar()
+            with open(inp) as f, open(os.path.join('resources', case, 'reference_varnum')) as reference:
+                self.assertEqual(f.read(), reference.read())
+
+    def test_process(self):
+        cases = [
+            ('@a = 2\nsurf 1 cz a*a a\n', '@a = 2\nsurf 1 cz 2*2 2\n'),
+            # 定义之后下一行开头的变量名
+            ('@a = 2\na b\n', '@a = 2\n2 b\n'),
+            # 变量名前后是字母、数字、下划线时不代换
+            ('@var1 = 3\nvar10 var1_b _var1 var1\n', '@var1 = 3\nvar10 var1_b _var1 3\n'),
+            # 注释中的变量名同样代换
+            ('@a = 2  //comment a\nsurf 1 cz a  // a\n', '@a = 2  //comment 2\nsurf 1 cz 2  // 2\n'),
+            ('@repeat-2 = 5\nsurf 1 cz repeat-2\n', '@repeat-2 = 5\nsurf 1 cz 5\n'),
+            ('a\n@a = 1@b = 2\na b\n', 'a\n@a = 1@b = 2\n1 2\n'),
+            ('@a = 2\n@b = [a + 1]\n@a = [b * a]\nb a\n',
+             '@a = 2\n@b = [2 + 1]\n@a = [[2+1] * 2]\n[2+1] [[2+1]*2]\n'),
+        ]
+        for content, expected in cases:
+            self.assertEqual(VarNum().process(content), expected, repr(content))
+
+    def test_shadowing(self):
+        content = 'x var1\n@var1 = 1\ncell var1  var1\n@var1 = [var1 + 1]\ncell var1\n@var2 = [var1*2]\nvar1 var2\n'
+        var_num = VarNum()
+        # 重复定义中使用该变量之前的值，定义之前的变量名不代换
+        self.assertEqual(var_num.process(content),
+                         'x var1\n@var1 = 1\ncell 1  1\n@var1 = [1 + 1]\ncell [1+1]\n@var2 = [[1+1]*2]\n'
+                         '[1+1] [[1+1]*2]\n')
+        self.assertEqual(var_num.varlist, ['var1', 'var2'])
+        self.assertEqual(var_num.used_variables, {'var1': ['1', '[1+1]'], 'var2': ['[[1+1]*2]']})
+
+    def test_used_variables(self):
+        inp = os.path.join(self.work_dir, 'inp')
+        with open(inp, 'w') as f:
+            f.write('@r = 0.4\n@h = 2\n@unused = 3\n@d = [r * 2]\nsurf 1 cz d\n')
+        var_num = VarNum(inp)
+        var_num.repvar()
+        self.assertEqual(var_num.used_variables, {'d': ['[0.4*2]'], 'r': ['0.4']})
+        with open(inp) as f:
+            self.assertEqual(f.read(), '@r = 0.4\n@h = 2\n@unused = 3\n@d = [0.4 * 2]\nsurf 1 cz [0.4*2]\n')
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_benchmark(self):
+        names = ['var%d' % index for index in range(100)]
+        content = random_deck(random.Random(1), names, 3000)
+        start = time.time()
+        result = VarNum().process(content)
+        new_time = time.time() - start
+        # 代换后只有定义之前使用的变量名保留
+        defined = set()
+        for line in result.splitlines():
+            if line.startswith('@'):
+                defined.add(line[1:].split()[0])
+            else:
+                self.assertFalse(set(line.split()) & defined, line)
+        print('%.1f kB deck: single pass %.4fs' % (len(content) / 1e3, new_time))
+
+if __name__ == '__main__':
+    unittest.main()
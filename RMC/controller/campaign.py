@@ -0,0 +1,293 @@
+# -*- coding:utf-8 -*-
+"""
+燃耗、耦合计算的步骤图
+
+一次完整的计算由一系列步骤组成，每个步骤是一次RMC计算（耦合计算中RMC之前还有一次CTF计算）。
+下一个步骤只取决于当前的状态（燃耗步、耦合迭代次数、上个燃耗步的输入卡和存档目录）以及耦合迭代是否收敛，
+因此可以在计算之前列出全部步骤（不考虑提前收敛），也可以从检查点文件恢复状态，接续中断的计算。
+"""
+
+import os
+import json
+
+# 步骤中调用的计算
+CTF = 'ctf'  # CTF热工计算，耦合计算中在RMC之前运行
+TRANSPORT = 'transport'  # RMC输运计算
+DEPLETION = 'depletion'  # RMC点燃耗计算
+
+# 检查点文件，位于存档目录中
+CHECKPOINT_FILE = 'checkpoint.json'
+
+
+class State:
+    """步骤之间的状态"""
+
+    def __init__(self, burnup_step=0, iteration=1, last_inp=None, last_archive=None):
+        """
+        :param burnup_step: 当前的燃耗步
+        :param iteration: 当前的耦合迭代次数，无耦合时为1
+        :param last_inp: 上个燃耗步的输入卡
+        :param last_archive: 上个燃耗步的存档目录
+        """
+        self.burnup_step = burnup_step
+        self.iteration = iteration
+        self.last_inp = last_inp
+        self.last_archive = last_archive
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class Step:
+    """一次RMC计算，及其使用和生成的文件"""
+
+    def __init__(self, inp, archive_dir, burnup_step=None, iteration=None, ctf=False, depletion=False,
+                 coupling=False, source=None, copies=(), consumes=(), produces=()):
+        """
+        :param inp: 本步骤的输入卡
+        :param archive_dir: 本步骤的存档目录
+        :param burnup_step: 燃耗步，无燃耗时为None
+        :param iteration: 耦合迭代次数，无耦合时为None
+        :param ctf: 是否在RMC之前进行CTF计算
+        :param depletion: 是否进行点燃耗计算
+        :param coupling: 是否为燃耗步中的耦合迭代，此时输入卡中去掉临界搜索、燃耗等选项卡
+        :param source: 解析后生成本步骤输入卡的文件，None表示使用控制器中的模型
+        :param copies: 计算之前需要复制到工作目录中的文件，[[源文件, 目标文件]]
+        :param consumes: 本步骤使用的上一步骤的文件
+        :param produces: 本步骤生成的文件
+        """
+        self.inp = inp
+        self.archive_dir = archive_dir
+        self.burnup_step = burnup_step
+        self.iteration = iteration
+        self.ctf = ctf
+        self.depletion = depletion
+        self.coupling = coupling
+        self.source = source
+        self.copies = [list(copy) for copy in copies]
+        self.consumes = list(consumes)
+        self.produces = list(produces)
+
+    @property
+    def invocations(self):
+        """
+        :return: 本步骤中依次调用的计算
+        """
+        invocations = [CTF] if self.ctf else []
+        invocations.append(TRANSPORT)
+        if self.depletion:
+            invocations.append(DEPLETION)
+        return invocations
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class StepGraph:
+    """燃耗步 × 耦合迭代的步骤图"""
+
+    def __init__(self, inp, archive, burnup_steps=None, max_iteration=None):
+        """
+        :param inp: 原始输入卡
+        :param archive: 存档的根目录
+        :param burnup_steps: 燃耗步数，无燃耗时为None
+        :param max_iteration: 每个燃耗步的最大耦合迭代次数，无耦合时为None
+        """
+        self.inp = inp
+        self.archive = archive
+        self.burnup_steps = burnup_steps
+        self.max_iteration = max_iteration
+
+    @property
+    def burnup(self):
+        return self.burnup_steps is not None
+
+    @property
+    def couple(self):
+        return self.max_iteration is not None
+
+    def names(self, state):
+        """
+        :return: [输入卡, 存档目录]
+        """
+        inp = self.inp
+        archive = self.archive
+        if self.burnup:
+            inp += '.burnup.' + str(state.burnup_step)
+            archive = os.path.join(archive, 'burnup' + str(state.burnup_step))
+        if self.couple:
+            inp += '.couple.' + str(state.iteration)
+            archive = os.path.join(archive, 'couple' + str(state.iteration))
+        return [inp, archive]
+
+    def next(self, state, converged=False):
+        """
+        :param state: 当前的状态
+        :param converged: 耦合迭代是否已经收敛
+        :return: [下一个步骤, 该步骤之后的状态]，计算已经结束时步骤为None
+        """
+        inp, archive = self.names(state)
+        s, i = state.burnup_step, state.iteration
+        # 耦合计算中CTF与RMC通过工作目录中的网格计数器结果交换功率
+        tally = os.path.join(os.path.dirname(self.inp), 'MeshTally1.h5')
+
+        if not self.burnup:
+            if not self.couple:
+                # 无燃耗、无耦合的RMC计算，只需要算一次，直接使用原始输入卡
+                if i != 1:
+                    return [None, state]
+                return [Step(self.inp, archive, consumes=[self.inp], produces=[archive]),
+                        State(s, i + 1, state.last_inp, state.last_archive)]
+            # 无燃耗，有耦合的RMC计算，需要迭代到耦合结束或者收敛
+            if i > self.max_iteration or converged:
+                return [None, state]
+            return [Step(inp, archive, iteration=i, ctf=True, consumes=[tally], produces=[archive, tally]),
+                    State(s, i + 1, state.last_inp, state.last_archive)]
+
+        # 燃耗步都执行完成后，就结束计算
+        if s > self.burnup_steps:
+            return [None, state]
+
+        copies = []
+        if s == 0:
+            # 解析初始输入卡
+            source = self.inp
+        else:
+            # 解析上个燃耗步生成的接续输入卡
+            last_name = os.path.basename(state.last_inp)
+            source = os.path.join(state.last_archive, last_name + '.FMTinp.step1')
+            if s < self.burnup_steps:
+                # 当不是最后一个燃耗步时（最后一个燃耗步不做点燃耗计算），需要上个燃耗步的点燃耗核素信息
+                copies.append([os.path.join(state.last_archive, last_name + '.State.h5'), inp + '.State.h5'])
+
+        # 耦合迭代中不进行临界搜索和点燃耗计算；迭代结束或者收敛后，进行燃耗计算
+        coupling = self.couple and i <= self.max_iteration and not converged
+        depletion = not coupling and s < self.burnup_steps
+        consumes = [source] + [src for src, dst in copies]
+        produces = [archive]
+        if self.couple:
+            consumes.append(tally)
+            produces.append(tally)
+        if depletion:
+            name = os.path.basename(inp)
+            produces += [os.path.join(archive, name + '.FMTinp.step1'), os.path.join(archive, name + '.State.h5')]
+        step = Step(inp, archive, s, i if self.couple else None, self.couple, depletion, coupling, source,
+                    copies, consumes, produces)
+
+        if coupling:
+            return [step, State(s, i + 1, state.last_inp, state.last_archive)]
+        # 推进燃耗步，记录当前燃耗步所用的输入卡和存储位置信息，下个燃耗步会用得到
+        return [step, State(s + 1, 1, inp, archive)]
+
+    def plan(self, state):
+        """
+        :param state: 当前的状态
+        :return: 从当前状态开始的全部步骤（假定耦合迭代不提前收敛）
+        """
+        steps = []
+        step, state = self.next(state)
+        while step is not None:
+            steps.append(step)
+            step, state = self.next(state)
+        return steps
+
+
+def format_plan(steps, workspace=None):
+    """
+    :param steps: 步骤的列表
+    :param workspace: 工作目录，输入卡和存档目录显示为相对于该目录的路径
+    :return: 步骤列表的文本
+    """
+    def relative(path):
+        return os.path.relpath(path, workspace) if workspace is not None else path
+
+    lines = ['{:>5} {:>7} {:>10}  {:<26} {:<30} {}'.format(
+        'Step', 'Burnup', 'Iteration', 'Invocations', 'Input', 'Archive')]
+    for index, step in enumerate(steps):
+        lines.append('{:>5d} {:>7} {:>10}  {:<26} {:<30} {}'.format(
+            index + 1, '-' if step.burnup_step is None else step.burnup_step,
+            '-' if step.iteration is None else step.iteration, ', '.join(step.invocations),
+            relative(step.inp), relative(step.archive_dir)))
+    counts = {invocation: sum(invocation in step.invocations for step in steps)
+              for invocation in [CTF, TRANSPORT, DEPLETION]}
+    lines.append('Total: {} steps, {} CTF, {} transport and {} depletion calculations'.format(
+        len(steps), counts[CTF], counts[TRANSPORT], counts[DEPLETION]))
+    return '\n'.join(lines)
+
+
+class Checkpoint:
+    """
+    检查点文件，记录已经完成的步骤、正在计算的步骤及其前后的状态，以及已经复制的文件
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.completed = []  # 已经完成的步骤的存档目录
+        self.state = None  # 正在计算的步骤之前的状态
+        self.step = None  # 正在计算的步骤
+        self.next_state = None  # 正在计算的步骤之后的状态
+        self.copies = {}  # {目标文件: [源文件的签名, 目标文件的签名]}
+
+    def load(self):
+        """
+        :return: 是否读入了检查点文件
+        """
+        try:
+            with open(self.file_name) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.completed = data['completed']
+        self.state = State.from_dict(data['state']) if data['state'] is not None else None
+        self.step = Step.from_dict(data['step']) if data['step'] is not None else None
+        self.next_state = State.from_dict(data['next_state']) if data['next_state'] is not None else None
+        self.copies = data['copies']
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+        data = {
+            'completed': self.completed,
+            'state': self.state.to_dict() if self.state is not None else None,
+            'step': self.step.to_dict() if self.step is not None else None,
+            'next_state': self.next_state.to_dict() if self.next_state is not None else None,
+            'copies': self.copies,
+        }
+        tmp_file = self.file_name + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_file, self.file_name)
+
+    def resume_state(self):
+        """
+        正在计算的步骤的存档目录已经生成时，该步骤已经完成，从其后的状态继续；否则重新计算该步骤。
+        全部步骤都已经完成时，返回结束时的状态。
+
+        :return: 接续计算的状态，没有记录时为None
+        """
+        if self.step is None:
+            return self.state
+        if os.path.isdir(self.step.archive_dir):
+            if self.step.archive_dir not in self.completed:
+                self.completed.append(self.step.archive_dir)
+            return self.next_state
+        return self.state
+
+
+def signature(file_name):
+    """
+    :return: 用于判断文件是否改变的签名 [修改时间, 大小]，文件不存在时为None
+    """
+    try:
+        info = os.stat(file_name)
+    except OSError:
+        return None
+    return [info.st_mtime_ns, info.st_size]
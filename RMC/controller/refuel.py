@@ -9,12 +9,30 @@ import os
 import re
 import numpy as np
 import warnings
+import multiprocessing
+from collections import OrderedDict
+
+
+def _remap_files(tasks):
+    """在子进程中依次处理同一个材料文件的换料任务"""
+    for task in tasks:
+        Refuel._remap_file(*task)
 
 
 class Refuel:
-    def __init__(self, refuel_inp):
+    # 材料文件以内存映射的方式打开，每次读写的行数，材料文件不会整个读入内存
+    chunk_rows = 1048576
+
+    def __init__(self, refuel_inp, processes=None):
+        """
+        :param refuel_inp: the refuelling yaml input.
+        :param processes: number of the processes to reshuffle the material files in parallel,
+            the number of CPUs by default. The cases run in parallel by RMC.run_fileprocess give
+            the number of the cores allotted to them.
+        """
         self.base_dir = ""
         self.refuel_inp = refuel_inp
+        self.processes = processes if processes is not None else (os.cpu_count() or 1)
         self.plan = {}
         self._get_refuel_model()
 
@@ -38,18 +56,20 @@ class Refuel:
 
         plan = self.plan[step]
         cur_model = PlainParser(inp).parsed
+        tasks = []
         for univ_plan in plan:
             univ_id = univ_plan.universe
             univ = cur_model.geometry.get_univ(univ_id)
             mat_list = self._get_related_mat_file_list(univ=univ)
             exchange_strategy = Refuel._extract_strategy(alias=univ_plan.alias, mapping=univ_plan.mapping)
-            Refuel._do_refuel(univ_plan.position, univ, mat_list, exchange_strategy, cur_model, base_model)
+            tasks += Refuel._plan_refuel(univ_plan.position, univ, mat_list, exchange_strategy, cur_model, base_model)
+        Refuel._run_tasks(tasks, self.processes)
         if output is not None:
             output_file = output
         else:
             output_file = inp + '.refuel_%d.inp' % step
         with open(output_file, 'w') as f:
-            f.write(str(cur_model))
+            cur_model.write_to(f)
 
         del(self.plan[step])
         return output_file
@@ -100,102 +120,242 @@ class Refuel:
                 for cell in universe:
                     if cell.fill is not None:
                         univ_stack.append(cell.include)
-                    elif cell.material < 0:
-                        mat_list[cell.number] = -cell.material
+                    elif int(cell.material) < 0:
+                        mat_list[cell.number] = -int(cell.material)
 
         return {cell: os.path.join(self.base_dir, 'mat_{}.npy'.format(mat_list[cell])) for cell in mat_list}
 
     @staticmethod
     def _do_refuel(pos, univ, mat_list, strategy, cur_model, base_model):
+        for task in Refuel._plan_refuel(pos, univ, mat_list, strategy, cur_model, base_model):
+            Refuel._remap_file(*task)
+
+    @staticmethod
+    def _plan_refuel(pos, univ, mat_list, strategy, cur_model, base_model):
+        """
+        Change the filling of the refuelling universe, and plan the reshuffle of the material files.
+
+        :return: list of the tasks, the arguments of Refuel._remap_file for each material file.
+            The tasks only hold the lattice positions and the material entries, not the geometry.
+        """
+        remap, new_assemblies = Refuel._compile_strategy(strategy, np.size(univ.lattice.fill))
         initial = univ.lattice.fill.copy()
-        new_assemblies = {}
         for idx in strategy:
             if strategy[idx] >= 0:
                 univ.lattice.fill[idx] = initial[strategy[idx]]
             else:
                 univ.lattice.fill[idx] = -strategy[idx]
-                new_assemblies[idx] = -strategy[idx]
+        cur_model.geometry.invalidate_counts()
         """
         The expanding method in RMC is DFS, thus those cells belonging to the refuelling universe will be
         neighbors, so only the starting and ending index is needed.
         Also, DFS defines the sorting metric.
         """
+        pos = np.array(pos)
+        univ_depth = len(pos) + 1  # the idx in the mat_row of the No. inside the lattice.
+        # the cells filled with the refuelling universe
+        filling = [number for number, cell in cur_model.geometry.cell_dict.items() if cell.include == univ]
+        tasks = []
         for cell_id in mat_list:
             mat_file = mat_list[cell_id]
-            mat = np.load(mat_file)
-            shape = mat.shape
-            """
-            0. Find the indexes that will be treated, start and end.
-            1. Change the index to move assembly.
-            2. Delete some indexes of assemblies that are moved out.
-            3. Add material entries for new assemblies.
-            4. Sort the cells to fulfill the requirement of RMC lattice material input.
-            """
-            pos = np.array(pos)
-            rev_strategy = Refuel._reverse_strategy(strategy)
-
-            start = -1
-            end = -1
-            pattern = None
-            idx = 0
-            while idx <= len(mat):
-                if idx == len(mat):
-                    if start >= 0:
-                        end = idx
-                    else:
-                        break
-                else:
-                    cell_mat = mat[idx, :]
-                    [is_match, pattern] = Refuel._check_pattern_match([pattern, pos], cell_mat, univ,
-                                                                      model=cur_model)
-                    if start < 0:
-                        if is_match:
-                            start = idx
-                        idx += 1
-                        continue
-                    else:
-                        if is_match:
-                            idx += 1
-                            continue
-                        else:
-                            end = idx
-                            pattern = None
-
-                aim_cells = mat[start:end, :].copy()
-                mat = np.delete(mat, range(start, end), axis=0)
-                univ_depth = len(pos) + 1  # the idx in the mat_row of the No. inside the lattice.
-                to_be_deleted = []
-
-                for aim_idx in range(len(aim_cells)):
-                    cell = aim_cells[aim_idx]
-                    if cell[univ_depth] - 1 in rev_strategy:
-                        cell[univ_depth] = rev_strategy[cell[univ_depth] - 1] + 1
-                    else:
-                        to_be_deleted.append(aim_idx)
-
-                modified_cells = list(np.delete(aim_cells, to_be_deleted, axis=0))
-
-                # Add material entries for new assemblies.
-                # todo: refactor needed.
-                for assem_pos in new_assemblies:
-                    univ_id = new_assemblies[assem_pos]
-                    new_univ = cur_model.geometry.get_univ(univ_id)
-                    initial_mat = base_model.geometry.get_cell(cell_id).material
-                    count = new_univ.count_cell(cell_id)
-                    if count > 0:
-                        mats = np.zeros((count, shape[1]), dtype=int)
-                        mats[:, 0] = -initial_mat
-                        mats[:, univ_depth] = assem_pos + 1
-                        modified_cells.extend(list(mats))
-
-                sorted_cells = sorted(modified_cells, key=lambda array: (array[univ_depth]))
-                if end - start != len(sorted_cells):
-                    warnings.warn("Number of cells removed and inserted does not match!")
-                    idx = start + len(sorted_cells)
-
-                mat = np.insert(mat, start, np.array(sorted_cells), axis=0)
-                start = -1
-            np.save(mat_file, mat)
+            n_column = np.load(mat_file, mmap_mode='r').shape[1]
+            # Material entries of the new assemblies, inserted into each block of the refuelling universe.
+            initial_mat = int(base_model.geometry.get_cell(cell_id).material)
+            new_cells = []
+            for assem_pos in new_assemblies:
+                count = cur_model.geometry.count_cell(new_assemblies[assem_pos], cell_id)
+                if count > 0:
+                    mats = np.zeros(n_column, dtype=np.int64)
+                    mats[0] = -initial_mat
+                    mats[univ_depth] = assem_pos + 1
+                    new_cells.append([mats, count])
+            tasks.append([mat_file, pos, filling, remap, new_cells])
+        return tasks
+
+    @staticmethod
+    def _run_tasks(tasks, processes=1):
+        """
+        Run the tasks of reshuffling the material files, the files are reshuffled in parallel,
+        and the tasks of the same file are run in order.
+
+        :param tasks: see Refuel._plan_refuel.
+        :param processes: number of the processes.
+        """
+        files = OrderedDict()
+        for task in tasks:
+            files.setdefault(task[0], []).append(task)
+        if processes <= 1 or len(files) <= 1:
+            for file_tasks in files.values():
+                _remap_files(file_tasks)
+            return
+        with multiprocessing.Pool(min(processes, len(files))) as pool:
+            pool.map(_remap_files, files.values(), chunksize=1)
+
+    @staticmethod
+    def _compile_strategy(strategy, size):
+        """
+        Compile the exchange strategy into a lookup table of the lattice positions.
+
+        :param strategy: {position: position the assembly comes from, or -universe of a new assembly}.
+        :param size: number of the positions in the lattice.
+        :return: [remap, new_assemblies], remap[i] is the new position of the assembly at position i,
+            -1 for the assemblies moved out; new_assemblies is {position: universe of the new assembly}.
+        """
+        rev_strategy = Refuel._reverse_strategy(strategy)
+        remap = np.full(size, -1, dtype=np.int64)
+        remap[list(rev_strategy.keys())] = list(rev_strategy.values())
+        new_assemblies = {idx: -strategy[idx] for idx in strategy if strategy[idx] < 0}
+        return [remap, new_assemblies]
+
+    @staticmethod
+    def _remap_file(mat_file, pos, filling, remap, new_cells):
+        """
+        Move the material entries of the refuelling universe to their new lattice positions.
+
+        The material file is memory-mapped and read in chunks of Refuel.chunk_rows rows, the new entries
+        are written to a temporary file chunk by chunk, which then replaces the material file.
+
+        :param mat_file: the material file of a burnable cell, one row for each instance of the cell.
+        :param pos: the path to the refuelling universe, 0 matches any position.
+        :param filling: numbers of the cells filled with the refuelling universe.
+        :param remap: see Refuel._compile_strategy.
+        :param new_cells: material entries of the new assemblies, inserted into each block,
+            [entry, number of the entries] for each new assembly.
+        """
+        mat = np.load(mat_file, mmap_mode='r')
+        pieces = Refuel._plan_pieces(mat, pos, filling, remap, new_cells)
+        if pieces is None:
+            return
+
+        univ_depth = len(pos) + 1
+        n_rows = int(sum(piece[1] - piece[0] if piece[0] is not None else piece[1] for piece in pieces))
+        tmp_file = mat_file + '.tmp.npy'
+        if n_rows == 0:
+            np.save(tmp_file, np.zeros((0, mat.shape[1]), dtype=mat.dtype))
+        else:
+            output = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=mat.dtype, shape=(n_rows, mat.shape[1]))
+            offset = 0
+            for piece in pieces:
+                if piece[0] is None:
+                    output[offset:offset + piece[1]] = piece[2]
+                    offset += piece[1]
+                    continue
+                start, end, index = piece
+                for chunk in range(start, end, Refuel.chunk_rows):
+                    rows = min(end - chunk, Refuel.chunk_rows)
+                    output[offset:offset + rows] = mat[chunk:chunk + rows]
+                    if index is not None:
+                        output[offset:offset + rows, univ_depth] = index
+                    offset += rows
+            output.flush()
+            del output
+        del mat
+        os.replace(tmp_file, mat_file)
+
+    @staticmethod
+    def _plan_pieces(mat, pos, filling, remap, new_cells):
+        """
+        Plan the new material entries as pieces of the old entries and the new ones.
+
+        The entries of the refuelling universe lie in blocks of neighboring rows, one block for each
+        instance of the universe (the same path to the universe, mat[:, 1:len(pos) + 1]), and the rows
+        of the same lattice position are neighbors in a block. In each block, the entries of the
+        assemblies moved out are deleted, the entries of the new assemblies are appended, and the
+        entries are sorted by the lattice position, so the rows of a lattice position are moved together.
+
+        :return: list of the pieces, (start, end, new lattice position + 1 or None) for the rows
+            start:end of mat, or (None, number of the entries, entry) for the new entries;
+            None if the universe is not found.
+        """
+        length = len(pos)
+        univ_depth = length + 1
+
+        # 0. Find the runs of rows of the same block and the same lattice position, chunk by chunk.
+        run_starts = []
+        run_in_univ = []
+        run_block = []
+        run_index = []
+        last_row = None
+        last_in_univ = False
+        for chunk in range(0, len(mat), Refuel.chunk_rows):
+            rows = np.array(mat[chunk:chunk + Refuel.chunk_rows])
+            prefix = rows[:, 1:length + 1]
+            in_univ = np.all((pos <= 0) | (prefix == pos), axis=1) & np.isin(prefix[:, -1], filling)
+
+            previous = np.empty_like(rows)
+            previous[1:] = rows[:-1]
+            previous_in_univ = np.empty_like(in_univ)
+            previous_in_univ[1:] = in_univ[:-1]
+            if last_row is not None:
+                previous[0] = last_row
+            previous_in_univ[0] = last_in_univ
+            block = in_univ & (~previous_in_univ | np.any(prefix != previous[:, 1:length + 1], axis=1))
+            new_run = block | (in_univ != previous_in_univ) | \
+                (in_univ & (rows[:, univ_depth] != previous[:, univ_depth]))
+            if last_row is None:
+                new_run[0] = True
+
+            idx = np.nonzero(new_run)[0]
+            run_starts.append(idx + chunk)
+            run_in_univ.append(in_univ[idx])
+            run_block.append(block[idx])
+            run_index.append(rows[idx, univ_depth].astype(np.int64) - 1)
+            last_row = rows[-1].copy()
+            last_in_univ = in_univ[-1]
+
+        if not run_starts:
+            return None
+        starts = np.concatenate(run_starts)
+        in_univ = np.concatenate(run_in_univ)
+        block = np.concatenate(run_block)
+        lattice_idx = np.concatenate(run_index)
+        if not np.any(in_univ):
+            return None
+        ends = np.append(starts[1:], len(mat))
+        lengths = ends - starts
+
+        # Every run outside the blocks is a segment by itself, a block is a segment.
+        segment = np.cumsum(block | ~in_univ) - 1
+        block_segments = segment[block]
+
+        # 1. Change the index to move assembly, and delete the assemblies that are moved out.
+        valid = in_univ & (lattice_idx >= 0) & (lattice_idx < len(remap))
+        target = np.full(len(starts), -1, dtype=np.int64)
+        target[valid] = remap[lattice_idx[valid]]
+        keep = ~in_univ | (target >= 0)
+
+        n_segments = segment[-1] + 1
+        removed = np.bincount(segment[in_univ], weights=lengths[in_univ], minlength=n_segments)
+        kept = np.bincount(segment[in_univ & keep], weights=lengths[in_univ & keep], minlength=n_segments)
+        n_new = sum(count for cells, count in new_cells)
+        if np.any(kept[block_segments] + n_new != removed[block_segments]):
+            warnings.warn("Number of cells removed and inserted does not match!")
+
+        # 2. Add material entries for new assemblies into each block.
+        kept_runs = np.nonzero(keep)[0]
+        new_keys = np.array([cells[univ_depth] for cells, count in new_cells], dtype=np.int64)
+        piece_segment = np.concatenate([segment[kept_runs], np.repeat(block_segments, len(new_cells))])
+        piece_key = np.concatenate([np.where(in_univ[kept_runs], target[kept_runs] + 1, 0),
+                                    np.tile(new_keys, len(block_segments))])
+
+        # 3. Sort the cells to fulfill the requirement of RMC lattice material input.
+        # The sort is stable, the kept entries are ahead of the new ones in the same position.
+        order = np.lexsort((np.arange(len(piece_key)), piece_key, piece_segment))
+        pieces = []
+        for piece in order:
+            if piece >= len(kept_runs):
+                cells, count = new_cells[(piece - len(kept_runs)) % len(new_cells)]
+                pieces.append((None, count, cells))
+                continue
+            run = kept_runs[piece]
+            index = target[run] + 1 if in_univ[run] and target[run] != lattice_idx[run] else None
+            if index is None and pieces and pieces[-1][0] is not None and \
+                    pieces[-1][2] is None and pieces[-1][1] == starts[run]:
+                # 合并相邻的不需要修改的行，一起复制
+                pieces[-1] = (pieces[-1][0], ends[run], None)
+            else:
+                pieces.append((starts[run], ends[run], index))
+        return pieces
 
     @staticmethod
     def _reverse_strategy(strategy):
@@ -206,24 +366,3 @@ class Refuel:
                     raise ValueError('Refuelling matrix error, duplicate assemblies.')
                 rev_strategy[strategy[key]] = key
         return rev_strategy
-
-    @staticmethod
-    def _check_pattern_match(pattern, cell_vec, univ, model):
-        length = len(pattern[1])
-        if pattern[0] is not None:
-            is_match = np.all(pattern[0] == cell_vec[1:length + 1])
-            return [is_match, pattern[0]]
-        else:
-            is_match = True
-            for i in range(length):
-                if pattern[1][i] > 0 and pattern[1][i] != cell_vec[i + 1]:
-                    is_match = False
-                    break
-            if is_match:
-                cell = model.geometry.get_cell(cell_vec[length])
-                if cell.include == univ:
-                    return [True, np.array(cell_vec[1:length + 1])]
-                else:
-                    return [False, None]
-            else:
-                return [False, None]
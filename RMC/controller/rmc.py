@@ -5,8 +5,10 @@
 from RMC.controller.controller import Controller
 from RMC.parser.PlainParser import PlainParser
 from RMC.controller.refuel import Refuel
-from RMC.parser.YMLParser import YMLParser
+from RMC.parser.StatusParser import StatusParser
 
+from RMC.controller.campaign import State, StepGraph, Checkpoint, CHECKPOINT_FILE, format_plan, signature
+from RMC.model.input.base import Model
 from RMC.model.input.Include import IncludeMaterial
 
 import os
@@ -23,13 +25,36 @@ class RMCController(Controller):
             self.couple = couple
             self.pcqs = pcqs
 
-    def __init__(self, inp, archive):
+    def __init__(self, inp, archive, power_shape='sine', resume=False, dry_run=False, refuel_processes=None):
+        """
+        :param inp: the RMC input file.
+        :param archive: the directory to archive the outputs.
+        :param power_shape: the power shape generated as the first guess of coupling calculations,
+            see RMC.util.CoupleUtils.POWER_SHAPES.
+        :param resume: whether to resume an interrupted calculation from the checkpoint in archive.
+        :param dry_run: only plan the calculation, the input file and the archive are not modified.
+        :param refuel_processes: number of the processes to reshuffle the material files when refuelling,
+            the number of CPUs by default, see RMC.controller.refuel.Refuel.
+        """
         self.inp = inp
-        self.model = PlainParser(inp).parsed
-        self.update_inp()
+        self.power_shape = power_shape
+        self.archive = archive
+        self.dry_run = dry_run
+
+        # 检查点记录每个步骤前后的状态，用于接续中断的计算
+        self.checkpoint = Checkpoint(os.path.join(self.archive, CHECKPOINT_FILE))
+        resuming = resume and self.checkpoint.load()
+        if resuming and os.path.exists(self.inp + '.bak'):
+            # 输入卡已经被中断的计算改写（去掉了耦合选项等），使用其备份
+            self.model = PlainParser(self.inp + '.bak').parsed
+            if not dry_run:
+                self.update_inp(backup=False)
+        else:
+            self.model = PlainParser(inp).parsed
+            if not dry_run:
+                self.update_inp()
 
         self.iteration = 1
-        self.archive = archive
 
         self.last_archive = self.archive
         self.last_inp = self.inp
@@ -46,20 +71,65 @@ class RMCController(Controller):
         if self.model['refuelling'] is not None:
             refuel_mode = True
             self.refuel = Refuel(os.path.join(os.path.dirname(self.inp),
-                                              self.model['refuelling'].file))
+                                              self.model['refuelling'].file),
+                                 processes=refuel_processes)
         else:
             self.refuel = None
 
+        # 耦合迭代的松弛与收敛判断
+        self.relaxation = None
         if self.model['criticality'] is not None:
             if self.model['criticality'].couple_option:
                 couple_mode = True
+                self.relaxation = self.model['criticality'].couple_relaxation()
 
         self.options = RMCController.Options(burnup=burnup_mode,
                                              refuel=refuel_mode,
                                              couple=couple_mode,
                                              pcqs=pcqs_mode)
 
-        # todo 增加接续计算功能
+        # 燃耗步 × 耦合迭代的步骤图
+        self.graph = StepGraph(
+            self.inp, self.archive,
+            burnup_steps=self.model['burnup'].step_number if burnup_mode else None,
+            max_iteration=self.model['criticality'].max_iteration if couple_mode else None)
+        # 解析过的输入卡，{文件名: [文件签名, 模型]}，文件未改变时不再重复解析
+        self._parsed = {}
+        # 状态文件的解析器，{文件名: StatusParser}
+        self._status = {}
+
+        if resuming:
+            state = self.checkpoint.resume_state()
+            if state is not None:
+                self.state = state
+                print('Resuming from burnup step {}, coupling iteration {}\n'.format(
+                    state.burnup_step, state.iteration), flush=True)
+
+    @property
+    def state(self):
+        """当前的状态：燃耗步、耦合迭代次数、上个燃耗步的输入卡和存档目录"""
+        burnup_step = self.model['burnup'].current_step if self.options.burnup else 0
+        return State(burnup_step, self.iteration, self.last_inp, self.last_archive)
+
+    @state.setter
+    def state(self, state):
+        if self.options.burnup:
+            self.model['burnup'].current_step = state.burnup_step
+        self.iteration = state.iteration
+        self.last_inp = state.last_inp
+        self.last_archive = state.last_archive
+
+    def plan(self):
+        """
+        :return: 从当前状态开始，假定耦合迭代不提前收敛时的全部计算步骤
+        """
+        return self.graph.plan(self.state)
+
+    def format_plan(self):
+        """
+        :return: 全部计算步骤的文本，列出每个步骤中的CTF、输运和点燃耗计算
+        """
+        return format_plan(self.plan(), os.path.dirname(self.inp))
 
     def check(self, status_file):
         """
@@ -67,16 +137,14 @@ class RMCController(Controller):
         :param status_file: The path to the status file printed by RMC.
         :return:
         """
-        status = YMLParser(status_file).parsed['RMC']
-        step = 0
-        for cycle_entry in status[:-1]:
-            cycle = cycle_entry['cycle']
-            step += len(cycle) - 1
-
-        last_cycle = status[-1]['cycle']
-        if 'output' in last_cycle[-1]:
-            step += len(last_cycle) - 1
-            inp = last_cycle[-1]['output']
+        # 状态文件随着燃耗步增长，只解析新增加的部分
+        if status_file not in self._status:
+            self._status[status_file] = StatusParser(status_file)
+        status = self._status[status_file].update()
+
+        if status.output is not None:
+            step = status.step
+            inp = status.output
         else:
             raise NotImplementedError('Burnup restart feature currently '
                                       'not supported in Python Package.')
@@ -90,22 +158,11 @@ class RMCController(Controller):
         return [True]
 
     def new_inp_archive(self):
-        new_inp = self.inp
-        new_archive = self.archive
-
-        if self.options.burnup:
-            new_inp += '.burnup.' + str(self.model['burnup'].current_step)
-            new_archive = os.path.join(
-                new_archive, 'burnup' + str(self.model['burnup'].current_step))
-
-        if self.options.couple:
-            new_inp += '.couple.' + str(self.iteration)
-            new_archive = os.path.join(
-                new_archive, 'couple' + str(self.iteration))
-
-        return [new_inp, new_archive]
+        return self.graph.names(self.state)
 
     def continuing(self, status_file, propt):
+        if self.dry_run:
+            raise RuntimeError('The calculation can not be continued by the controller of a dry run.')
 
         if self.options.couple:
             if self.iteration == 1:
@@ -113,8 +170,8 @@ class RMCController(Controller):
                         self.model['burnup'].current_step == 0:
                     # 在耦合计算刚刚开始时，为热工程序生成初始的正弦功率分布
                     # RMC要求用于耦合计算的网格计数器在计数器选项卡中的编号必须是1
-                    print('Generating sine shaped power distribution for CTF'
-                          'as first guess of the results\n', flush=True)
+                    print('Generating {} shaped power distribution for CTF '
+                          'as first guess of the results\n'.format(self.power_shape), flush=True)
                     # 在第一次计算之前，先清理先前的计算可能残留的文件
                     meshtally = os.path.join(os.path.dirname(propt['inp']),
                                              'MeshTally*')
@@ -123,174 +180,156 @@ class RMCController(Controller):
                         os.remove(trash)
                     # 生成功率
                     self.generate_tally_hdf(self.model['tally'].meshtally[0],
-                                            os.path.dirname(propt['inp']))
+                                            os.path.dirname(propt['inp']),
+                                            self.power_shape)
+                else:
+                    # 新的燃耗步重新开始耦合迭代，松弛不再使用上一个燃耗步的迭代次数、松弛因子和残差
+                    from RMC.util.CoupleUtils import reset_relaxation
+                    reset_relaxation(os.path.join(os.path.dirname(propt['inp']), 'MeshTally1.h5'))
 
-        propt['inp'], propt['archive_dir'] = self.new_inp_archive()
+        converged = False
+        if self.options.couple:
+            propt['relaxation'] = self.relaxation
+            if self.iteration > 1:
+                converged = self.couple_converged(os.path.dirname(propt['inp']))
+
+        # 上一个步骤已经完成
+        if self.checkpoint.step is not None and self.checkpoint.step.archive_dir not in self.checkpoint.completed:
+            self.checkpoint.completed.append(self.checkpoint.step.archive_dir)
+
+        state = self.state
+        step, next_state = self.graph.next(state, converged)
+        if step is None:
+            self.checkpoint.state = state
+            self.checkpoint.step = None
+            self.checkpoint.next_state = None
+            self.checkpoint.save()
+            return False
+
+        propt['inp'], propt['archive_dir'] = step.inp, step.archive_dir
+        self.prepare(step)
+        self.state = next_state
+
+        self.checkpoint.state = state
+        self.checkpoint.step = step
+        self.checkpoint.next_state = next_state
+        self.checkpoint.save()
+        return True
+
+    def prepare(self, step):
+        """
+        生成一个步骤的输入卡，并复制该步骤需要的上一个燃耗步的文件
 
+        :param step: RMC.controller.campaign.Step
+        """
         if not self.options.burnup:
-            if not self.options.couple:
-                # 无燃耗、无耦合的RMC计算，只需要算一次，不需要改输入卡
-                if self.iteration == 1:
-                    self.iteration += 1
-                    return True
-                else:
-                    return False
-            else:
-                # 无燃耗，有耦合的RMC计算，需要迭代到耦合结束
-                if self.iteration <= self.model['criticality'].max_iteration:
-                    with open(propt['inp'], 'w') as f:
-                        f.write(str(self.model))
-                    self.iteration += 1
-                    return True
-                else:
-                    return False
-        else:
-            # 燃耗步都执行完成后，就结束计算
-            if self.model['burnup'].current_step > \
-                    self.model['burnup'].step_number:
-                return False
-
-            # 解析输入卡
-            if self.model['burnup'].current_step == 0:
-                # 解析初始输入卡
-                cur_model = PlainParser(self.inp).parsed
-                if os.path.exists(propt['inp'] + '.State.h5'):
-                    os.remove(propt['inp'] + '.State.h5')
-            else:
-                # 解析上个燃耗步生成的接续输入卡
-                last_fmt_inp = os.path.join(
-                    self.last_archive,
-                    os.path.basename(self.last_inp) + '.FMTinp.step1'
-                )
-                cur_model = PlainParser(last_fmt_inp).parsed
-
-            # 复制接续文件
-            if self.model['burnup'].current_step > 0:
-                # 当不是初始燃耗步时，把上个燃耗步生成的material文件copy过来
-                shutil.copy(
-                    os.path.join(self.last_archive,
-                                 cur_model['includematerial'].material),
-                    os.path.dirname(self.inp)
-                )
-                if self.model['burnup'].current_step < \
-                        self.model['burnup'].step_number:
-                    # 当不是最后一个燃耗步时（最后一个燃耗步不做点燃耗计算），
-                    # 把上个燃耗步生成的包含点燃耗核素信息的文件copy过来
-                    last_state = os.path.join(
-                        self.last_archive,
-                        os.path.basename(self.last_inp) + '.State.h5'
-                    )
-                    shutil.copy(last_state, propt['inp'] + '.State.h5')
-
-            # 处理耦合迭代
             if self.options.couple:
-                if self.iteration <= self.model['criticality'].max_iteration:
-                    # 临界耦合迭代中
-                    # 累加迭代计数器
-                    self.iteration += 1
-                    # 不进行临界搜索和点燃耗计算
-                    cur_model['criticalitysearch'] = None
-                    cur_model['burnup'] = None
-                    cur_model['refuelling'] = None
-                    cur_model['print'] = None
-                else:
-                    # 迭代结束后，进行燃耗计算（可能伴有临界搜索等）
-                    # 重置迭代计数器
-                    self.iteration = 1
+                # 无燃耗的耦合计算，每次迭代使用相同的输入卡
+                with open(step.inp, 'w') as f:
+                    self.model.write_to(f)
+            # 无燃耗、无耦合的RMC计算，不需要改输入卡
+            return
+
+        if step.burnup_step == 0:
+            if os.path.exists(step.inp + '.State.h5'):
+                os.remove(step.inp + '.State.h5')
+        cur_model = self._parse(step.source)
+
+        # 复制接续文件
+        if step.burnup_step > 0:
+            # 当不是初始燃耗步时，把上个燃耗步生成的material文件copy过来
+            material = cur_model['includematerial'].material
+            self._copy(os.path.join(os.path.dirname(step.source), material),
+                       os.path.join(os.path.dirname(self.inp), os.path.basename(material)))
+        # 当不是最后一个燃耗步时，把上个燃耗步生成的包含点燃耗核素信息的文件copy过来
+        for src, dst in step.copies:
+            self._copy(src, dst)
+
+        if step.coupling:
+            # 耦合迭代中不进行临界搜索和点燃耗计算
+            cur_model['criticalitysearch'] = None
+            cur_model['burnup'] = None
+            cur_model['refuelling'] = None
+            cur_model['print'] = None
+
+        # 生成实际计算所需要的输入卡
+        with open(step.inp, 'w') as f:
+            cur_model.write_to(f)
+
+    def _parse(self, inp):
+        """
+        解析输入卡，同一燃耗步的各次耦合迭代使用同一个接续输入卡，文件未改变时不再重复解析
 
-            # iteration = 1 表示这一步将做点燃耗计算。
-            # 在无耦合时，iteration就等于1；在有耦合时，在耦合最后一步也置为1
-            if self.iteration == 1:
-                # 推进燃耗步
-                self.model['burnup'].current_step += 1
-                # 记录当前燃耗步所用的输入卡和存储位置信息，下个燃耗步会用得到
-                self.last_archive = propt['archive_dir']
-                self.last_inp = propt['inp']
-
-            # 生成实际计算所需要的输入卡
-            with open(propt['inp'], 'w') as f:
-                f.write(str(cur_model))
-
-            return True
-
-        # if status_file is None:
-        #     warnings.warn('Status file not specified, continuous running can not be performed.')
-        #     return False
-        # status = self.check(status_file)
-        # if status[0]:
-        #     return False
-        # else:
-        #     # todo: more elegant method to modify the parameters.
-        #     property['inp'] = status[1]
-        #     property['conti'] = True
-        #     return True
+        :return: 模型的浅拷贝，修改其中的选项卡不影响缓存的模型
+        """
+        file_signature = signature(inp)
+        cached = self._parsed.get(inp)
+        if cached is None or cached[0] != file_signature:
+            cached = [file_signature, PlainParser(inp).parsed]
+            self._parsed[inp] = cached
+        return Model(dict(cached[1].model))
+
+    def _copy(self, src, dst):
+        """
+        复制文件，源文件和目标文件自上次复制以后都没有改变时跳过
+
+        :param src: 源文件
+        :param dst: 目标文件
+        """
+        key = os.path.abspath(dst)
+        src_signature = signature(src)
+        if self.checkpoint.copies.get(key) == [src_signature, signature(dst)] and src_signature is not None:
+            return
+        if os.path.islink(dst):
+            # shutil.copy会写入链接指向的文件，先删除链接，不改写其他目录中的文件
+            os.remove(dst)
+        shutil.copy(src, dst)
+        self.checkpoint.copies[key] = [src_signature, signature(dst)]
+
+    def couple_converged(self, workspace):
+        """根据RMC最新输出的功率与上一次松弛后的功率之间的残差，判断耦合迭代是否收敛，
+        并把残差记录在存档目录的CoupleResidual.txt中。
+
+        :param workspace: 计算的工作目录
+        :return: 耦合迭代是否已经收敛
+        """
+        from RMC.util.CoupleUtils import power_residual
+
+        # 当前限定使用RMC的第一个计数器输出的HDF5文件，作为耦合文件
+        residual = power_residual(os.path.join(workspace, 'MeshTally1.h5'))
+        if residual is None:
+            return False
+        converged = self.relaxation.converged(residual)
+
+        burnup_step = 0 if self.model['burnup'] is None else self.model['burnup'].current_step
+        os.makedirs(self.archive, exist_ok=True)
+        history = os.path.join(self.archive, 'CoupleResidual.txt')
+        new_history = not os.path.exists(history)
+        with open(history, 'a') as f:
+            if new_history:
+                f.write('{:>6s} {:>9s} {:>12s} {:>12s} {:>9s}\n'.format(
+                    'burnup', 'iteration', 'L2', 'Linf', 'converged'))
+            f.write('{:>6d} {:>9d} {:>12.4e} {:>12.4e} {:>9s}\n'.format(
+                burnup_step, self.iteration - 1, residual.l2, residual.linf, str(converged)))
+        if converged:
+            print('Coupling iterations converged after {} iterations: {} residual {:.4e} <= {:.4e}\n'.format(
+                self.iteration - 1, self.relaxation.norm, residual.norm(self.relaxation.norm),
+                self.relaxation.tolerance), flush=True)
+        return converged
 
     @staticmethod
-    def generate_tally_hdf(meshtally, h5file_dir):
+    def generate_tally_hdf(meshtally, h5file_dir, shape='sine'):
         """基于解析RMC输入卡得到的网格计数器模型，
-        生成一个轴向余弦分布的网格计数器结果HDF5文件，提供给第一次CTF计算使用。
+        生成一个轴向正弦分布（或其他形状）的网格计数器结果HDF5文件，提供给第一次CTF计算使用。
 
         :param meshtally: 解析RMC输入卡的到的网格计数器模型
         :param h5file_dir: HDF5文件的生成目录
+        :param shape: 功率分布的形状，见RMC.util.CoupleUtils.POWER_SHAPES
         """
         import numpy as np
         from RMC.controller.RMCEnum import TallyType, MeshType
-
-        def fine_bounds(coarse_bounds, bin_number):
-            """ 基于粗网（网格边界坐标和细网格数）计算细网
-
-            :param coarse_bounds: 粗网边界，例如[0.0, 1.0, 3.0]表示粗网有三个边界，
-                分别是1.0, 2.0, 3.0
-            :param bin_number: 细网格数目，例如[4, 8]表示第一个粗网格中有两个细网格，
-                第二个粗网格中有8个细网格
-            :return: 细网
-            """
-            _fine_bounds = []
-            for coarse_index in range(len(coarse_bounds) - 1):
-                bin_size = coarse_bounds[coarse_index + 1] - \
-                           coarse_bounds[coarse_index]  # 细网格的尺寸
-                for i in range(bin_number[coarse_index]):
-                    # 依次添加细网边界坐标
-                    _fine_bounds.append(
-                        coarse_bounds[coarse_index] +
-                        bin_size / bin_number[coarse_index] * i)
-            # 补充上最后的边界坐标
-            _fine_bounds.append(coarse_bounds[-1])
-            return _fine_bounds
-
-        def sine_power(bounds_x, bounds_y, bounds_z):
-            """根据各个方向上的边界（细网），计算所有网格的尺寸（体积）。
-
-            :param bounds_x: x方向上的细网边界，由小到大排列
-            :param bounds_y: y方向上的细网边界，由小到大排列
-            :param bounds_z: z方向上的细网边界，由小到大排列
-            """
-            x_bin_num = len(bounds_x) - 1  # mesh bin number in x direction
-            y_bin_num = len(bounds_y) - 1  # mesh bin number in y direction
-            z_bin_num = len(bounds_z) - 1  # mesh bin number in z direction
-
-            z_bin_center = np.ones(z_bin_num)  # mesh bin center in z direction
-            for z_idx in range(z_bin_num):
-                z_bin_center[z_idx] = \
-                    (bounds_z[z_idx] + bounds_z[z_idx + 1]) / 2.0
-            z_length = bounds_z[-1] - bounds_z[0]  # length in z direction
-
-            from math import sin, pi
-            # volume of all the meshes
-            power = np.ones((x_bin_num, y_bin_num, z_bin_num))
-            for x_idx in range(x_bin_num):
-                for y_idx in range(y_bin_num):
-                    for z_idx in range(z_bin_num):
-                        # 功率 = 体积 × 功率密度
-                        # 功率密度为正弦分布（堆底为0点）
-                        power[x_idx, y_idx, z_idx] = \
-                            (bounds_x[x_idx + 1] - bounds_x[x_idx]) * \
-                            (bounds_y[y_idx + 1] - bounds_y[y_idx]) * \
-                            (bounds_z[z_idx + 1] - bounds_z[z_idx]) * \
-                            sin((z_bin_center[z_idx] - bounds_z[0]) / z_length
-                                * pi)
-
-            return power
+        from RMC.util.CoupleUtils import fine_bounds, initial_power
+        from RMC.util.CoupleConvergence import INITIAL_GUESS_ATTR
 
         if meshtally.scope is not None:
             # 均匀结构化网格
@@ -312,12 +351,9 @@ class RMCController(Controller):
             fine_bound_y = fine_bounds(meshtally.boundy, meshtally.scopey)
             fine_bound_z = fine_bounds(meshtally.boundz, meshtally.scopez)
 
-        bound = []
-        bound.extend(fine_bound_x)
-        bound.extend(fine_bound_y)
-        bound.extend(fine_bound_z)
+        bound = np.concatenate([fine_bound_x, fine_bound_y, fine_bound_z])
 
-        power = sine_power(fine_bound_x, fine_bound_y, fine_bound_z)
+        power = initial_power(fine_bound_x, fine_bound_y, fine_bound_z, shape)
 
         import h5py
 
@@ -337,19 +373,22 @@ class RMCController(Controller):
         geometry = h5file.create_group('Geometry')
         geometry.attrs['MeshType'] = mesh_type
         geometry.create_dataset('BinNumber', data=np.array([x, y, z]))
-        geometry.create_dataset('Boundary', data=np.array(bound))
+        geometry.create_dataset('Boundary', data=bound)
 
         h5file.create_dataset('Type' + str(tally_type), data=power)
+        # 标记为初始猜测，功率平均时不作为耦合迭代的结果
+        h5file.attrs[INITIAL_GUESS_ATTR] = 1
         h5file.close()
 
         shutil.copyfile(filename, filename + '.previous')
 
-    def update_inp(self):
+    def update_inp(self, backup=True):
         # 去掉@符号
         # todo 最好是在run_fileprocess中就处理了
-        shutil.copy(self.inp, self.inp + '.bak')
+        if backup:
+            shutil.copy(self.inp, self.inp + '.bak')
         with open(self.inp, 'w+') as f:
-            f.write(str(self.model))
+            self.model.write_to(f)
 
 
 class FakeRMC:
@@ -409,7 +448,7 @@ class FakeRMC:
                 original_model['material'] = None
                 original_model['includematerial'] = IncludeMaterial(mat_name)
                 with open(self.inp + '.FMTinp.step0', 'w') as fmtinp:
-                    fmtinp.write(str(original_model))
+                    original_model.write_to(fmtinp)
 
         # fake burnup results
         if original_model['burnup'] is not None:
@@ -447,7 +486,7 @@ class FakeRMC:
                     original_model['includematerial'] = \
                         IncludeMaterial(mat_name)
                     with open(self.inp + '.FMTinp.step1', 'w') as fmtinp:
-                        fmtinp.write(str(original_model))
+                        original_model.write_to(fmtinp)
 
         print("Fake simulation finished.")
 
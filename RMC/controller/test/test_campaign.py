@@ -0,0 +1,142 @@
+# -*- coding:utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+
+import unittest
+from unittest import TestCase, mock
+from RMC.controller.campaign import State, StepGraph, Checkpoint, CTF, TRANSPORT, DEPLETION
+from RMC.controller.rmc import RMCController
+from RMC.parser.PlainParser import PlainParser
+from RMC.model.input.Include import IncludeMaterial
+from RMC.util.CoupleConvergence import ITERATION_ATTR, RESIDUAL_DATASET
+
+
+def fake_run(controller):
+    """代替RMC计算：生成存档目录，燃耗计算时生成接续输入卡、材料文件和核素信息文件"""
+    step = controller.checkpoint.step
+    os.makedirs(step.archive_dir)
+    if step.depletion:
+        name = os.path.basename(step.inp)
+        model = PlainParser(step.inp).parsed
+        with open(os.path.join(step.archive_dir, 'material'), 'w') as f:
+            f.write(str(model['material']))
+        model['material'] = None
+        model['includematerial'] = IncludeMaterial('material')
+        with open(os.path.join(step.archive_dir, name + '.FMTinp.step1'), 'w') as f:
+            model.write_to(f)
+        with open(os.path.join(step.archive_dir, name + '.State.h5'), 'w') as f:
+            f.write('state of ' + name)
+
+
+class TestCampaign(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_step_graph(self):
+        graph = StepGraph('inp', 'archive', burnup_steps=2, max_iteration=2)
+        steps = graph.plan(State(0, 1, 'inp', 'archive'))
+        self.assertEqual([step.inp for step in steps],
+                         ['inp.burnup.{}.couple.{}'.format(s, i) for s in range(3) for i in range(1, 4)])
+        self.assertEqual([step.invocations for step in steps[:3]],
+                         [[CTF, TRANSPORT], [CTF, TRANSPORT], [CTF, TRANSPORT, DEPLETION]])
+        self.assertEqual(steps[-1].invocations, [CTF, TRANSPORT])
+        # 第1燃耗步使用第0燃耗步最后一次计算生成的接续输入卡和核素信息
+        self.assertEqual(steps[3].source, os.path.join('archive', 'burnup0', 'couple3', 'inp.burnup.0.couple.3.FMTinp.step1'))
+        self.assertEqual(steps[3].copies, [[os.path.join('archive', 'burnup0', 'couple3', 'inp.burnup.0.couple.3.State.h5'),
+                                            'inp.burnup.1.couple.1.State.h5']])
+        self.assertEqual(steps[6].copies, [])
+
+        # 耦合迭代收敛后直接进行燃耗计算
+        step, state = graph.next(State(1, 2, 'inp.burnup.0.couple.3', 'archive'), converged=True)
+        self.assertEqual(step.invocations, [CTF, TRANSPORT, DEPLETION])
+        self.assertEqual([state.burnup_step, state.iteration, state.last_inp], [2, 1, 'inp.burnup.1.couple.2'])
+
+        self.assertEqual(len(StepGraph('inp', 'archive').plan(State())), 1)
+        self.assertEqual([step.inp for step in StepGraph('inp', 'archive', max_iteration=2).plan(State())],
+                         ['inp.couple.1', 'inp.couple.2'])
+        self.assertEqual(len(StepGraph('inp', 'archive', burnup_steps=3).plan(State())), 4)
+
+    def test_resume(self):
+        inp = os.path.join(self.work_dir, 'inp')
+        archive = os.path.join(self.work_dir, 'archive')
+        shutil.copy(os.path.join('resources', 'campaign', 'inp'), inp)
+        controller = RMCController(inp, archive)
+        plan = controller.plan()
+        self.assertEqual(len(plan), 30)
+        self.assertIn('30 steps, 30 CTF, 30 transport and 4 depletion', controller.format_plan())
+
+        propt = {'inp': inp}
+        runs = []
+        with mock.patch('RMC.controller.rmc.shutil.copy', wraps=shutil.copy) as copy, \
+                mock.patch('RMC.controller.rmc.PlainParser', wraps=PlainParser) as parser:
+            previous = os.path.join(self.work_dir, 'MeshTally1.h5.previous')
+            for index in range(9):
+                if index == 1:
+                    with h5py.File(previous, 'w') as h5file:
+                        h5file.attrs[ITERATION_ATTR] = 5
+                        h5file[RESIDUAL_DATASET] = np.ones(3)
+                self.assertTrue(controller.continuing(None, propt))
+                if index >= 1:
+                    with h5py.File(previous, 'r') as h5file:
+                        # 耦合迭代的松弛状态只在新的燃耗步开始时清除
+                        self.assertEqual(ITERATION_ATTR in h5file.attrs, index < 6)
+                        self.assertEqual(RESIDUAL_DATASET in h5file, index < 6)
+                runs.append(propt['inp'])
+                fake_run(controller)
+            # 第1燃耗步的接续输入卡只解析一次，材料文件只复制一次，核素信息文件每次迭代复制一次
+            self.assertEqual(parser.call_count, 2)
+            self.assertEqual(copy.call_count, 1 + 3)
+            # 第10个步骤生成输入卡之后中断，接续计算时重新计算该步骤
+            self.assertTrue(controller.continuing(None, propt))
+            self.assertEqual(propt['inp'], plan[9].inp)
+
+        resumed = RMCController(inp, archive, resume=True)
+        self.assertEqual(resumed.checkpoint.completed, [step.archive_dir for step in plan[:9]])
+        self.assertEqual([step.inp for step in resumed.plan()], [step.inp for step in plan[9:]])
+        while resumed.continuing(None, propt):
+            runs.append(propt['inp'])
+            fake_run(resumed)
+        self.assertEqual(runs, [step.inp for step in plan])
+        with open(os.path.join(self.work_dir, 'inp.burnup.4.couple.1')) as f:
+            self.assertIn('INCLUDE material', f.read())
+
+        checkpoint = Checkpoint(os.path.join(archive, 'checkpoint.json'))
+        self.assertTrue(checkpoint.load())
+        self.assertIsNone(checkpoint.step)
+        self.assertEqual(len(checkpoint.completed), 30)
+        self.assertFalse(RMCController(inp, archive, resume=True).continuing(None, propt))
+
+    def test_dry_run(self):
+        inp = os.path.join(self.work_dir, 'inp')
+        archive = os.path.join(self.work_dir, 'archive')
+        shutil.copy(os.path.join('resources', 'campaign', 'inp'), inp)
+        with open(inp) as f:
+            content = f.read()
+
+        controller = RMCController(inp, archive, dry_run=True)
+        self.assertIn('30 steps, 30 CTF, 30 transport and 4 depletion', controller.format_plan())
+        # 只规划计算步骤，不改写输入卡，也不生成备份和检查点
+        self.assertEqual(os.listdir(self.work_dir), ['inp'])
+        with open(inp) as f:
+            self.assertEqual(f.read(), content)
+        with self.assertRaises(RuntimeError):
+            controller.continuing(None, {'inp': inp})
+
+    def test_refuel_processes(self):
+        for file in ['inp', 'refuelling.yml']:
+            shutil.copy(os.path.join('resources', file), self.work_dir)
+        inp = os.path.join(self.work_dir, 'inp')
+        archive = os.path.join(self.work_dir, 'archive')
+        self.assertEqual(RMCController(inp, archive, dry_run=True).refuel.processes, os.cpu_count())
+        self.assertEqual(RMCController(inp, archive, dry_run=True, refuel_processes=2).refuel.processes, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
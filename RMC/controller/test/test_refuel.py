@@ -1,13 +1,240 @@
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 from RMC.controller.refuel import Refuel
 from RMC.parser.PlainParser import PlainParser
-import filecmp
 import os
+import time
 import shutil
+import tempfile
+import tracemalloc
 import numpy as np
+from unittest import mock
+
+
+def synthetic_core(size, n_assemblies, n_pins, instances=1):
+    """
+    A core of size * size positions, n_assemblies of them are fuel assemblies of n_pins * n_pins fuel rods.
+    The core is filled into cells 1 .. instances of universe 0, and cell 99 is filled with a lattice of
+    the same fuel rods, which is not refuelled.
+
+    :return: [the input, the rows of the material file of cell 3]
+    """
+    rng = np.random.RandomState(size)
+    fuel = np.zeros(size * size, dtype=bool)
+    fuel[rng.choice(size * size, n_assemblies, replace=False)] = True
+    assemblies = np.where(fuel, rng.randint(1, 3, size * size), 5)
+    pins = np.where(rng.rand(n_pins * n_pins) < 0.1, 11, 10)
+
+    def lattice(number, scope, pitch, fill):
+        return 'UNIVERSE {0}  lat = 1  scope = {1} {1} 1  pitch = {2} {2} 1  fill =\n{3}\n\n'.format(
+            number, scope, pitch, '\n'.join('    ' + ' '.join(str(u) for u in fill[i:i + scope])
+                                            for i in range(0, len(fill), scope)))
+
+    inp = 'UNIVERSE 0\n'
+    for cell in range(1, instances + 1):
+        inp += 'cell {}  -{}  fill = 8\n'.format(cell, cell + 10)
+    inp += 'cell 99  -20  fill = 4\n\n'
+    inp += lattice(8, size, 21.5, assemblies)
+    inp += lattice(4, 2, 21.5, [1, 5, 5, 1])
+    for assembly in [1, 2, 3]:
+        inp += lattice(assembly, n_pins, 1.26, pins)
+    inp += 'UNIVERSE 5\ncell 7  -1  mat = 5\n\n'
+    inp += 'UNIVERSE 10\ncell 3  -1  mat = -1\ncell 4  1  mat = 5\n\n'
+    inp += 'UNIVERSE 11\ncell 5  -1  mat = 5\ncell 6  1  mat = 5\n\n'
+    inp += 'SURFACE\nsurf 1 cz 0.4\n' + ''.join('surf {} cz {}\n'.format(s, s) for s in range(11, 21))
+
+    rows = []
+    fuel_pins = np.where(pins == 10)[0] + 1
+    for cell, lattice_fill in [(c, assemblies) for c in range(1, instances + 1)] + [(99, [1, 5, 5, 1])]:
+        for idx in np.where(np.array(lattice_fill) != 5)[0] + 1:
+            block = np.zeros((len(fuel_pins), 5), dtype=np.int32)
+            block[:, 0] = rng.randint(1000, 2000, len(fuel_pins))
+            block[:, 1] = cell
+            block[:, 2] = idx
+            block[:, 3] = fuel_pins
+            block[:, 4] = 3
+            rows.append(block)
+    return [inp, np.concatenate(rows)]
+
+
+def synthetic_strategy(model, size, n_new, seed=0):
+    """shuffle the fuel assemblies of universe 8, n_new of them are replaced by new assemblies of universe 3"""
+    rng = np.random.RandomState(seed)
+    fill = model.geometry.get_univ(8).lattice.fill
+    fuel = np.where(fill != 5)[0]
+    strategy = {idx: idx for idx in range(size * size)}
+    for idx, source in zip(fuel, rng.permutation(fuel)):
+        strategy[idx] = source
+    for idx in rng.choice(fuel, n_new, replace=False):
+        strategy[idx] = -3
+    return strategy
 
 
 class TestRefuel(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def refuel_core(self, inp, rows, pos, strategy):
+        inp_file = os.path.join(self.work_dir, 'core')
+        with open(inp_file, 'w') as f:
+            f.write(inp)
+        model = PlainParser(inp_file).parsed
+        mat_file = os.path.join(self.work_dir, 'mat_1.npy')
+        np.save(mat_file, rows)
+        start = time.time()
+        Refuel._do_refuel(pos, model.geometry.get_univ(8), {3: mat_file}, dict(strategy), model, model)
+        return [np.load(mat_file), model.geometry.get_univ(8).lattice.fill, time.time() - start]
+
+    def test_do_refuel(self):
+        model = PlainParser('resources/inp').parsed
+        mat = os.path.join(self.work_dir, 'mat_1.npy')
+        shutil.copy('resources/mat_1_bak.npy', mat)
+        strategy = {0: 2, 1: 3, 2: -9, 3: 0}
+        Refuel._do_refuel([1], model.geometry.get_univ(8), {3: mat}, strategy, model,
+                          PlainParser('resources/inp_initial').parsed)
+        self.assertTrue(np.all(np.load(mat) == np.load('resources/mat_1_ref.npy')))
+        self.assertEqual(list(model.geometry.get_univ(8).lattice.fill), [5, 1, 9, 1])
+
+        # two instances of the core [5 2; 1 2], the assembly at position 4 is moved to position 2,
+        # and a new assembly of universe 3 is loaded at position 4
+        inp, rows = synthetic_core(2, 3, 2, instances=2)
+        mat, fill, _ = self.refuel_core(inp, rows, [0], {0: 0, 1: 3, 2: 2, 3: -3})
+        self.assertEqual(list(fill), [5, 2, 1, 3])
+        new = np.array([[1, 0, 4, 0, 0]] * 4)
+        expected = []
+        for cell in [1, 2]:
+            block = rows[rows[:, 1] == cell]
+            moved = block[block[:, 2] == 4].copy()
+            moved[:, 2] = 2
+            expected += [moved, block[block[:, 2] == 3], new]
+        expected.append(rows[rows[:, 1] == 99])
+        self.assertTrue(np.array_equal(mat, np.concatenate(expected)))
+
+        # the same 2 instances when the blocks span several chunks of the material file
+        for chunk_rows in [1, 3, 5]:
+            with mock.patch.object(Refuel, 'chunk_rows', chunk_rows):
+                chunked, _, _ = self.refuel_core(inp, rows, [0], {0: 0, 1: 3, 2: 2, 3: -3})
+            self.assertTrue(np.array_equal(chunked, mat))
+            self.assertEqual(chunked.dtype, rows.dtype)
+
+    def test_compile_strategy(self):
+        # position 0 gets the assembly of position 3, position 1 that of position 0, position 3 that of
+        # position 2, the assembly of position 1 is moved out and a new assembly of universe 7 is loaded at 2
+        remap, new_assemblies = Refuel._compile_strategy({0: 3, 1: 0, 2: -7, 3: 2}, 4)
+        self.assertEqual(list(remap), [1, -1, 3, 0])
+        self.assertEqual(new_assemblies, {2: 7})
+        self.assertRaises(ValueError, Refuel._compile_strategy, {0: 1, 1: 1}, 2)
+
+    def test_plan_pieces(self):
+        # [material, cell, lattice position + 1, pin, 3], cells 1 and 2 are filled with the refuelling universe
+        rows = np.array([[100, 99, 1, 1, 3],
+                         [101, 1, 1, 1, 3],
+                         [102, 1, 1, 2, 3],
+                         [103, 1, 2, 1, 3],
+                         [104, 1, 4, 1, 3],
+                         [105, 2, 1, 1, 3],
+                         [106, 2, 2, 1, 3],
+                         [107, 2, 4, 1, 3],
+                         [108, 99, 2, 1, 3]], dtype=np.int32)
+        new = np.array([-9, 0, 3, 0, 0])
+        remap = np.array([1, -1, 3, 0])
+        # in each block, position 4 is moved to 1, position 1 to 2, position 2 is moved out,
+        # and the new assembly is inserted at position 3
+        pieces = Refuel._plan_pieces(rows, np.array([0]), [1, 2], remap, [[new, 1]])
+        self.assertEqual([piece[:2] if piece[0] is None else piece for piece in pieces],
+                         [(0, 1, None), (4, 5, 1), (1, 3, 2), (None, 1), (7, 8, 1), (5, 6, 2), (None, 1), (8, 9, None)])
+
+        expected = np.array([[100, 99, 1, 1, 3],
+                             [104, 1, 1, 1, 3],
+                             [101, 1, 2, 1, 3],
+                             [102, 1, 2, 2, 3],
+                             [-9, 0, 3, 0, 0],
+                             [107, 2, 1, 1, 3],
+                             [105, 2, 2, 1, 3],
+                             [-9, 0, 3, 0, 0],
+                             [108, 99, 2, 1, 3]], dtype=np.int32)
+        mat_file = os.path.join(self.work_dir, 'mat_1.npy')
+        for chunk_rows in [1, 2, 3, 1000]:
+            np.save(mat_file, rows)
+            with mock.patch.object(Refuel, 'chunk_rows', chunk_rows):
+                Refuel._remap_file(mat_file, np.array([0]), [1, 2], remap, [[new, 1]])
+            mat = np.load(mat_file)
+            self.assertTrue(np.array_equal(mat, expected))
+            self.assertEqual(mat.dtype, rows.dtype)
+
+        # the universe is not found, the file is not changed
+        np.save(mat_file, rows)
+        self.assertIsNone(Refuel._plan_pieces(rows, np.array([0]), [3], remap, [[new, 1]]))
+        Refuel._remap_file(mat_file, np.array([0]), [3], remap, [[new, 1]])
+        self.assertTrue(np.array_equal(np.load(mat_file), rows))
+
+    @skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_benchmark(self):
+        # 241 assemblies of 17 * 17 fuel rods in a 17 * 17 core
+        inp, rows = synthetic_core(17, 241, 17)
+        inp_file = os.path.join(self.work_dir, 'core')
+        with open(inp_file, 'w') as f:
+            f.write(inp)
+        strategy = synthetic_strategy(PlainParser(inp_file).parsed, 17, 64)
+        mat, _, refuel_time = self.refuel_core(inp, rows, [1], strategy)
+        print('%d rows: %.4fs' % (len(rows), refuel_time))
+        # the new assemblies have as many fuel rods as the old ones, the rows of cell 99 are not changed,
+        # and the rows are sorted by the lattice position
+        self.assertEqual(mat.shape, rows.shape)
+        self.assertTrue(np.array_equal(mat[mat[:, 1] == 99], rows[rows[:, 1] == 99]))
+        self.assertTrue(np.all(np.diff(mat[mat[:, 1] == 1, 2]) >= 0))
+
+    def test_parallel(self):
+        inp, rows = synthetic_core(17, 241, 40, instances=2)
+        inp_file = os.path.join(self.work_dir, 'core')
+        with open(inp_file, 'w') as f:
+            f.write(inp)
+        model = PlainParser(inp_file).parsed
+        strategy = synthetic_strategy(model, 17, 64)
+        np.save(os.path.join(self.work_dir, 'mat.npy'), rows)
+        tasks = Refuel._plan_refuel([0], model.geometry.get_univ(8), {3: os.path.join(self.work_dir, 'mat.npy')},
+                                    strategy, model, model)
+        # 8 material files, the first one is reshuffled twice, which should be done in order
+        files = ['mat_%d.npy' % i for i in range(8)]
+        tasks = [[name] + tasks[0][1:] for name in files] + [['mat_0.npy'] + tasks[0][1:]]
+
+        results = []
+        for processes in [1, 4]:
+            folder = os.path.join(self.work_dir, str(processes))
+            os.makedirs(folder)
+            for name in files:
+                np.save(os.path.join(folder, name), rows)
+            Refuel._run_tasks([[os.path.join(folder, task[0])] + task[1:] for task in tasks], processes)
+            results.append([np.load(os.path.join(folder, name)) for name in files])
+
+        for sequential, parallel in zip(*results):
+            self.assertTrue(np.array_equal(sequential, parallel))
+        self.assertFalse(np.array_equal(results[1][0], results[1][1]))
+        self.assertFalse(np.array_equal(results[1][1], rows))
+
+    def test_memory(self):
+        # 200k rows, the material file is not read into the memory as a whole
+        inp, rows = synthetic_core(17, 241, 30)
+        inp_file = os.path.join(self.work_dir, 'core')
+        with open(inp_file, 'w') as f:
+            f.write(inp)
+        model = PlainParser(inp_file).parsed
+        strategy = synthetic_strategy(model, 17, 64)
+        mat_file = os.path.join(self.work_dir, 'mat_1.npy')
+        np.save(mat_file, rows)
+        del rows
+
+        tracemalloc.start()
+        with mock.patch.object(Refuel, 'chunk_rows', 8192):
+            Refuel._do_refuel([1], model.geometry.get_univ(8), {3: mat_file}, strategy, model, model)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = os.path.getsize(mat_file)
+        self.assertLess(peak, size / 4)
+        self.assertEqual(sorted(os.listdir(self.work_dir)), ['core', 'mat_1.npy'])
+
     def test_refuel(self):
         """
 
@@ -37,8 +264,9 @@ class TestRefuel(TestCase):
         base_model = PlainParser(inp_initial).parsed
         refuel.refuel(1, inp, base_model, output=output)
 
-        # 1. Check the plain input file
-        self.assertTrue(filecmp.cmp(output, reference))
+        # 1. Check the plain input file, the reference is compared as the parsed model,
+        #    since it was written in the former format of the cards
+        self.assertEqual(str(PlainParser(output, cache=None).parsed), str(PlainParser(reference, cache=None).parsed))
 
         # 2. Check the material npy file
         a = np.load(mat)
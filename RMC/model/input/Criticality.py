@@ -8,11 +8,21 @@ class Criticality(BaseModel):
     card_option_types = {
         # todo 完善各类选项
         'MAXITERATION': [int],
+        # 耦合迭代的松弛与收敛判断，见RMC.util.CoupleConvergence.Relaxation
+        'RELAXATION': [str],
+        'WEIGHT': [float],
+        'TOLERANCE': [float],
+        'NORM': [str],
     }
 
-    def __init__(self, max_iteration=None, unparsed=''):
+    def __init__(self, max_iteration=None, unparsed='', relaxation='fixed', weight=0.5,
+                 tolerance=None, norm='L2'):
         self._max_iteration = max_iteration
         self._unparsed = unparsed
+        self.relaxation = relaxation.lower()
+        self.weight = weight
+        self.tolerance = tolerance
+        self.norm = norm.upper()
 
         self.couple_option = False
         if self._max_iteration is not None:
@@ -21,6 +31,15 @@ class Criticality(BaseModel):
     def check(self):
         if self._max_iteration is not None:
             assert self._max_iteration >= 1
+            self.couple_relaxation()
+
+    def couple_relaxation(self):
+        """
+        :return: the relaxation and convergence control of the coupling iterations.
+        """
+        from RMC.util.CoupleConvergence import Relaxation
+        return Relaxation(scheme=self.relaxation, weight=self.weight,
+                          tolerance=self.tolerance, norm=self.norm)
 
     @property
     def max_iteration(self):
@@ -34,6 +53,6 @@ class Criticality(BaseModel):
         card = 'CRITICALITY\n'
         if self._unparsed != '':
             card += self._unparsed
-        # 注意：max_iteration选项不会输出，因为RMC不需要读取这个选项
+        # 注意：max_iteration等耦合选项不会输出，因为RMC不需要读取这个选项
         card += '\n\n'
         return card
@@ -3,8 +3,11 @@
 # date: 2019-11-15
 
 from RMC.model.input.base import YMLModelObject as BaseModel
+import io
 import numpy as np
 
+_POWERS_OF_TEN = 10 ** np.arange(1, 19, dtype=np.int64)
+
 
 class Cell(BaseModel):
     yaml_tag = u'!cell'
@@ -21,6 +24,7 @@ class Cell(BaseModel):
         'ROTATE': ['list', float, 9],
         'NOBURN': [bool],
     }
+    serialize_ignored = ('include',)
 
     def __init__(self, name=None, number=-1, bounds='', material=None, volume=None, fill=None, inner=False,
                  temperature=None, density=None, void=False, transformation=None, noburn=0, impn = None):
@@ -60,7 +64,7 @@ class Cell(BaseModel):
             self.transformation = Transformation(
                 move=options['MOVE'], rotate=options['ROTATE'])
 
-    def count_cell(self, cell_id):
+    def count_cell(self, cell_id, memo=None):
         if self.number == cell_id:
             return 1
         if self.fill is None:
@@ -69,7 +73,7 @@ class Cell(BaseModel):
             raise ValueError(
                 "Postprocessing for cell {} has not been done!".format(self.number))
         else:
-            return self.include.count_cell(cell_id)
+            return self.include.count_cell(cell_id, memo)
 
     def __str__(self):
         s = 'CELL %d %s ' % (self.number, self.bounds)
@@ -164,42 +168,106 @@ class Universe(BaseModel):
         if self.transformation is not None:
             self.transformation.postprocess()
 
-    def count_cell(self, cell_id):
+    def count_cell(self, cell_id, memo=None):
+        """
+        :param cell_id: number of the cell.
+        :param memo: {universe number: count} of the universes already counted, so that each universe
+            shared in the fill hierarchy is counted only once.
+        :return: number of the instances of the cell in the universe.
+        """
+        if memo is not None and self.number in memo:
+            return memo[self.number]
         num = 0
         if self.lattice is None:
             for cell in self.cells:
-                num += cell.count_cell(cell_id)
+                num += cell.count_cell(cell_id, memo)
         elif self.include is None:
             raise ValueError(
                 "Postprocessing for universe {} has not been done!".format(self.number))
         else:
-            # todo: refactor needed.
-            unique, counts = np.unique(self.lattice.fill, return_counts=True)
-            occurrence = dict(zip(unique, counts))
+            occurrence = self.lattice.histogram()
             for univ in self.include:
                 if univ.number in occurrence:
-                    num += occurrence[univ.number] * univ.count_cell(cell_id)
+                    num += occurrence[univ.number] * univ.count_cell(cell_id, memo)
+        if memo is not None:
+            memo[self.number] = num
         return num
 
-    def __str__(self):
-        s = 'UNIVERSE %d ' % self.number
+    def is_dirty(self):
+        return any(obj.is_dirty() for obj in [self.transformation, self.lattice] + self.cells if obj is not None)
+
+    def write_to(self, fileobj):
+        fileobj.write('UNIVERSE %d ' % self.number)
         if self.transformation is not None:
-            s += str(self.transformation) + ' '
+            fileobj.write(self.transformation.serialized() + ' ')
         if self.lattice is not None:
-            s += str(self.lattice)
-        s += '\n'
+            self.lattice.write_to(fileobj)
+        fileobj.write('\n')
         for cell in self.cells:
-            s += str(cell)
-        s += '\n'
-        return s
+            cell.write_to(fileobj)
+        fileobj.write('\n')
+
+    def serialized(self):
+        return str(self)
+
+    def __str__(self):
+        s = io.StringIO()
+        self.write_to(s)
+        return s.getvalue()
 
     def __iter__(self):
         for cell in self.cells:
             yield cell
 
 
+def _format_fill_rows(fill, n_column):
+    """
+    Format the lattice filling into rows, like '\n 1 * 5 2 3\n 4 * 8'.
+    Runs of the same universe in a row are written as 'u * n' if that is shorter.
+    :param fill: 1-D integer array of the filling, starting at the beginning of a row.
+    :param n_column: number of universes in a row.
+    :return: the formatted rows.
+    """
+    size = fill.size
+    row_start = np.arange(0, size, n_column)
+    changed = np.empty(size, dtype=bool)
+    changed[0] = True
+    changed[1:] = fill[1:] != fill[:-1]
+    changed[row_start] = True
+    run_start = np.flatnonzero(changed)
+    run_length = np.diff(np.append(run_start, size))
+
+    # 每种填充的宇宙编号只格式化一次
+    unique, inverse = np.unique(fill[run_start], return_inverse=True)
+    names = np.array([str(univ) for univ in unique.tolist()], dtype=object)
+    name_length = np.array([len(name) for name in names])[inverse]
+    count_length = np.searchsorted(_POWERS_OF_TEN, run_length, side='right') + 1
+    compress = run_length * (name_length + 1) - 1 > name_length + 3 + count_length
+
+    # 压缩的连续段只写一个词 'u * n'，其余的段逐个写出
+    word_number = np.where(compress, 1, run_length)
+    words = names[np.repeat(inverse, word_number)]
+    compressed_word = (np.cumsum(word_number) - 1)[compress]
+    words[compressed_word] = ['%s * %d' % (name, count) for name, count in
+                              zip(words[compressed_word].tolist(), run_length[compress].tolist())]
+    words = words.tolist()
+
+    row_words = np.bincount(run_start // n_column, weights=word_number, minlength=row_start.size)
+    rows = []
+    index = 0
+    for number in row_words.astype(int).tolist():
+        rows.append(' '.join(words[index:index + number]))
+        index += number
+    return '\n ' + '\n '.join(rows)
+
+
 class Lattice(BaseModel):
     yaml_tag = u'!lattice'
+    cache_attributes = BaseModel.cache_attributes + ('_histogram',)
+    # 填充数目超过此值的栅格，写入文件时不缓存文本，分块直接写入
+    fill_cache_limit = 1000000
+    # 每次格式化并写入的填充数目
+    fill_chunk_size = 65536
 
     def __init__(self, pitch=np.zeros(3), scope=np.zeros(3), fill=np.ones(1), type=None, theta=None,
                  length=None, radius=None, fill_ball=None, fill_interval=None, max_scope=None,  # lat=5
@@ -232,26 +300,62 @@ class Lattice(BaseModel):
     def check(self):
         assert self.type >= 0
 
+    def histogram(self):
+        """
+        The histogram of the filling is computed at the first call and cached,
+        until Geometry.invalidate_counts is called after the filling is changed.
+        :return: {universe number: number of the lattice elements filled with the universe}.
+        """
+        histogram = self.__dict__.get('_histogram')
+        if histogram is None:
+            unique, counts = np.unique(self.fill, return_counts=True)
+            histogram = dict(zip(unique.tolist(), counts.tolist()))
+            self.__dict__['_histogram'] = histogram
+        return histogram
+
+    def write_to(self, fileobj):
+        # 大型栅格的填充直接分块写入文件，不缓存其文本
+        if self.type in [1, 2] and np.size(self.fill) > Lattice.fill_cache_limit:
+            self._write_header(fileobj)
+            self._write_fill(fileobj)
+        else:
+            fileobj.write(self.serialized())
+
+    def _write_header(self, fileobj):
+        fileobj.write('LAT=%d SCOPE=' % self.type)
+        fileobj.write(''.join('%d ' % ele for ele in self.scope))
+        fileobj.write('PITCH=')
+        fileobj.write(''.join('%f ' % ele for ele in self.pitch))
+        if self.theta is not None and self.type == 2:
+            fileobj.write('SITA=%f ' % self.theta)
+        fileobj.write('FILL=')
+
+    def _write_fill(self, fileobj):
+        """
+        Write the filling of the lattice row by row, each row of scope[0] universes in a line,
+        or all the universes in one line if scope[0] is not given.
+        The rows are formatted by chunks, and the repeated universes are written as 'u * n'.
+        """
+        fill = np.asarray(self.fill).astype(np.int64).ravel()
+        if fill.size == 0:
+            return
+        if np.all(fill == fill[0]):
+            fileobj.write('%d * %d' % (fill[0], fill.size))
+            return
+        n_column = int(self.scope[0])
+        if n_column <= 0:
+            # 没有给出栅格范围时，所有的填充写在一行中
+            n_column = fill.size
+        chunk_size = max(1, Lattice.fill_chunk_size // n_column) * n_column
+        for start in range(0, fill.size, chunk_size):
+            fileobj.write(_format_fill_rows(fill[start:start + chunk_size], n_column))
+
     def __str__(self):
         if self.type in [1, 2]:
-            s = 'LAT=%d SCOPE=' % self.type
-            for ele in self.scope:
-                s += '%d ' % ele
-            s += 'PITCH='
-            for ele in self.pitch:
-                s += '%f ' % ele
-            if self.theta is not None and self.type == 2:
-                s += 'SITA=%f ' % self.theta
-            s += 'FILL='
-            if len(set(self.fill)) == 1:
-                s += '%d ' % self.fill[0]
-                s += '* %d \n' % len(self.fill)
-            else:
-                for idx, val in enumerate(self.fill):
-                    if idx % self.scope[0] == 0:
-                        s += '\n '
-                    s += '%d ' % val
-            return s.replace(' \n', '\n').strip()
+            s = io.StringIO()
+            self._write_header(s)
+            self._write_fill(s)
+            return s.getvalue()
         elif self.type in [3, 4]:
             s = 'LAT=%d ' % self.type
 
@@ -314,6 +418,7 @@ class Transformation(BaseModel):
 
 class Geometry(BaseModel):
     yaml_tag = u'!geometry'
+    cache_attributes = BaseModel.cache_attributes + ('_counts',)
 
     def __init__(self, universes=None):
         if universes is None:
@@ -329,6 +434,7 @@ class Geometry(BaseModel):
         self.universes.append(univ)
 
     def postprocess(self):
+        self.invalidate_counts()
         for univ in self.universes:
             self.univ_dict[univ.number] = univ
             for cell in univ.cells:
@@ -345,6 +451,36 @@ class Geometry(BaseModel):
     def get_univ(self, uid):
         return self.univ_dict[uid]
 
+    def count_cell(self, univ, cell_id):
+        """
+        Number of the instances of a cell in a universe, looked up in a table of the counts in all the
+        universes. The table of a cell is computed bottom-up at the first call, and kept until
+        invalidate_counts is called.
+
+        :param univ: the universe or its number.
+        :param cell_id: number of the cell.
+        :return: number of the instances of the cell.
+        """
+        if not isinstance(univ, Universe):
+            univ = self.univ_dict[univ]
+        tables = self.__dict__.setdefault('_counts', {})
+        if cell_id not in tables:
+            memo = {}
+            for u in self.universes:
+                u.count_cell(cell_id, memo)
+            tables[cell_id] = memo
+        return tables[cell_id][univ.number]
+
+    def invalidate_counts(self):
+        """
+        Discard the histograms of the lattices and the tables of the cell counts.
+        It must be called after the filling of any lattice is changed.
+        """
+        self.__dict__.pop('_counts', None)
+        for univ in self.universes:
+            if univ.lattice is not None:
+                univ.lattice.__dict__.pop('_histogram', None)
+
     def get_cell(self, cid):
         return self.cell_dict[cid]
 
@@ -421,11 +557,20 @@ class Geometry(BaseModel):
                     # lat=5 解析完毕
                     return surfs
 
-    def __str__(self):
-        s = ''
+    def is_dirty(self):
+        return any(univ.is_dirty() for univ in self.universes)
+
+    def write_to(self, fileobj):
         for univ in self.universes:
-            s += str(univ)
-        return s
+            univ.write_to(fileobj)
+
+    def serialized(self):
+        return str(self)
+
+    def __str__(self):
+        s = io.StringIO()
+        self.write_to(s)
+        return s.getvalue()
 
     def __iter__(self):
         for univ in self.universes:
@@ -2,8 +2,32 @@
 # author: Kaiwen Li
 # date: 2019-11-16
 
+import io
+import hashlib
 import yaml
 import abc
+import numpy as np
+
+
+def _fingerprint(value):
+    """
+    A cheap fingerprint of the content of the value, to find the changes of lists, dicts and arrays made in place.
+    The model objects in the value are represented by their snapshots, and the arrays by the digests of their data.
+    """
+    if isinstance(value, YMLModelObject):
+        return value._snapshot()
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_fingerprint(item) for item in value)
+    if isinstance(value, dict):
+        return dict, tuple((key, _fingerprint(item)) for key, item in value.items())
+    if isinstance(value, (set, frozenset)):
+        return frozenset, frozenset(value)
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return np.ndarray, value.shape, _fingerprint(value.tolist())
+        data = np.ascontiguousarray(value).view(np.uint8)
+        return np.ndarray, value.shape, value.dtype.str, hashlib.blake2b(data, digest_size=16).digest()
+    return value
 
 
 # todo: change all of the classes inherited from this class, from __init__ to __new__, and
@@ -31,6 +55,66 @@ class YMLModelObject(yaml.YAMLObject):
     def postprocess(self):
         pass
 
+    # attributes referring to other objects, which do not belong to the serialized text
+    serialize_ignored = ()
+    # attributes caching the values computed from the object, which are neither serialized nor pickled
+    cache_attributes = ('_serialized', '_version')
+
+    def __setattr__(self, key, value):
+        super().__setattr__(key, value)
+        if key not in self.cache_attributes:
+            self.mark_dirty()
+
+    def mark_dirty(self):
+        """
+        Mark the object as changed. Assigning an attribute marks the object automatically, and the lists,
+        dicts and arrays of the object changed in place are found by their fingerprints, see _snapshot.
+        It is only required after the other mutable values of the object are changed in place.
+        """
+        self.__dict__['_version'] = self.__dict__.get('_version', 0) + 1
+
+    def _snapshot(self):
+        """
+        The mutation counter of the object, with the fingerprints of its attributes,
+        including the snapshots of the model objects it holds.
+        """
+        content = tuple(_fingerprint(value) for key, value in self.__dict__.items()
+                        if key not in self.cache_attributes and key not in self.serialize_ignored)
+        return self.__dict__.get('_version', 0), content
+
+    def is_dirty(self):
+        """
+        :return: whether the object has been changed since it was serialized last time.
+        """
+        cached = self.__dict__.get('_serialized')
+        return cached is None or cached[0] != self._snapshot()
+
+    def serialized(self):
+        """
+        The serialized text of the object. The text is cached with the snapshot of the object,
+        and reused until the object or any of its attributes is changed, see _snapshot.
+        :return: the serialized text.
+        """
+        snapshot = self._snapshot()
+        cached = self.__dict__.get('_serialized')
+        if cached is None or cached[0] != snapshot:
+            cached = (snapshot, str(self))
+            self.__dict__['_serialized'] = cached
+        return cached[1]
+
+    def write_to(self, fileobj):
+        """
+        Write the serialized text of the object to the file object.
+        :param fileobj: file object opened for writing text.
+        """
+        fileobj.write(self.serialized())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in self.cache_attributes:
+            state.pop(key, None)
+        return state
+
 
 class Model(YMLModelObject):
     def __init__(self, model=None):
@@ -53,7 +137,7 @@ class Model(YMLModelObject):
 
     def check(self):
         for key in self.model.keys():
-            if key is not 'unparsed' and self.model[key] is not None:
+            if key != 'unparsed' and self.model[key] is not None:
                 self.model[key].check()
 
     def postprocess(self):
@@ -69,14 +153,28 @@ class Model(YMLModelObject):
                 self.model['surface'].add_surface(surf)
 
     # todo: the sequence of output has not been defined.
-    def __str__(self):
-        s = ''
+    def write_to(self, fileobj):
         for key in self.model.keys():
-            if key is not 'unparsed' and self.model[key] is not None:
-                s += str(self.model[key])
+            if key != 'unparsed' and self.model[key] is not None:
+                if isinstance(self.model[key], YMLModelObject):
+                    self.model[key].write_to(fileobj)
+                else:
+                    # 以字符串给出的块直接输出
+                    fileobj.write(str(self.model[key]))
         for card in self.model['unparsed']:
-            s += card + '\n\n'
-        return s
+            fileobj.write(card + '\n\n')
+
+    def is_dirty(self):
+        return any(block.is_dirty() for key, block in self.model.items()
+                   if key != 'unparsed' and isinstance(block, YMLModelObject))
+
+    def serialized(self):
+        return str(self)
+
+    def __str__(self):
+        s = io.StringIO()
+        self.write_to(s)
+        return s.getvalue()
 
     @property
     def geometry(self):
@@ -0,0 +1,157 @@
+# -*- coding:utf-8 -*-
+# author: agent
+# date: 2026-10-18
+
+import os
+import glob
+import pickle
+import hashlib
+from collections import OrderedDict
+
+
+def _source_stamp():
+    """
+    Hash of the source files of the parser and the input models, so that the cached models
+    are not reused after the parser or the models are changed.
+    :return: hex digest of the source files.
+    """
+    rmc_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = [os.path.join(rmc_dir, 'parser', 'PlainParser.py'),
+               os.path.join(rmc_dir, 'modifier', 'formatter', 'PlainFormatter.py')]
+    sources += sorted(glob.glob(os.path.join(rmc_dir, 'model', 'input', '*.py')))
+    md5 = hashlib.md5()
+    for source in sources:
+        with open(source, 'rb') as f:
+            md5.update(f.read())
+    return md5.hexdigest()
+
+
+class ParseCache:
+    """
+    Cache of the parsed RMC input models, keyed by the hash of the input file content.
+
+    The models are pickled, the pickled bytes are kept in memory (at most max_entries models)
+    and in the cache directory on disk (at most max_size bytes). When the limits are exceeded,
+    the least recently used models are removed. A new model object is unpickled for each get,
+    so the models returned can be modified freely.
+    """
+    _stamp = None
+
+    def __init__(self, cache_dir=None, max_entries=32, max_size=256 * 1024 * 1024):
+        """
+        :param cache_dir: directory of the pickled models, None to keep the models in memory only.
+        :param max_entries: maximum number of the models kept in memory.
+        :param max_size: maximum size in bytes of the pickled models in the cache directory.
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._memory = OrderedDict()
+
+    def key(self, inp):
+        """
+        :param inp: the input file name.
+        :return: the key of the input file, or None if the file can not be read.
+        """
+        if ParseCache._stamp is None:
+            ParseCache._stamp = _source_stamp()
+        try:
+            with open(inp, 'rb') as f:
+                content = f.read()
+        except OSError:
+            return None
+        sha = hashlib.sha256(ParseCache._stamp.encode())
+        sha.update(content)
+        return sha.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def get(self, key):
+        """
+        :param key: the key of the input file.
+        :return: the parsed model, or None if it is not cached.
+        """
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        elif self.cache_dir is not None:
+            try:
+                with open(self._file(key), 'rb') as f:
+                    data = f.read()
+                # 更新修改时间，用于最近最少使用的清理
+                os.utime(self._file(key))
+            except OSError:
+                return None
+            self._remember(key, data)
+        else:
+            return None
+
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # 损坏的缓存文件，丢弃后重新解析
+            self.discard(key)
+            return None
+
+    def put(self, key, model):
+        """
+        :param key: the key of the input file.
+        :param model: the parsed model.
+        """
+        data = pickle.dumps(model, pickle.HIGHEST_PROTOCOL)
+        self._remember(key, data)
+        if self.cache_dir is None:
+            return
+        try:
+            # 缓存的模型由pickle加载，缓存目录只允许当前用户访问
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            # 先写入临时文件再改名，避免并行计算时读到不完整的文件
+            tmp_file = self._file(key) + '.%d.tmp' % os.getpid()
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, self._file(key))
+            self._shrink()
+        except OSError as e:
+            print('Warning: the parsed model can not be cached: ' + str(e))
+
+    def discard(self, key):
+        self._memory.pop(key, None)
+        if self.cache_dir is not None and os.path.exists(self._file(key)):
+            os.remove(self._file(key))
+
+    def clear(self):
+        self._memory.clear()
+        if self.cache_dir is not None:
+            for file in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+                os.remove(file)
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _shrink(self):
+        files = []
+        total_size = 0
+        for file in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+            total_size += stat.st_size
+        files.sort()
+        for mtime, size, file in files:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            total_size -= size
+
+
+# 默认只在内存中缓存；设置环境变量RMC_PARSE_CACHE为缓存目录时，解析结果同时保存在磁盘上供之后的计算使用
+default_cache = ParseCache(cache_dir=os.environ.get('RMC_PARSE_CACHE') or None)
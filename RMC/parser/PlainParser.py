@@ -15,11 +15,17 @@ from RMC.model.input.Material import *
 from RMC.model.input.Mesh import *
 from RMC.model.input.Tally import *
 from RMC.model.input.base import Model as InputModel
+from RMC.parser.ParseCache import default_cache
 
 
 class PlainParser:
-    def __init__(self, inp):
+    def __init__(self, inp, cache=default_cache):
+        """
+        :param inp: the RMC input file.
+        :param cache: the ParseCache of the parsed models, None to parse without cache.
+        """
         self.inp = inp
+        self.cache = cache
         # block list
         self.content = ""
         self.parsed_model = InputModel()
@@ -37,6 +43,18 @@ class PlainParser:
     def parsed(self):
         if self._is_parsed:
             return self.parsed_model
+
+        # 输入卡内容未改变时，直接使用缓存的解析结果
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(self.inp)
+            if cache_key is not None:
+                cached_model = self.cache.get(cache_key)
+                if cached_model is not None:
+                    self.parsed_model = cached_model
+                    self._is_parsed = True
+                    return self.parsed_model
+
         self._read_in()
         self._prepare()
         for cards in self.content:
@@ -103,6 +121,8 @@ class PlainParser:
 
         self.parsed_model.postprocess()
         self._is_parsed = True
+        if cache_key is not None:
+            self.cache.put(cache_key, self.parsed_model)
         return self.parsed_model
 
     @staticmethod
@@ -204,14 +224,18 @@ class PlainParser:
     @staticmethod
     def __parse_criticality(content):
         max_iteration = None
+        couple_options = {}
         unparsed = ''
         for option in content:
             if option.split()[0].upper() == 'COUPLE':
-                max_iteration = PlainParser._parse_options(option.split(' ', 1)[1],
-                                                           Criticality.card_option_types)['MAXITERATION']
+                couple_options = PlainParser._parse_options(option.split(' ', 1)[1],
+                                                            Criticality.card_option_types)
+                max_iteration = couple_options.pop('MAXITERATION')
             else:
                 unparsed += option + '\n'
-        return Criticality(max_iteration=max_iteration, unparsed=unparsed)
+        # 其余的耦合选项为松弛与收敛判断的参数
+        kwargs = {key.lower(): value for key, value in couple_options.items()}
+        return Criticality(max_iteration=max_iteration, unparsed=unparsed, **kwargs)
 
     @staticmethod
     def __parse_criticalitysearch(content):
@@ -0,0 +1,93 @@
+# -*- coding:utf-8 -*-
+# author: agent
+# date: 2026-10-18
+
+import os
+import re
+
+import yaml
+
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+# The status file is a yaml mapping with a single key RMC, whose value is a list of the cycles:
+#     RMC:
+#     - cycle:
+#       - burnup: ...
+#       - output: inp.FMTinp.step1
+# Every top-level list item starts at the beginning of a line with '- '.
+_ENTRY = re.compile(rb'^- ', re.M)
+
+
+class StatusParser:
+    """
+    Incremental parser of the status file printed by RMC.
+
+    The status file grows with every burnup step and cycle. Only the cycles appended since the
+    last update are parsed: the finished cycles are counted once and forgotten, and only the
+    last cycle, which may still be written by RMC, is parsed again on each update.
+    The file is parsed from the beginning again if it is replaced or truncated.
+    """
+
+    def __init__(self, file_name):
+        """
+        :param file_name: the status file.
+        """
+        self.file = file_name
+        self.reset()
+
+    def reset(self):
+        self.cycles = 0  # number of the finished cycles
+        self.steps = 0  # number of the steps in the finished cycles
+        self.last_cycle = None  # the last cycle, which may be unfinished
+        self._offset = 0  # position of the last cycle in the file
+        self._identity = None
+
+    def update(self):
+        """
+        Parse the cycles appended since the last update.
+        :return: self.
+        """
+        info = os.stat(self.file)
+        identity = (info.st_dev, info.st_ino)
+        if identity != self._identity or info.st_size < self._offset:
+            self.reset()
+            self._identity = identity
+
+        with open(self.file, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # the line being written is left to the next update
+        data = data[:data.rfind(b'\n') + 1]
+
+        starts = [match.start() for match in _ENTRY.finditer(data)]
+        if not starts:
+            return self
+        if len(starts) > 1:
+            # all the cycles except the last one are finished, the header is skipped
+            for entry in yaml.load(data[starts[0]:starts[-1]], Loader):
+                self.cycles += 1
+                self.steps += len(entry['cycle']) - 1
+        self._offset += starts[-1]
+        self.last_cycle = yaml.load(data[starts[-1]:], Loader)[0]['cycle']
+        return self
+
+    @property
+    def step(self):
+        """
+        :return: number of the finished steps, the last cycle counts only if it has the output.
+        """
+        if self.last_cycle is not None and 'output' in self.last_cycle[-1]:
+            return self.steps + len(self.last_cycle) - 1
+        return self.steps
+
+    @property
+    def output(self):
+        """
+        :return: the output file of the last cycle, None if it is not finished.
+        """
+        if self.last_cycle is None:
+            return None
+        return self.last_cycle[-1].get('output')
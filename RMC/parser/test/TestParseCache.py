@@ -0,0 +1,75 @@
+from unittest import TestCase, mock
+
+from RMC.parser.ParseCache import ParseCache
+from RMC.parser.PlainParser import PlainParser
+import os
+import importlib
+import shutil
+import tempfile
+
+
+class TestParseCache(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.work_dir, 'cache')
+        self.inp = os.path.join(self.work_dir, 'inp')
+        shutil.copy('resources/inp', self.inp)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_cached(self):
+        reference = str(PlainParser(self.inp, cache=None).parsed)
+
+        cache = ParseCache(self.cache_dir)
+        model = PlainParser(self.inp, cache=cache).parsed
+        self.assertEqual(str(model), reference)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # the cached model is not changed by the modification of the returned model
+        model['unparsed'].append('MODIFIED')
+        model = PlainParser(self.inp, cache=cache).parsed
+        self.assertEqual(str(model), reference)
+
+        # a new cache, like in a separate run, loads the model from the disk
+        model = PlainParser(self.inp, cache=ParseCache(self.cache_dir)).parsed
+        self.assertEqual(str(model), reference)
+
+        # the changed input is parsed again
+        with open(self.inp, 'a') as f:
+            f.write('\nPRINT\nmat 1\n')
+        model = PlainParser(self.inp, cache=cache).parsed
+        self.assertNotEqual(str(model), reference)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_lru(self):
+        cache = ParseCache(self.cache_dir, max_entries=2, max_size=250)
+        for index in range(4):
+            cache.put('key%d' % index, 'x' * 100)
+            os.utime(os.path.join(self.cache_dir, 'key%d.pkl' % index), (index, index))
+        self.assertEqual(list(cache._memory.keys()), ['key2', 'key3'])
+        self.assertEqual(cache.get('key3'), 'x' * 100)
+        self.assertIsNone(cache.get('key0'))
+        self.assertTrue(sum(os.path.getsize(os.path.join(self.cache_dir, file))
+                            for file in os.listdir(self.cache_dir)) <= 250)
+
+        with open(os.path.join(self.cache_dir, 'broken.pkl'), 'wb') as f:
+            f.write(b'broken')
+        self.assertIsNone(cache.get('broken'))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'broken.pkl')))
+
+    def test_default(self):
+        import RMC.parser.ParseCache as ParseCacheModule
+        try:
+            # the parsed models are kept in memory only, unless a cache directory is given
+            with mock.patch.dict(os.environ):
+                os.environ.pop('RMC_PARSE_CACHE', None)
+                self.assertIsNone(importlib.reload(ParseCacheModule).default_cache.cache_dir)
+                os.environ['RMC_PARSE_CACHE'] = self.cache_dir
+                self.assertEqual(importlib.reload(ParseCacheModule).default_cache.cache_dir, self.cache_dir)
+        finally:
+            importlib.reload(ParseCacheModule)
+
+        cache = ParseCache(self.cache_dir)
+        cache.put('key', 'x')
+        self.assertEqual(os.stat(self.cache_dir).st_mode & 0o777, 0o700)
@@ -1,8 +1,11 @@
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 
 from RMC.parser.PlainParser import PlainParser
 import filecmp
 import os
+import time
+import tempfile
+import numpy as np
 
 
 class TestPlainParser(TestCase):
@@ -27,3 +30,83 @@ class TestPlainParser(TestCase):
         self.assertEqual(model['geometry'].cell_dict[1].count_cell(3), 3)
         self.assertEqual(model['geometry'].cell_dict[1].count_cell(2), 0)
         self.assertEqual(model['geometry'].cell_dict[2].count_cell(5), 0)
+
+    def test_count_cell_table(self):
+        model = PlainParser('resources/inp').parsed
+        geometry = model['geometry']
+        for univ in geometry.universes:
+            for cell in geometry.cell_dict:
+                self.assertEqual(geometry.count_cell(univ, cell), univ.count_cell(cell))
+        self.assertEqual(geometry.count_cell(0, 3), 3)
+        histogram = geometry.get_univ(8).lattice.histogram()
+        self.assertEqual(histogram, {1: 3, 5: 1})
+        self.assertIs(geometry.get_univ(8).lattice.histogram(), histogram)
+
+        # the table is kept until it is invalidated after the filling is changed
+        geometry.get_univ(8).lattice.fill[0] = 5
+        self.assertEqual(geometry.count_cell(0, 3), 3)
+        geometry.invalidate_counts()
+        self.assertEqual(geometry.count_cell(0, 3), 2)
+        self.assertEqual(geometry.count_cell(0, 8), 2)
+        self.assertEqual(geometry.get_univ(0).count_cell(3), 2)
+        # the caches are not pickled, and do not change the serialized text
+        self.assertNotIn('_histogram', geometry.get_univ(8).lattice.__getstate__())
+        self.assertNotIn('_counts', geometry.__getstate__())
+        lattice = geometry.get_univ(8).lattice
+        lattice.serialized()
+        lattice.histogram()
+        self.assertFalse(lattice.is_dirty())
+
+    @skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_count_cell_benchmark(self):
+        # 241 assemblies of 17 * 17 rods, with 8 types of the assemblies
+        rng = np.random.RandomState(0)
+        core = np.where(rng.rand(17 * 17) < 241 / 289, rng.randint(11, 19, 17 * 17), 5)
+        content = 'UNIVERSE 0\ncell 1  -1  fill = 8\n\n'
+        content += 'UNIVERSE 8  lat = 1  pitch = 21.5 21.5 1  scope = 17 17 1  fill =\n'
+        content += ''.join('  ' + ' '.join(map(str, core[i:i + 17])) + '\n' for i in range(0, 289, 17)) + '\n'
+        # {assembly: {cell: number of the instances}}, rods of universe 1 have cells 3 and 4, universe 5 has cell 7
+        expected = {}
+        for assembly in range(11, 19):
+            rods = np.where(rng.rand(17 * 17) < 0.1, 5, 1)
+            expected[assembly] = {3: np.sum(rods == 1), 4: np.sum(rods == 1), 7: np.sum(rods == 5)}
+            content += 'UNIVERSE %d  lat = 1  pitch = 1.26 1.26 1  scope = 17 17 1  fill =\n' % assembly
+            content += ''.join('  ' + ' '.join(map(str, rods[i:i + 17])) + '\n' for i in range(0, 289, 17)) + '\n'
+        content += 'UNIVERSE 1\ncell 3  -1  mat = 1\ncell 4  1  mat = 2\n\n'
+        content += 'UNIVERSE 5\ncell 7  -1  mat = 2\n\nSURFACE\nsurf 1 cz 0.4\n'
+        expected[0] = {cell: sum(expected[assembly][cell] for assembly in core if assembly != 5) for cell in [3, 4]}
+        expected[0][7] = np.sum(core == 5) + sum(expected[assembly][7] for assembly in core if assembly != 5)
+        with tempfile.TemporaryDirectory() as work_dir:
+            inp = os.path.join(work_dir, 'inp')
+            with open(inp, 'w') as f:
+                f.write(content)
+            geometry = PlainParser(inp).parsed['geometry']
+
+        # like Refuel._do_refuel, for each new assembly and each burnable cell, and the whole core
+        queries = [[univ, cell] for univ in range(11, 19) for cell in [3, 4, 7]] * 10 + [[0, 3], [0, 7]] * 10
+        start = time.time()
+        recursion = [geometry.get_univ(univ).count_cell(cell) for univ, cell in queries]
+        recursion_time = time.time() - start
+        start = time.time()
+        table = [geometry.count_cell(univ, cell) for univ, cell in queries]
+        table_time = time.time() - start
+        self.assertEqual(table, [expected[univ][cell] for univ, cell in queries])
+        self.assertEqual(recursion, table)
+        print('%d queries, recursion: %.4fs, table: %.4fs' % (len(queries), recursion_time, table_time))
+
+    def test_couple_options(self):
+        with open('resources/inp') as f:
+            content = f.read()
+        content = content.replace('CRITICALITY\n', 'CRITICALITY\nCouple maxiteration=5 relaxation=Aitken '
+                                                    'weight=0.8 tolerance=1e-3 norm=Linf\n', 1)
+        with tempfile.TemporaryDirectory() as work_dir:
+            inp = os.path.join(work_dir, 'inp')
+            with open(inp, 'w') as f:
+                f.write(content)
+            criticality = PlainParser(inp, cache=None).parsed['criticality']
+        self.assertEqual(criticality.max_iteration, 5)
+        relaxation = criticality.couple_relaxation()
+        self.assertEqual([relaxation.scheme, relaxation.weight, relaxation.tolerance, relaxation.norm],
+                         ['aitken', 0.8, 1e-3, 'LINF'])
+        # 耦合选项不输出到RMC的输入卡中
+        self.assertNotIn('Couple', str(criticality))
@@ -0,0 +1,97 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from RMC.parser.StatusParser import StatusParser
+from RMC.parser.YMLParser import YMLParser
+
+
+def cycle_entry(steps, finished=True):
+    entry = '- cycle:\n'
+    for step in range(1, steps + 1):
+        entry += '  - burnup:\n      step: {}\n      output: inp.FMTinp.step{}\n      status: done\n'.format(step, step)
+    if finished:
+        entry += '  - output: inp.FMTinp.step{}\n'.format(steps)
+    return entry
+
+
+def full_step(status_file):
+    """the original counting in RMCController.check, which parses the whole file"""
+    status = YMLParser(status_file).parsed['RMC']
+    step = 0
+    for cycle_entry in status[:-1]:
+        step += len(cycle_entry['cycle']) - 1
+    last_cycle = status[-1]['cycle']
+    if 'output' in last_cycle[-1]:
+        step += len(last_cycle) - 1
+    return step
+
+
+class TestStatusParser(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.status_file = os.path.join(self.work_dir, 'status.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def append(self, content):
+        with open(self.status_file, 'a') as f:
+            f.write(content)
+
+    def test_resource(self):
+        status = StatusParser('../../controller/test/resources/status.txt').update()
+        self.assertEqual(status.step, 1)
+        self.assertEqual(status.output, 'refuelling/inp.FMTinp.step1')
+
+    def test_incremental(self):
+        self.append('RMC:\n')
+        status = StatusParser(self.status_file)
+        self.assertEqual(status.update().step, 0)
+        self.assertIsNone(status.output)
+
+        for cycle in range(1, 6):
+            self.append(cycle_entry(cycle, finished=False))
+            self.assertIsNone(status.update().output)
+            self.append('  - output: inp.FMTinp.step{}\n'.format(cycle))
+            self.assertEqual(status.update().step, full_step(self.status_file))
+            self.assertEqual(status.output, 'inp.FMTinp.step{}'.format(cycle))
+        self.assertEqual(status.cycles, 4)
+
+        # an unfinished line is left to the next update
+        self.append('- cycle:\n  - burnup:\n      st')
+        self.assertEqual(status.update().step, 15)
+        self.append('ep: 1\n')
+        self.assertEqual(status.update().step, 15)
+        self.assertIsNone(status.output)
+
+        # the status file of a new calculation
+        with open(self.status_file, 'w') as f:
+            f.write('RMC:\n' + cycle_entry(2))
+        self.assertEqual(status.update().step, 2)
+        self.assertEqual(status.cycles, 0)
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_benchmark(self):
+        self.append('RMC:\n')
+        status = StatusParser(self.status_file)
+        full_time = 0
+        incremental_time = 0
+        for cycle in range(50):
+            self.append(cycle_entry(5))
+            start = time.time()
+            step = full_step(self.status_file)
+            full_time += time.time() - start
+            start = time.time()
+            self.assertEqual(status.update().step, step)
+            incremental_time += time.time() - start
+        print('full: %.4fs, incremental: %.4fs, libyaml: %s' % (full_time, incremental_time, yaml.__with_libyaml__))
+        self.assertLess(incremental_time, full_time)
+
+
+if __name__ == '__main__':
+    unittest.main()
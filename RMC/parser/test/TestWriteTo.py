@@ -0,0 +1,110 @@
+from unittest import TestCase, skipUnless
+
+from RMC.parser.PlainParser import PlainParser
+from RMC.model.input.Geometry import Geometry, Universe, Cell, Lattice
+import os
+import io
+import time
+import numpy as np
+
+
+class TestWriteTo(TestCase):
+    def test_write_to(self):
+        model = PlainParser('resources/inp', cache=None).parsed
+        reference = str(model)
+        f = io.StringIO()
+        model.write_to(f)
+        self.assertEqual(f.getvalue(), reference)
+        self.assertFalse(model.is_dirty())
+
+        # attributes changed
+        cell = model['geometry'].get_cell(2)
+        cell.void = False
+        cell.material = 5
+        self.assertTrue(model.is_dirty())
+        self.assertTrue(cell.is_dirty())
+        self.assertFalse(model['geometry'].get_cell(1).is_dirty())
+        self.assertIn('CELL 2 -6 : 7 : -8 : 9 mat=5\n', str(model))
+        self.assertFalse(model.is_dirty())
+
+        # lattice filling changed in place
+        lattice = model['geometry'].get_univ(8).lattice
+        lattice.fill[0] = 9
+        self.assertTrue(model.is_dirty())
+        f = io.StringIO()
+        model.write_to(f)
+        self.assertIn('FILL=\n 9', f.getvalue())
+        self.assertFalse(model.is_dirty())
+
+        # cells appended to a universe in place
+        universe = model['geometry'].get_univ(8)
+        universe.cells.append(Cell(number=99, bounds='-1', material=3))
+        self.assertTrue(universe.is_dirty())
+        f = io.StringIO()
+        model.write_to(f)
+        self.assertIn('CELL 99 -1 mat=3', f.getvalue())
+
+        # a surface changed through the parent block
+        surfaces = model['surface']
+        surfaces.serialized()
+        surfaces.surfaces[0].parameters = [1.5]
+        self.assertTrue(surfaces.is_dirty())
+        self.assertIn('SURF 1 CZ 1.5\n', surfaces.serialized())
+        self.assertFalse(model.is_dirty())
+
+        # a block given as plain text
+        model.model['plot'] = 'PLOT Continue-calculation = 1\n'
+        self.assertFalse(model.is_dirty())
+        self.assertIn('PLOT Continue-calculation = 1\n', str(model))
+
+    def test_lattice_fill(self):
+        lattice = Lattice(type=1, scope=[6, 2, 1], pitch=[1.0, 1.0, 1.0],
+                          fill=[1, 1, 1, 1, 2, 3, 10, 10, 10, 10, 10, 4])
+        self.assertEqual(str(lattice), 'LAT=1 SCOPE=6 2 1 PITCH=1.000000 1.000000 1.000000 FILL=\n'
+                                       ' 1 * 4 2 3\n 10 * 5 4')
+        lattice.fill = np.ones(12, dtype=int) * 7
+        self.assertEqual(str(lattice), 'LAT=1 SCOPE=6 2 1 PITCH=1.000000 1.000000 1.000000 FILL=7 * 12')
+        # without the scope, the filling is written in one line
+        lattice = Lattice(type=1, fill=[1, 1, 1, 1, 2, 3])
+        self.assertEqual(str(lattice), 'LAT=1 SCOPE=0 0 0 PITCH=0.000000 0.000000 0.000000 FILL=\n 1 * 4 2 3')
+
+        # the repeated universes are expanded again by the parser
+        [fill, index] = PlainParser._parse_list(['FILL'] + '1 * 4 2 3 10 * 5 4'.split(), int)
+        self.assertEqual(fill, [1, 1, 1, 1, 2, 3, 10, 10, 10, 10, 10, 4])
+
+    @skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_lattice_benchmark(self):
+        """Large lattices are streamed by chunks."""
+        rng = np.random.RandomState(0)
+        for number in [300000, 3000000]:
+            fill = rng.randint(1, 4, number)
+            lattice = Lattice(type=1, scope=[17, 17, number // 289], pitch=[1.26, 1.26, 1.0], fill=fill)
+            f = io.StringIO()
+            start = time.time()
+            lattice.write_to(f)
+            print('%d universes: %.3fs' % (number, time.time() - start))
+            [parsed, index] = PlainParser._parse_list(['FILL'] + f.getvalue().split('FILL=')[1].split(), int)
+            self.assertTrue(np.array_equal(parsed, fill))
+
+    @skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_write_benchmark(self):
+        """A full-core lattice with 300k elements is serialized once, and reused when unchanged."""
+        fill = np.tile(np.arange(1, 4), 100000)
+        lattice = Lattice(type=1, scope=[100, 100, 30], pitch=[1.26, 1.26, 10.0], fill=fill)
+        universes = [Universe(number=0, cells=[Cell(number=1, bounds='-1', fill=10)]),
+                     Universe(number=10, lattice=lattice)]
+        for uid in range(1, 4):
+            universes.append(Universe(number=uid, cells=[Cell(number=uid + 1, bounds='-2', material=uid)]))
+        geometry = Geometry(universes)
+
+        times = []
+        for index in range(3):
+            if index == 2:
+                universes[2].cells[0].material = 4
+            f = io.StringIO()
+            start = time.time()
+            geometry.write_to(f)
+            times.append(time.time() - start)
+        print('first write: %.3fs, unchanged: %.4fs, one cell changed: %.4fs' % tuple(times))
+        self.assertLess(times[1], times[0])
+        self.assertLess(times[2], times[0])
@@ -12,25 +12,35 @@
 >>> commands = "mpirun -n {n_mpi} {exec} {inp} -s {n_threads}"
 >>> RMC.run_file_proc(inp='pwr_pin', n_mpi=2, n_threads=2, commands=commands)
 
+多方案的输入卡在MultiParainps中各自的工作目录下并行计算，同时占用的CPU核数不超过max_cores；
+resume=True时跳过已经完成的方案，接续中断的计算；sampling为'random'或者'lhs'时只计算samples个抽样的方案：
+
+>>> RMC.run_file_proc(inp='sweep', n_mpi=4, n_threads=2, max_cores=64, resume=True)
+>>> RMC.run_file_proc(inp='sweep', n_mpi=4, max_cores=64, sampling='lhs', samples=50, seed=1)
+
 """
 
 import RMC.FileProcess.MultiPara as MP
-import RMC.FileProcess.ConstNum as CN
 import RMC.FileProcess.VarNum as VN
-import RMC.FileProcess.FomulaCal as FC
-import RMC.FileProcess.Base as FB
+from RMC.FileProcess.Pipeline import Pipeline
+from RMC.FileProcess.Scheduler import Scheduler, Case, case_cores, prepare_work_dir
+from functools import partial
 import os
-import shutil
 import RMC
 import re
 import sys
+import json
+
+# 多方案计算中，记录方案实际使用的变量的文件
+VARIABLES_FILE = 'variables.json'
+# 多方案计算中，记录方案输入卡预处理各步骤所用时间的文件
+TIMINGS_FILE = 'timings.json'
 
 
 class JobFileProc:
     def __init__(self, **kwargs):
         self._file_name = os.path.abspath(kwargs['inp'])
         self._kwargs = kwargs
-        self._archive_time = {}
         if 'run' in kwargs.keys():  # 是否在处理输入卡后执行计算，默认执行
             self._run = kwargs['run']
         else:
@@ -39,53 +49,36 @@ class JobFileProc:
             self._kwargs['status'] = None
         if 'archive_dir' not in kwargs.keys():  # 提供archive_dir的初值
             self._kwargs['archive_dir'] = os.path.join(os.getcwd(), 'output')
+        # 多方案并行计算时同时占用的CPU核数上限，默认为本机的CPU数
+        self._max_cores = self._kwargs.pop('max_cores', None)
+        # 是否跳过已经完成的方案，接续中断的多方案计算
+        self._resume = self._kwargs.pop('resume', False)
+        # 多方案的抽样方式，见RMC.FileProcess.MultiPara.SAMPLINGS
+        self._sampling = self._kwargs.pop('sampling', 'product')
+        self._samples = self._kwargs.pop('samples', None)
+        self._seed = self._kwargs.pop('seed', None)
 
     def run(self):
         multi_process = MP.MultiPara(self._file_name)
-        multi_state = multi_process.devide()
+        multi_state = multi_process.analyse()
 
         if multi_state.falseformat:
             print('Multi-value variable format error. Exiting...')
         else:
             try:
                 if multi_state.processed:
-                    # shutil.copyfile('./xsdir', os.path.join(os.getcwd(), 'MultiParainps/xsdir'))
-                    # os.chdir(os.path.join(os.getcwd(), 'MultiParainps'))
-                    for filename in os.listdir(os.path.join(os.getcwd(), 'MultiParainps')):
-                        if re.match(r'.*inp\d+', filename) and not re.search(r'\.', filename):
-                            print('Processing ' + filename)
-                            dirpath = os.getcwd()
-                            # self._pre_scan(dirpath)
-                            shutil.copyfile(os.path.join(os.getcwd(), 'MultiParainps', filename),
-                                            os.path.join(os.getcwd(), filename))
-                            const_process = CN.ConstNum(filename)
-                            const_process.repconstnum()
-                            var_process = VN.VarNum(filename)
-                            var_process.repvar()
-                            fomula_process = FC.FomulaCal(filename)
-                            fomula_process.calfomula()
-                            if self._run:
-                                print(' Start calculating...')
-                                self._kwargs.pop('run', 1)
-                                self._kwargs['inp'] = os.path.abspath(filename)
-                                self._kwargs['archive_dir'] = os.path.join(os.getcwd(), 'MultiParainps',
-                                                                           filename + '-output')
-                                try:
-                                    RMC.run(commands=None, **self._kwargs)
-                                except Exception as e:
-                                    print(str(e) + ' Exe running error. Exiting...')
-                                    sys.exit(1)
-                            os.remove(filename)
-                            # self._post_mv(dirpath, os.path.join(os.getcwd(), 'MultiParainps', filename))
+                    # 方案的输入卡边生成边计算
+                    case_files = multi_process.iter_cases(not self._resume, self._sampling,
+                                                          self._samples, self._seed)
+                    failed = self._run_cases(case_files)
+                    if failed:
+                        print('Cases {} failed. Exiting...'.format(', '.join(failed)))
+                        sys.exit(1)
                 else:
                     process_filename = self._file_name + '_cal'
-                    shutil.copyfile(self._file_name, process_filename)
-                    const_process = CN.ConstNum(process_filename)
-                    const_process.repconstnum()
-                    var_process = VN.VarNum(process_filename)
-                    var_process.repvar()
-                    fomula_process = FC.FomulaCal(process_filename)
-                    fomula_process.calfomula()
+                    pipeline = Pipeline()
+                    pipeline.process_file(self._file_name, process_filename)
+                    print(pipeline.report())
                     self._kwargs['inp'] = process_filename
                     self._kwargs['archive_dir'] = os.path.join(os.getcwd(), process_filename + '-output')
                     if self._run:
@@ -100,21 +93,73 @@ class JobFileProc:
                 print(str(e) + ' Format error. Exiting...')
                 sys.exit(1)
 
-    def _move_files(self, filename):
-        outputsuffixs = ['.Adjoint', '.out', '.Tally', '.material']
-        outputfiles = [filename + suffix for suffix in outputsuffixs]
-        for file in outputfiles:
-            if file in os.listdir():
-                shutil.copyfile(file, os.path.join(os.getcwd(), 'MultiParainps', file))
-                os.remove(file)
-        shutil.copyfile(filename, os.path.join(os.getcwd(), 'MultiParainps', filename))
-        os.remove(filename)
-
-    def _pre_scan(self, dir):
-        FB.Base.archive_pre_scan(dir, self._archive_time)
-
-    def _post_mv(self, workdir, dest):
-        FB.Base.archive_post_mv(workdir, dest, self._archive_time)
+    def _run_cases(self, case_files):
+        """
+        在各自的工作目录中并行计算各个方案，计算结果存放在MultiParainps/inpN-output中
+
+        :param case_files: 方案输入卡MultiParainps/inpN的生成器
+        :return: 失败的方案名列表
+        """
+        source_dir = os.path.dirname(self._file_name)
+        kwargs = dict(self._kwargs)
+        kwargs.pop('run', None)
+        cores = case_cores(**kwargs)
+        # 源目录中的截面库等文件链接到工作目录中，不包括多方案的原始输入卡
+        excludes = [os.path.basename(self._file_name)] + \
+            [filename for filename in os.listdir(source_dir) if re.fullmatch(r'.*inp\d+', filename)]
+
+        work_dirs = []
+
+        def cases():
+            for case_file in case_files:
+                multi_dir, filename = os.path.split(case_file)
+                work_dir = os.path.join(multi_dir, filename + '-work')
+                work_dirs.append(work_dir)
+                case_kwargs = dict(kwargs)
+                case_kwargs['inp'] = os.path.join(work_dir, filename)
+                case_kwargs['archive_dir'] = os.path.join(multi_dir, filename + '-output')
+                # 换料时重排材料文件的进程数不超过方案占用的核数
+                case_kwargs['refuel_processes'] = cores
+                setup = partial(prepare_work_dir, work_dir, source_dir, excludes)
+                yield Case(filename, case_file, work_dir, os.path.join(multi_dir, filename + '.done'),
+                           _process_case, (filename, case_file, case_kwargs, self._run), cores, setup)
+
+        results = Scheduler(self._max_cores).run(cases(), resume=self._resume)
+        print(_sweep_timings(work_dirs).report())
+        return [name for name, result in results.items() if result == 'failed']
+
+
+def _process_case(filename, source, kwargs, run):
+    """
+    在方案的工作目录中处理输入卡，并执行计算。
+    方案实际使用的变量及其值记录在工作目录下的variables.json中，该文件相同的方案计算结果相同；
+    预处理各步骤所用的时间记录在timings.json中
+    """
+    print('Processing ' + filename)
+    pipeline = Pipeline()
+    pipeline.process_file(source, filename)
+    with open(VARIABLES_FILE, 'w') as f:
+        json.dump(pipeline.stage(VN.VarNum).used_variables, f, indent=1, sort_keys=True)
+    with open(TIMINGS_FILE, 'w') as f:
+        json.dump(pipeline.timings, f)
+    if run:
+        print(' Start calculating...')
+        RMC.run(commands=None, **kwargs)
+
+
+def _sweep_timings(work_dirs):
+    """
+    :param work_dirs: 各个方案的工作目录
+    :return: 累加了各个方案预处理时间的Pipeline
+    """
+    pipeline = Pipeline()
+    for work_dir in work_dirs:
+        try:
+            with open(os.path.join(work_dir, TIMINGS_FILE)) as f:
+                pipeline.merge_timings(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return pipeline
 
 
 def run_file_proc(**kwargs):
@@ -138,6 +183,11 @@ def _argparse():
     parser.add_argument("--archive_dir", default=None)
     parser.add_argument("--run", default=True, type=bool)
     parser.add_argument("--proc_per_node", default=None)
+    parser.add_argument("--max_cores", default=None, type=int)
+    parser.add_argument("--resume", action='store_true')
+    parser.add_argument("--sampling", default='product', choices=MP.SAMPLINGS)
+    parser.add_argument("--samples", default=None, type=int)
+    parser.add_argument("--seed", default=None, type=int)
     args = parser.parse_args()
     commands = {}
     commands['exec'] = args.exec
@@ -153,6 +203,11 @@ def _argparse():
     commands['archive_dir'] = args.archive_dir
     commands['run'] = args.run
     commands['proc_per_node'] = args.proc_per_node
+    commands['max_cores'] = args.max_cores
+    commands['resume'] = args.resume
+    commands['sampling'] = args.sampling
+    commands['samples'] = args.samples
+    commands['seed'] = args.seed
     return commands
 
 
@@ -15,15 +15,19 @@ Examples:
 
 """
 
+import sys
 import time
 import subprocess
 from numbers import Integral
+from collections import deque
 
 from RMC.controller.rmc import RMCController
 from RMC.controller.rmc import FakeRMC
 from RMC.controller.ctf import FakeCTF
 from RMC.controller.ctf import FakeCTFPreproc
 from RMC.util.CoupleUtils import power_ave
+from RMC.util.ProcessOutput import RotatingLog, open_process, stream_lines
+from RMC.util.ArchiveStore import ArchiveStore, default_store
 import os
 
 
@@ -52,18 +56,36 @@ class Job(object):
         Whether this run is a continuous one after the previous one
     archive_dir : str
         Path to the directory that contains output / modified files
+    archive_store : str
+        Path to the content-addressed store of the archived files, which are
+        hard linked into archive_dir. '.store' beside archive_dir if None
     platform : str
         Platform of the computer / server. 'linux' or 'tianhe'
     ctf_n_mpi : int
         Number of MPI processes for ctf
     proc_per_node : int
         Number of CPUs for each calculation node of HPC
+    relaxation : RMC.util.CoupleConvergence.Relaxation
+        Relaxation of the coupled power, fixed weight 0.5 if None
+    log_file : str
+        Path to the log file of the outputs of the executed commands,
+        relative to the directory of the input file. No log if None
+    log_max_bytes : int
+        Maximum size of the log file before it is rotated
+    log_backup_count : int
+        Number of the rotated log files kept
+    tail_lines : int
+        Number of the last output lines kept for the error message
+    line_callbacks : list of callable
+        Functions called with each output line, e.g. to parse keff of each cycle
     """
 
     def __init__(self, exec='RMC', inp=None, out=None, restart=None,
                  n_mpi=None, n_threads=None, cwd=None, print_screen=True,
                  status=None, conti=False, archive_dir=None, platform='linux',
-                 ctf_n_mpi=0, proc_per_node=None, **kwargs):
+                 ctf_n_mpi=0, proc_per_node=None, relaxation=None, log_file=None,
+                 log_max_bytes=100 * 1024 * 1024, log_backup_count=3, tail_lines=200,
+                 line_callbacks=None, archive_store=None, **kwargs):
         # Initialize class attributes
         self.exec = os.path.abspath(exec)
         self.dir = os.path.dirname(os.path.abspath(inp))
@@ -78,6 +100,7 @@ class Job(object):
         self.conti = conti
 
         self.archive_dir = archive_dir
+        self.archive_store = archive_store
         # 'linux', use mpiexec;
         # 'tianhe', use yhbatch & yhrun;
         # ‘yinhe', use yhbatch & yhrun;
@@ -85,6 +108,14 @@ class Job(object):
         # bscc 北京超级云计算中心 beijing super cloud computing center
         self.platform = platform
         self.ctf_n_mpi = ctf_n_mpi  # 0: shutdown; n: mpi of ctf
+        self.relaxation = relaxation
+
+        # 程序输出的处理：只在内存中保留最后的若干行，全部输出写入按大小轮换的日志文件
+        self.log_file = log_file
+        self.log_max_bytes = log_max_bytes
+        self.log_backup_count = log_backup_count
+        self.tail_lines = tail_lines
+        self.line_callbacks = list(line_callbacks) if line_callbacks is not None else []
 
         # 使用超算时，需要设置单节点的CPU数量
         # 先设置默认值
@@ -253,11 +284,20 @@ class Job(object):
                 self._archive_time_stamps[file_folder] = os.path.getmtime(file_folder)
 
     def _archive_output(self):
-        """Archive output files"""
+        """Archive output files
+
+        Each file is stored once in the content-addressed store and hard linked
+        into archive_dir, so that unchanged outputs are not copied again.
+        """
         import shutil
 
         all_file_folder = os.listdir(self.dir)
 
+        archive_store = self.archive_store
+        if archive_store is None:
+            archive_store = default_store(self.archive_dir)
+        store = ArchiveStore(archive_store)
+
         # create new archive directory
         if os.path.exists(self.archive_dir):
             print('Warning. Existing folder {} removed.'.format(self.archive_dir))
@@ -272,37 +312,55 @@ class Job(object):
             if os.path.isfile(src):
                 # case 1: new files generated
                 if src not in self._archive_time_stamps.keys():
-                    shutil.move(src, dst)
+                    store.archive(src, dst, move=True)
                 # case 2: files modified
                 else:
                     if os.path.getmtime(src) != self._archive_time_stamps[src]:
-                        shutil.copy(src, dst)
+                        store.archive(src, dst)
+
+        # 删除不再被任何存档目录使用的文件
+        store.gc()
 
     def execute(self, args):
         localtime = time.asctime(time.localtime(time.time()))
-        print('{} Command to be executed:\n'.format(localtime) + args + '\n')
+        header = '{} Command to be executed:\n'.format(localtime) + args + '\n'
+        print(header)
+
+        log = None
+        if self.log_file is not None:
+            log = RotatingLog(os.path.join(self.dir, self.log_file),
+                              self.log_max_bytes, self.log_backup_count)
+            log.write(header + '\n')
 
         # Launch a subprocess
-        p = subprocess.Popen(args, cwd=self.cwd, shell=True,
-                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                             universal_newlines=True)
-
-        # Capture and re-print output in real-time
-        lines = []
-        while True:
-            # If run is finished, break loop
-            line = p.stdout.readline()
-            if not line and p.poll() is not None:
-                break
-
-            lines.append(line)
-            if self.print_screen:
-                # If user requested output, print to screen
-                print(line, end='', flush=True)
+        p = open_process(args, cwd=self.cwd)
+
+        # Stream the output in real-time, only the last lines are kept for the error message
+        tail = deque(maxlen=self.tail_lines)
+        try:
+            for line, is_stderr in stream_lines(p):
+                tail.append(line)
+                if log is not None:
+                    log.write(line)
+                if self.print_screen:
+                    # If user requested output, print to screen
+                    print(line, end='', flush=True, file=sys.stderr if is_stderr else sys.stdout)
+                for callback in self.line_callbacks:
+                    callback(line)
+            p.wait()
+        finally:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+            for stream in [p.stdout, p.stderr]:
+                if stream is not None:
+                    stream.close()
+            if log is not None:
+                log.close()
 
         # Raise an exception if return status is non-zero
         if p.returncode != 0:
-            raise subprocess.CalledProcessError(p.returncode, args, ''.join(lines))
+            raise subprocess.CalledProcessError(p.returncode, args, ''.join(tail))
 
     def execute_rmc(self, commands=None):
         args = self.format_commands(commands)
@@ -370,7 +428,7 @@ class Job(object):
 
         if self.ctf_n_mpi > 0:
             # 当前限定使用RMC的第一个计数器（必须是符合一定格式的网格计数器）输出的HDF5文件，作为耦合文件
-            power_ave('MeshTally1.h5')
+            power_ave('MeshTally1.h5', relaxation=self.relaxation)
             self.execute_ctf()
         self.execute_rmc(commands)
 
@@ -386,7 +444,7 @@ class Job(object):
         os.chdir(self.dir)
 
         if self.ctf_n_mpi > 0:
-            power_ave('MeshTally1.h5')
+            power_ave('MeshTally1.h5', relaxation=self.relaxation)
             rmc2ctf = os.path.join(os.getcwd(), 'rmc2ctf')
             args_rmc2ctf = "{}".format(rmc2ctf)
             self.execute(args_rmc2ctf)
@@ -429,13 +487,35 @@ def run(commands=None, **kwargs):
     commands : str
         Specified string commands to be formatted by the attributes of
         :class:`RMC.Job`
+    power_shape : str
+        Power shape generated as the first guess of coupling calculations,
+        one of :data:`RMC.util.CoupleUtils.POWER_SHAPES`
+    resume : bool
+        Whether to resume an interrupted calculation from the checkpoint
+        in archive_dir
+    dry_run : bool
+        Only print the plan of all the CTF, transport and depletion
+        calculations, without running them
+    refuel_processes : int
+        Number of the processes to reshuffle the material files when
+        refuelling, the number of CPUs by default
     **kwargs
         Keyword arguments passed to :class:`RMC.Job`
 
     """
     kwargs['inp'] = os.path.abspath(kwargs['inp'])
-
-    controller = RMCController(kwargs['inp'], kwargs['archive_dir'])
+    # 各个燃耗步、耦合迭代步的存档共用一个文件库
+    kwargs.setdefault('archive_store', default_store(kwargs['archive_dir']))
+    dry_run = kwargs.pop('dry_run', False)
+
+    controller = RMCController(kwargs['inp'], kwargs['archive_dir'],
+                               power_shape=kwargs.pop('power_shape', 'sine'),
+                               resume=kwargs.pop('resume', False),
+                               dry_run=dry_run,
+                               refuel_processes=kwargs.pop('refuel_processes', None))
+    if dry_run:
+        print(controller.format_plan())
+        return
     if 'status' not in kwargs:
         print('INFO: No status file specified, simulation terminated...')
         return
@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+"""
+Content-addressed store of the archived output files.
+
+Each file is stored once under its SHA-256 digest, and the archive directory of each step
+only holds hard links to the stored files. Outputs that do not change between burnup or
+coupling steps (State.h5, MeshTally, restart files ...) therefore take no extra disk space,
+and are not written again. The archived files may be shared by several steps,
+so they should be copied (as the controller does) rather than modified in place.
+"""
+
+import os
+import shutil
+import hashlib
+import contextlib
+
+# 计算摘要时每次读入的数据量（字节）
+HASH_CHUNK_BYTES = 4 * 1024 * 1024
+# Linux中复制文件时共享数据块（reflink）的ioctl，btrfs、xfs等文件系统支持
+_FICLONE = 0x40049409
+
+
+def file_digest(file_name):
+    """
+    :param file_name: the file to be hashed.
+    :return: SHA-256 hex digest of the file content.
+    """
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def clone_file(src, dst):
+    """
+    Copy a file, sharing the data blocks (reflink) when the file system supports it.
+
+    :param src: the source file.
+    :param dst: the destination file, which should not exist.
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+            fcntl.ioctl(f_dst.fileno(), _FICLONE, f_src.fileno())
+        return
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copyfile(src, dst)
+
+
+def default_store(archive_dir):
+    """
+    :param archive_dir: the archive directory.
+    :return: the default store of the archive directory, '.store' beside it.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(archive_dir)), '.store')
+
+
+class ArchiveStore:
+    def __init__(self, root):
+        """
+        :param root: directory of the store, created if it does not exist.
+        """
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock_depth = 0
+
+    def object_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Exclusive lock of the store shared by the processes, so that gc does not remove a file
+        which is added but not linked yet. The lock can be taken again by the same object.
+        """
+        if self._lock_depth > 0:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        fd = os.open(self.root, os.O_RDONLY) if fcntl is not None else None
+        try:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            self._lock_depth = 1
+            yield
+        finally:
+            self._lock_depth = 0
+            if fd is not None:
+                # 关闭文件时释放锁
+                os.close(fd)
+
+    def add(self, src, move=False):
+        """
+        Put a file into the store. Nothing is written when the same content is already stored.
+
+        :param src: the file to be stored.
+        :param move: whether the file is moved into the store (removed from its original place),
+            otherwise it is copied.
+        :return: digest of the file.
+        """
+        digest = file_digest(src)
+        target = self.object_path(digest)
+        with self.lock():
+            if os.path.exists(target):
+                if move:
+                    os.remove(src)
+                return digest
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_file = '{}.{}.tmp'.format(target, os.getpid())
+            if move:
+                shutil.move(src, tmp_file)
+            else:
+                clone_file(src, tmp_file)
+            os.replace(tmp_file, target)
+        return digest
+
+    def link(self, digest, dst):
+        """
+        Create a hard link to a stored file, or a copy if hard links are not supported.
+
+        :param digest: digest of the stored file.
+        :param dst: path of the link.
+        """
+        with self.lock():
+            if os.path.lexists(dst):
+                os.remove(dst)
+            try:
+                os.link(self.object_path(digest), dst)
+            except OSError:
+                clone_file(self.object_path(digest), dst)
+
+    def archive(self, src, dst, move=False):
+        """
+        Archive a file into dst by way of the store.
+
+        :param src: the file to be archived.
+        :param dst: path of the archived file.
+        :param move: whether src is removed after archiving.
+        :return: digest of the file.
+        """
+        with self.lock():
+            digest = self.add(src, move)
+            self.link(digest, dst)
+        return digest
+
+    def objects(self):
+        """
+        :return: generator of the paths of all the stored files.
+        """
+        for prefix in os.listdir(self.root):
+            folder = os.path.join(self.root, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for file in os.listdir(folder):
+                yield os.path.join(folder, file)
+
+    def gc(self):
+        """
+        Remove the stored files that are no longer linked from any archive directory,
+        i.e. whose hard link count is 1, and the interrupted temporary files.
+        The store is locked, so the files being archived by other processes are kept.
+
+        :return: [number of removed files, bytes freed]
+        """
+        removed = 0
+        freed = 0
+        with self.lock():
+            for path in list(self.objects()):
+                info = os.stat(path)
+                if info.st_nlink <= 1 or path.endswith('.tmp'):
+                    os.remove(path)
+                    removed += 1
+                    freed += info.st_size
+            for prefix in os.listdir(self.root):
+                folder = os.path.join(self.root, prefix)
+                if os.path.isdir(folder) and not os.listdir(folder):
+                    os.rmdir(folder)
+        return [removed, freed]
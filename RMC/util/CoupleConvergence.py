@@ -0,0 +1,208 @@
+# -*- coding:utf-8 -*-
+"""耦合迭代中功率的松弛与收敛判断
+
+第n次耦合迭代中，松弛后的功率为
+    p_n = (1 - w_n) × p_{n-1} + w_n × q_n
+其中q_n为RMC本次计算得到的（对称平均、归一化后的）功率，p_{n-1}为上一次松弛后的功率，
+w_n为松弛因子。残差定义为 r_n = q_n - p_{n-1}，用于判断耦合迭代是否收敛。
+"""
+
+import numpy as np
+
+# 松弛因子的计算方法：
+# 'fixed'：固定的松弛因子；
+# 'aitken'：Aitken动态松弛因子，根据前后两次迭代的残差进行调整；
+# 'sa'：随机逼近（stochastic approximation），松弛因子为1/n，即对各次迭代的功率求平均
+RELAXATION_SCHEMES = ['fixed', 'aitken', 'sa']
+# 判断收敛所用的残差范数
+RESIDUAL_NORMS = ['L2', 'LINF']
+
+# 保存在.previous文件中的迭代状态
+ITERATION_ATTR = 'RelaxIteration'  # 已经松弛过的RMC计算结果的个数
+WEIGHT_ATTR = 'RelaxWeight'  # 上一次的松弛因子
+RESIDUAL_DATASET = 'Residual'  # 上一次的残差，Aitken方法使用
+HISTORY_DATASET = 'ResidualHistory'  # 各次迭代的L2残差、L∞残差和松弛因子
+# 由初始猜测生成的功率文件带有该属性，不计入迭代
+INITIAL_GUESS_ATTR = 'InitialGuess'
+
+
+class Residual:
+    """逐块累加的功率残差"""
+
+    def __init__(self):
+        self._square = 0.0
+        self._previous_square = 0.0
+        self._max = 0.0
+        self._previous_max = 0.0
+        # Aitken方法所需的 r_{n-1}·(r_n - r_{n-1}) 和 |r_n - r_{n-1}|^2
+        self.aitken_dot = 0.0
+        self.aitken_square = 0.0
+
+    def add(self, new, last):
+        """累加一块功率的残差
+
+        :param new: 本次计算的功率
+        :param last: 上一次松弛后的功率
+        :return: 这一块的残差 new - last
+        """
+        residual = new - last
+        self._square += np.vdot(residual, residual)
+        self._previous_square += np.vdot(last, last)
+        if residual.size > 0:
+            self._max = max(self._max, np.max(np.abs(residual)))
+            self._previous_max = max(self._previous_max, np.max(np.abs(last)))
+        return residual
+
+    def add_aitken(self, residual, last_residual):
+        """累加Aitken方法所需的内积
+
+        :param residual: 这一块本次的残差
+        :param last_residual: 这一块上一次的残差
+        """
+        difference = residual - last_residual
+        self.aitken_dot += np.vdot(last_residual, difference)
+        self.aitken_square += np.vdot(difference, difference)
+
+    @property
+    def l2(self):
+        """相对L2残差 |r|_2 / |p|_2"""
+        if self._previous_square == 0.0:
+            return 0.0 if self._square == 0.0 else np.inf
+        return float(np.sqrt(self._square / self._previous_square))
+
+    @property
+    def linf(self):
+        """相对L∞残差 max|r| / max|p|"""
+        if self._previous_max == 0.0:
+            return 0.0 if self._max == 0.0 else np.inf
+        return float(self._max / self._previous_max)
+
+    def norm(self, norm='L2'):
+        """
+        :param norm: RESIDUAL_NORMS中的一种
+        :return: 相对残差
+        """
+        return self.l2 if norm.upper() == 'L2' else self.linf
+
+
+class Relaxation:
+    """耦合迭代的松弛与收敛判断
+
+    迭代的状态（次数、松弛因子、残差及其历史）保存在.previous功率文件中，
+    因此每次计算都可以重新创建该对象。
+    """
+
+    def __init__(self, scheme='fixed', weight=0.5, tolerance=None, norm='L2', min_weight=0.05):
+        """
+        :param scheme: 松弛因子的计算方法，RELAXATION_SCHEMES中的一种
+        :param weight: 固定的松弛因子，也是Aitken方法的初始松弛因子。
+            默认的0.5即原先新旧功率各占一半的平均
+        :param tolerance: 收敛判据，残差小于该值时停止耦合迭代；None表示不提前停止
+        :param norm: 判断收敛所用的残差范数，RESIDUAL_NORMS中的一种
+        :param min_weight: Aitken方法中松弛因子的下限
+        """
+        scheme = scheme.lower()
+        norm = norm.upper()
+        if scheme not in RELAXATION_SCHEMES:
+            raise ValueError('Relaxation scheme {} is not supported, available schemes: {}'.format(
+                scheme, RELAXATION_SCHEMES))
+        if norm not in RESIDUAL_NORMS:
+            raise ValueError('Residual norm {} is not supported, available norms: {}'.format(
+                norm, RESIDUAL_NORMS))
+        if not 0.0 < weight <= 1.0:
+            raise ValueError('Relaxation weight should be in (0, 1], got {}'.format(weight))
+        self.scheme = scheme
+        self.weight = weight
+        self.tolerance = tolerance
+        self.norm = norm
+        self.min_weight = min_weight
+
+    @property
+    def need_residual(self):
+        """松弛因子是否依赖于本次的残差"""
+        return self.scheme == 'aitken'
+
+    def next_weight(self, iteration, last_weight=None, residual=None):
+        """计算本次的松弛因子
+
+        :param iteration: 已经松弛过的RMC计算结果的个数
+        :param last_weight: 上一次的松弛因子
+        :param residual: 本次的残差（包含Aitken方法所需的内积），仅Aitken方法需要
+        :return: 松弛因子
+        """
+        if self.scheme == 'fixed':
+            return self.weight
+        elif self.scheme == 'sa':
+            return 1.0 / (iteration + 1)
+        else:
+            if last_weight is None or residual is None or residual.aitken_square == 0.0:
+                return self.weight
+            weight = -last_weight * residual.aitken_dot / residual.aitken_square
+            return float(min(max(weight, self.min_weight), 1.0))
+
+    def converged(self, residual):
+        """
+        :param residual: 本次的残差，None表示还没有可以比较的功率
+        :return: 耦合迭代是否已经收敛
+        """
+        if self.tolerance is None or residual is None:
+            return False
+        return residual.norm(self.norm) <= self.tolerance
+
+    @staticmethod
+    def state(h5file_previous):
+        """
+        :param h5file_previous: 打开的.previous功率文件
+        :return: [已经松弛过的RMC计算结果的个数, 上一次的松弛因子]
+        """
+        iteration = int(h5file_previous.attrs.get(ITERATION_ATTR, 0))
+        last_weight = h5file_previous.attrs.get(WEIGHT_ATTR)
+        if last_weight is not None:
+            last_weight = float(last_weight)
+        return [iteration, last_weight]
+
+    @staticmethod
+    def reset(h5file_previous):
+        """清除.previous功率文件中的迭代状态，新的燃耗步重新开始耦合迭代，残差历史保留
+
+        :param h5file_previous: 打开的.previous功率文件
+        """
+        for attr in [ITERATION_ATTR, WEIGHT_ATTR]:
+            if attr in h5file_previous.attrs:
+                del h5file_previous.attrs[attr]
+        if RESIDUAL_DATASET in h5file_previous:
+            del h5file_previous[RESIDUAL_DATASET]
+
+    @staticmethod
+    def record(h5file_previous, iteration, weight, residual):
+        """在.previous功率文件中记录本次迭代的状态和残差历史
+
+        :param h5file_previous: 打开的.previous功率文件
+        :param iteration: 包括本次在内，已经松弛过的RMC计算结果的个数
+        :param weight: 本次的松弛因子
+        :param residual: 本次的残差
+        """
+        h5file_previous.attrs[ITERATION_ATTR] = iteration
+        h5file_previous.attrs[WEIGHT_ATTR] = weight
+        row = [residual.l2, residual.linf, weight]
+        if HISTORY_DATASET in h5file_previous:
+            history = h5file_previous[HISTORY_DATASET]
+            history.resize(history.shape[0] + 1, axis=0)
+            history[-1] = row
+        else:
+            h5file_previous.create_dataset(HISTORY_DATASET, data=[row], maxshape=(None, 3))
+        print('Coupling iteration {}: relaxation weight {:.4f}, L2 residual {:.4e}, '
+              'Linf residual {:.4e}'.format(iteration, weight, residual.l2, residual.linf), flush=True)
+
+
+def residual_history(previous_file):
+    """
+    :param previous_file: .previous功率文件的文件名
+    :return: 各次迭代的L2残差、L∞残差和松弛因子，形状为(迭代次数, 3)
+    """
+    import h5py
+
+    with h5py.File(previous_file, 'r') as h5file:
+        if HISTORY_DATASET not in h5file:
+            return np.zeros((0, 3))
+        return h5file[HISTORY_DATASET][()]
@@ -7,23 +7,94 @@ import h5py
 import numpy as np
 
 from RMC.controller.RMCEnum import TallyType
+from RMC.util.CoupleConvergence import Relaxation, Residual, ITERATION_ATTR, RESIDUAL_DATASET, \
+    INITIAL_GUESS_ATTR
 
+# 功率平均时每次读入的数据量（字节）
+POWER_AVE_CHUNK_BYTES = 32 * 1024 * 1024
+# 耦合计算初始猜测的功率分布形状
+POWER_SHAPES = ['flat', 'sine', 'cosine']
 
-def power_ave(file_name, ave_scheme=8):
-    """进行功率平均
 
-    :param file_name: RMC输出的HDF5格式的功率文件的文件名
-    :param ave_scheme: 4或者8。4：以1/4堆芯进行平均；8：以1/8堆芯进行平均
+def fine_bounds(coarse_bounds, bin_number):
+    """基于粗网（网格边界坐标和细网格数）计算细网
+
+    :param coarse_bounds: 粗网边界，例如[0.0, 1.0, 3.0]表示粗网有三个边界，
+        分别是0.0, 1.0, 3.0
+    :param bin_number: 细网格数目，例如[4, 8]表示第一个粗网格中有4个细网格，
+        第二个粗网格中有8个细网格
+    :return: 细网边界坐标
     """
-    assert ave_scheme == 4 or ave_scheme == 8
+    coarse_bounds = np.asarray(coarse_bounds, dtype=float)
+    bin_number = np.asarray(bin_number, dtype=int)
+    bin_size = np.diff(coarse_bounds) / bin_number  # 各个粗网格中细网格的尺寸
+    # 每个细网格在其所在粗网格中的序号
+    index = np.arange(np.sum(bin_number)) - np.repeat(np.cumsum(bin_number) - bin_number, bin_number)
+    _fine_bounds = np.repeat(coarse_bounds[:-1], bin_number) + np.repeat(bin_size, bin_number) * index
+    # 补充上最后的边界坐标
+    return np.append(_fine_bounds, coarse_bounds[-1])
 
-    # 当前版本的耦合计算要求固定使用下列参数：
-    # 用于耦合的统计量为功率
-    tally_type = int(TallyType.type_power)
 
-    dataset_name = 'Type{}'.format(tally_type)
+def initial_power(bounds_x, bounds_y, bounds_z, shape='sine', extrapolation=0.0):
+    """根据各个方向上的边界（细网），计算所有网格的功率，功率 = 体积 × 功率密度。
 
-    h5file = h5py.File(file_name, 'r+')
+    :param bounds_x: x方向上的细网边界，由小到大排列
+    :param bounds_y: y方向上的细网边界，由小到大排列
+    :param bounds_z: z方向上的细网边界，由小到大排列
+    :param shape: 功率密度的分布形状，可选POWER_SHAPES中的一种：
+        'flat'：均匀分布；
+        'sine'：轴向为正弦分布（堆底为0点），径向均匀；
+        'cosine'：轴向为正弦分布，x和y方向为以中心为0点的余弦分布
+    :param extrapolation: 外推距离，正弦和余弦分布在各方向边界外该距离处为0。
+        默认为0，即在边界处为0的完整半个周期；大于0时为截断的分布，边界处的功率密度不为0
+    :return: 功率，形状为(x方向网格数, y方向网格数, z方向网格数)
+    """
+    if shape not in POWER_SHAPES:
+        raise ValueError('Power shape {} is not supported, available shapes: {}'.format(shape, POWER_SHAPES))
+    bounds_x = np.asarray(bounds_x, dtype=float)
+    bounds_y = np.asarray(bounds_y, dtype=float)
+    bounds_z = np.asarray(bounds_z, dtype=float)
+
+    # 各个网格的体积，由三个方向的网格尺寸做外积得到
+    volume = (np.diff(bounds_x)[:, None] * np.diff(bounds_y)[None, :])[:, :, None] * \
+        np.diff(bounds_z)[None, None, :]
+    if shape == 'flat':
+        return volume
+
+    if extrapolation < 0:
+        raise ValueError('Extrapolation length {} is negative'.format(extrapolation))
+
+    def sine(bounds):
+        center = (bounds[:-1] + bounds[1:]) / 2.0
+        return np.sin((center - bounds[0] + extrapolation) / (bounds[-1] - bounds[0] + 2 * extrapolation) * np.pi)
+
+    power = volume
+    power *= sine(bounds_z)[None, None, :]
+    if shape == 'cosine':
+        # 以中心为0点的余弦分布，与以边界为0点的正弦分布相同
+        power *= (sine(bounds_x)[:, None] * sine(bounds_y)[None, :])[:, :, None]
+    return power
+
+
+def _slabs(dataset):
+    """按轴向分块，每次只读入若干层
+
+    :param dataset: HDF5文件中的功率数据集
+    :return: 各块在z方向上的范围
+    """
+    nx, ny, nz = dataset.shape
+    slab_size = max(1, POWER_AVE_CHUNK_BYTES // max(1, nx * ny * dataset.dtype.itemsize))
+    return [slice(z, min(z + slab_size, nz)) for z in range(0, nz, slab_size)]
+
+
+def _symmetrize(origin, ave_scheme, out=None):
+    """对一块功率进行对称平均
+
+    :param origin: 归一化后的功率
+    :param ave_scheme: 4或者8，见power_ave
+    :param out: 存放结果的数组，None时新建
+    :return: 对称平均后的功率
+    """
     """
     1  1  1  1  1  1  1  1  1  1  1
     1  1  x5 1  1  1  1  1  x6 1  1
@@ -48,33 +119,181 @@ def power_ave(file_name, ave_scheme=8):
     x7: flip_y_transpose
     x8: flip_xy_transpose
     """
-    origin = h5file[dataset_name][()]
-    origin = origin / np.sum(origin)
-    flip_x = np.flip(origin, 0)
-    flip_y = np.flip(origin, 1)
-    flip_xy = np.flip(flip_x, 1)
+    if out is None or out.shape != origin.shape:
+        out = np.empty_like(origin)
+    # 各个对称位置都是origin的视图，累加到同一个数组中
+    np.add(origin, origin[::-1, :], out=out)                  # origin + flip_x
+    out += origin[:, ::-1]                                    # flip_y
+    out += origin[::-1, ::-1]                                 # flip_xy
+    if ave_scheme == 8:
+        out += origin.transpose((1, 0, 2))                    # transpose
+        out += origin[::-1, :].transpose((1, 0, 2))           # flip_x_transpose
+        out += origin[:, ::-1].transpose((1, 0, 2))           # flip_y_transpose
+        out += origin[::-1, ::-1].transpose((1, 0, 2))        # flip_xy_transpose
+    out /= ave_scheme
+    return out
 
-    ave = origin + flip_x + flip_y + flip_xy
 
-    if ave_scheme == 8:
-        ave += np.transpose(origin, (1, 0, 2))   # transpose
-        ave += np.transpose(flip_x, (1, 0, 2))   # flip_x_transpose
-        ave += np.transpose(flip_y, (1, 0, 2))   # flip_y_transpose
-        ave += np.transpose(flip_xy, (1, 0, 2))  # flip_xy_transpose
+def _blend(ave, last, weight):
+    """原位计算松弛后的功率 (1 - weight) × last + weight × ave，结果存放在ave中"""
+    last *= 1.0 - weight
+    ave *= weight
+    ave += last
+    return ave
+
+
+def power_ave(file_name, ave_scheme=8, relaxation=None):
+    """进行功率平均，并与上一次的功率进行松弛
+
+    :param file_name: RMC输出的HDF5格式的功率文件的文件名
+    :param ave_scheme: 4或者8。4：以1/4堆芯进行平均；8：以1/8堆芯进行平均
+    :param relaxation: 松弛方法，RMC.util.CoupleConvergence.Relaxation，
+        None时为固定的松弛因子0.5，即新旧功率各占一半
+    :return: 本次功率的残差，RMC.util.CoupleConvergence.Residual；没有上一次的功率时为None
+    """
+    assert ave_scheme == 4 or ave_scheme == 8
+    if relaxation is None:
+        relaxation = Relaxation()
+
+    # 当前版本的耦合计算要求固定使用下列参数：
+    # 用于耦合的统计量为功率
+    tally_type = int(TallyType.type_power)
 
-    ave /= ave_scheme
+    dataset_name = 'Type{}'.format(tally_type)
 
+    h5file = h5py.File(file_name, 'r+')
+    dataset = h5file[dataset_name]
+    # 初始猜测的功率与上一次的功率相同，不需要松弛，也不计入迭代
+    initial_guess = INITIAL_GUESS_ATTR in h5file.attrs
     previous_file = file_name + '.previous'
+    h5file_previous = None
+    previous = None
     if os.path.exists(previous_file):
-        h5file_previous = h5py.File(previous_file, 'r')
-        previous = h5file_previous[dataset_name][()]
-        previous = previous / np.sum(previous)
-        h5file_previous.close()
-        ave = (ave + previous) / 2.0
+        h5file_previous = h5py.File(previous_file, 'r+')
+        previous = h5file_previous[dataset_name]
+
+    slabs = _slabs(dataset)
+
+    # 先遍历一次，得到归一化所需的总和
+    total = sum(np.sum(dataset[:, :, slab]) for slab in slabs)
+    if previous is not None:
+        previous_total = sum(np.sum(previous[:, :, slab]) for slab in slabs)
+
+    residual = None
+    if previous is None or initial_guess:
+        ave = None
+        for slab in slabs:
+            origin = dataset[:, :, slab]
+            origin /= total
+            ave = _symmetrize(origin, ave_scheme, ave)
+            if previous is not None:
+                # 存档，只更新上一次文件中的功率
+                previous[:, :, slab] = ave
+            dataset[:, :, slab] = ave
+    else:
+        iteration, last_weight = Relaxation.state(h5file_previous)
+        # 固定松弛因子和随机逼近方法的松弛因子可以预先确定，在同一次遍历中完成松弛
+        weight = None if relaxation.need_residual else relaxation.next_weight(iteration, last_weight)
+        residual = Residual()
+        residuals = None
+        has_last_residual = False
+        if relaxation.need_residual:
+            residuals = h5file_previous.get(RESIDUAL_DATASET)
+            has_last_residual = residuals is not None and residuals.shape == dataset.shape
+            if not has_last_residual:
+                if residuals is not None:
+                    del h5file_previous[RESIDUAL_DATASET]
+                residuals = h5file_previous.create_dataset(RESIDUAL_DATASET, shape=dataset.shape,
+                                                           dtype=np.float64)
+
+        ave = None
+        for slab in slabs:
+            origin = dataset[:, :, slab]
+            origin /= total
+            ave = _symmetrize(origin, ave_scheme, ave)
+            last = previous[:, :, slab]
+            last /= previous_total
+            slab_residual = residual.add(ave, last)
+            if residuals is not None:
+                if has_last_residual:
+                    residual.add_aitken(slab_residual, residuals[:, :, slab])
+                residuals[:, :, slab] = slab_residual
+            if weight is not None:
+                _blend(ave, last, weight)
+                # 存档，只更新上一次文件中的功率
+                previous[:, :, slab] = ave
+            dataset[:, :, slab] = ave
+
+        if weight is None:
+            # Aitken方法的松弛因子依赖于整体的残差，再遍历一次完成松弛
+            weight = relaxation.next_weight(iteration, last_weight,
+                                            residual if has_last_residual else None)
+            for slab in slabs:
+                ave = dataset[:, :, slab]
+                last = previous[:, :, slab]
+                last /= previous_total
+                _blend(ave, last, weight)
+                previous[:, :, slab] = ave
+                dataset[:, :, slab] = ave
+
+        Relaxation.record(h5file_previous, iteration + 1, weight, residual)
 
-    del h5file[dataset_name]
-    h5file[dataset_name] = ave
     h5file.close()
+    if h5file_previous is not None:
+        h5file_previous.close()
+    else:
+        # 存档
+        shutil.copyfile(file_name, previous_file)
+        if not initial_guess:
+            # RMC的计算结果直接作为上一次的功率，计为第一次迭代
+            with h5py.File(previous_file, 'r+') as h5file_previous:
+                h5file_previous.attrs[ITERATION_ATTR] = 1
+    return residual
+
+
+def reset_relaxation(file_name):
+    """在新的燃耗步开始耦合迭代时，清除上一个燃耗步的松弛状态（迭代次数、松弛因子和残差），
+    使本燃耗步第一次RMC计算的功率不与上一个燃耗步的各次功率平均。
+
+    :param file_name: RMC输出的HDF5格式的功率文件的文件名，其.previous文件不存在时不做处理
+    """
+    previous_file = file_name + '.previous'
+    if not os.path.exists(previous_file):
+        return
+    with h5py.File(previous_file, 'r+') as h5file_previous:
+        Relaxation.reset(h5file_previous)
+
+
+def power_residual(file_name, ave_scheme=8):
+    """计算RMC新输出的功率与上一次松弛后的功率之间的残差，不修改功率文件。
+    用于在耦合迭代中及时判断是否收敛。
+
+    :param file_name: RMC输出的HDF5格式的功率文件的文件名
+    :param ave_scheme: 4或者8，见power_ave
+    :return: 残差，RMC.util.CoupleConvergence.Residual；没有可以比较的功率时为None
+    """
+    assert ave_scheme == 4 or ave_scheme == 8
+    previous_file = file_name + '.previous'
+    if not os.path.exists(file_name) or not os.path.exists(previous_file):
+        return None
+
+    dataset_name = 'Type{}'.format(int(TallyType.type_power))
+    with h5py.File(file_name, 'r') as h5file, h5py.File(previous_file, 'r') as h5file_previous:
+        if INITIAL_GUESS_ATTR in h5file.attrs:
+            return None
+        dataset = h5file[dataset_name]
+        previous = h5file_previous[dataset_name]
+        slabs = _slabs(dataset)
+        total = sum(np.sum(dataset[:, :, slab]) for slab in slabs)
+        previous_total = sum(np.sum(previous[:, :, slab]) for slab in slabs)
 
-    # 存档
-    shutil.copyfile(file_name, previous_file)
+        residual = Residual()
+        ave = None
+        for slab in slabs:
+            origin = dataset[:, :, slab]
+            origin /= total
+            ave = _symmetrize(origin, ave_scheme, ave)
+            last = previous[:, :, slab]
+            last /= previous_total
+            residual.add(ave, last)
+    return residual
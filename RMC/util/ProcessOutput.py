@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+"""Streaming of the output of the subprocesses, without keeping the whole output in memory."""
+
+import os
+import codecs
+import selectors
+import subprocess
+
+# 单行输出的最大长度（字节），超过时不再等待换行符，直接作为一行输出
+MAX_LINE_BYTES = 1024 * 1024
+
+
+class RotatingLog:
+    """
+    Log file rotated by size: when the log exceeds max_bytes, it is renamed to log.1
+    (log.1 to log.2, and so on), and at most backup_count old logs are kept.
+    """
+
+    def __init__(self, file_name, max_bytes=100 * 1024 * 1024, backup_count=3):
+        """
+        :param file_name: the log file, appended if it exists.
+        :param max_bytes: maximum size of a log file in bytes, 0 to never rotate.
+        :param backup_count: number of the old log files kept.
+        """
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = open(file_name, 'a', encoding='utf-8', errors='replace')
+        self._size = self._file.tell()
+
+    def write(self, text):
+        # 按编码后的字节数计算日志的大小，中文等非ASCII字符占多个字节
+        size = len(text.encode('utf-8', errors='replace'))
+        if self.max_bytes > 0 and self._size > 0 and self._size + size > self.max_bytes:
+            self._rotate()
+        self._file.write(text)
+        self._size += size
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = '{}.{}'.format(self.file_name, index)
+                if os.path.exists(source):
+                    os.replace(source, '{}.{}'.format(self.file_name, index + 1))
+            os.replace(self.file_name, self.file_name + '.1')
+        self._file = open(self.file_name, 'w', encoding='utf-8', errors='replace')
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _split_lines(buffer, decoder, final=False):
+    """
+    :return: [decoded complete lines, remaining bytes]
+    """
+    lines = []
+    start = buffer.rfind(b'\n') + 1
+    if start > 0:
+        # 整块解码后再分行，换行符不会出现在多字节字符之中
+        text = decoder.decode(buffer[:start]).replace('\r\n', '\n')
+        lines = [line + '\n' for line in text.split('\n')[:-1]]
+    buffer = buffer[start:]
+    if buffer and (final or len(buffer) >= MAX_LINE_BYTES):
+        lines.append(decoder.decode(buffer, final))
+        buffer = b''
+    return [lines, buffer]
+
+
+def stream_lines(process):
+    """
+    Read the stdout and stderr of the process line by line as they are printed.
+    Only the last chunk read from each stream is kept in memory.
+
+    :param process: subprocess.Popen with stdout and stderr of binary pipes
+        (stderr may be subprocess.STDOUT).
+    :return: generator of [line, is_stderr].
+    """
+    streams = [(process.stdout, False)]
+    if process.stderr is not None:
+        streams.append((process.stderr, True))
+
+    if os.name == 'nt':
+        # Windows中不能对管道使用select，此时stderr应当合并到stdout中
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for line in iter(process.stdout.readline, b''):
+            yield [decoder.decode(line).replace('\r\n', '\n'), False]
+        return
+
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    decoders = {}
+    for stream, is_stderr in streams:
+        selector.register(stream, selectors.EVENT_READ, is_stderr)
+        buffers[is_stderr] = b''
+        decoders[is_stderr] = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        while selector.get_map():
+            for key, events in selector.select():
+                is_stderr = key.data
+                data = os.read(key.fd, 65536)
+                if not data:
+                    # 输出结束，把最后不完整的一行也输出
+                    selector.unregister(key.fileobj)
+                    lines, buffers[is_stderr] = _split_lines(buffers[is_stderr], decoders[is_stderr], True)
+                else:
+                    lines, buffers[is_stderr] = _split_lines(buffers[is_stderr] + data, decoders[is_stderr])
+                for line in lines:
+                    yield [line, is_stderr]
+    finally:
+        selector.close()
+
+
+def open_process(args, cwd=None):
+    """
+    Launch a subprocess of shell commands, whose stdout and stderr can be streamed by stream_lines.
+
+    :param args: the shell commands.
+    :param cwd: working directory of the subprocess.
+    :return: subprocess.Popen
+    """
+    stderr = subprocess.STDOUT if os.name == 'nt' else subprocess.PIPE
+    return subprocess.Popen(args, cwd=cwd, shell=True, stdout=subprocess.PIPE, stderr=stderr)
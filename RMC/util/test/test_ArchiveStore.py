@@ -0,0 +1,123 @@
+# -*- coding:utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+import unittest
+from unittest import TestCase, mock
+from RMC.util.ArchiveStore import ArchiveStore, file_digest, default_store
+from RMC.runner import Job, run
+
+
+class TestArchiveStore(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write(self, file_name, content):
+        file_name = os.path.join(self.work_dir, file_name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as f:
+            f.write(content)
+        return file_name
+
+    def test_store(self):
+        store = ArchiveStore(os.path.join(self.work_dir, 'store'))
+        os.makedirs(os.path.join(self.work_dir, 'step1'))
+        os.makedirs(os.path.join(self.work_dir, 'step2'))
+        state = self.write('inp.State.h5', 'state 1')
+        new = self.write('inp.out', 'state 1')
+
+        step1 = os.path.join(self.work_dir, 'step1')
+        digest = store.archive(state, os.path.join(step1, 'inp.State.h5'))
+        self.assertEqual(digest, file_digest(state))
+        self.assertTrue(os.path.exists(state))
+        # 内容相同的文件只保存一份
+        self.assertEqual(store.archive(new, os.path.join(step1, 'inp.out'), move=True), digest)
+        self.assertFalse(os.path.exists(new))
+        self.assertEqual(len(list(store.objects())), 1)
+
+        step2 = os.path.join(self.work_dir, 'step2')
+        store.archive(state, os.path.join(step2, 'inp.State.h5'))
+        self.assertEqual(os.stat(os.path.join(step2, 'inp.State.h5')).st_ino,
+                         os.stat(os.path.join(step1, 'inp.State.h5')).st_ino)
+        self.write('inp.State.h5', 'state 2')
+        store.archive(state, os.path.join(step2, 'inp.State.h5'))
+        with open(os.path.join(step2, 'inp.State.h5')) as f:
+            self.assertEqual(f.read(), 'state 2')
+        with open(os.path.join(step1, 'inp.State.h5')) as f:
+            self.assertEqual(f.read(), 'state 1')
+        self.assertEqual(store.gc(), [0, 0])
+
+        shutil.rmtree(step1)
+        self.assertEqual(store.gc(), [1, len('state 1')])
+        self.assertEqual(len(list(store.objects())), 1)
+        shutil.rmtree(step2)
+        store.gc()
+        self.assertEqual(os.listdir(store.root), [])
+
+    def test_gc_lock(self):
+        store = ArchiveStore(os.path.join(self.work_dir, 'store'))
+        state = self.write('inp.State.h5', 'state 1')
+        collector = threading.Thread(target=ArchiveStore(store.root).gc)
+        with store.lock():
+            digest = store.add(state)
+            # 其他进程的回收等待文件链接到存档目录之后进行
+            collector.start()
+            collector.join(0.2)
+            self.assertTrue(collector.is_alive())
+            store.link(digest, os.path.join(self.work_dir, 'archived.h5'))
+        collector.join()
+        self.assertTrue(os.path.exists(store.object_path(digest)))
+
+    def test_default_store(self):
+        archive = os.path.join(self.work_dir, 'archive')
+        self.assertEqual(default_store(archive), os.path.join(self.work_dir, '.store'))
+        inp = self.write(os.path.join('workspace', 'inp'), 'input')
+        with mock.patch('RMC.runner.RMCController') as controller:
+            controller.return_value.continuing.return_value = False
+            run(inp=inp, archive_dir=archive, status='status.txt')
+            # 各个步骤的存档目录位于archive之中，共用archive旁边的文件库
+            propt = controller.return_value.continuing.call_args[0][1]
+            self.assertEqual(propt['archive_store'], os.path.join(self.work_dir, '.store'))
+
+    def test_archive_output(self):
+        workspace = os.path.join(self.work_dir, 'workspace')
+        archive = os.path.join(self.work_dir, 'archive')
+        store = os.path.join(archive, '.store')
+        inp = self.write(os.path.join('workspace', 'inp'), 'input')
+        tally = self.write(os.path.join('workspace', 'MeshTally1.h5'), 'power')
+        job = Job(inp=inp, archive_store=store)
+
+        for step, power in enumerate(['power 1', 'power 1', 'power 2']):
+            job.archive_dir = os.path.join(archive, 'couple%d' % (step + 1))
+            job._archive_info()
+            time.sleep(0.01)
+            self.write(os.path.join('workspace', 'MeshTally1.h5'), power)
+            self.write(os.path.join('workspace', 'inp.out'), 'output %d' % step)
+            job._archive_output()
+            self.assertEqual(sorted(os.listdir(job.archive_dir)), ['MeshTally1.h5', 'inp.out'])
+            self.assertFalse(os.path.exists(os.path.join(workspace, 'inp.out')))
+            self.assertTrue(os.path.exists(tally))
+
+        # 前两步的MeshTally1.h5内容相同，只保存一份
+        self.assertEqual(os.stat(os.path.join(archive, 'couple1', 'MeshTally1.h5')).st_ino,
+                         os.stat(os.path.join(archive, 'couple2', 'MeshTally1.h5')).st_ino)
+        self.assertEqual(len(list(ArchiveStore(store).objects())), 5)
+
+        # 重新计算第二步时，原先第二步独有的存档文件被回收
+        job.archive_dir = os.path.join(archive, 'couple2')
+        job._archive_info()
+        self.write(os.path.join('workspace', 'inp.out'), 'output 1 again')
+        job._archive_output()
+        self.assertEqual(os.listdir(job.archive_dir), ['inp.out'])
+        self.assertEqual(len(list(ArchiveStore(store).objects())), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,42 @@
 # -*- codint:utf-8 -*-
 
 import os
+import time
+import shutil
+import tracemalloc
 import h5py
 import numpy as np
 
 import unittest
 from unittest import TestCase
-from RMC.util.CoupleUtils import power_ave
+import RMC.util.CoupleUtils as CoupleUtils
+from RMC.util.CoupleUtils import power_ave, power_residual, fine_bounds, initial_power, reset_relaxation
+from RMC.util.CoupleConvergence import Relaxation, residual_history
 from RMC.controller.RMCEnum import TallyType
 
 
+def write_power(file_name, data, initial_guess=False):
+    with h5py.File(file_name, 'w') as h5file:
+        h5file.create_group('Geometry').create_dataset('BinNumber', data=np.array(data.shape))
+        h5file['Type{}'.format(int(TallyType.type_power))] = data
+        if initial_guess:
+            h5file.attrs['InitialGuess'] = 1
+
+
+def symmetric_power(data, ave_scheme=8):
+    """归一化并对称平均后的功率"""
+    origin = data / np.sum(data)
+    ave = origin + origin[::-1, :] + origin[:, ::-1] + origin[::-1, ::-1]
+    if ave_scheme == 8:
+        ave += np.transpose(ave, (1, 0, 2))
+    return ave / ave_scheme
+
+
+def read_power(file_name):
+    with h5py.File(file_name, 'r') as h5file:
+        return h5file['Type{}'.format(int(TallyType.type_power))][()]
+
+
 class TestCoupleUtils(TestCase):
     def test_power_ave(self):
         # 当前版本的耦合计算要求固定使用下列参数：
@@ -53,6 +80,223 @@ class TestCoupleUtils(TestCase):
         os.remove(file_name)
         os.remove(file_name + '.bak')
 
+    def test_initial_power(self):
+        coarse = [-10.71, -3.2, 0.0, 10.71]
+        bins = [3, 1, 7]
+        expected = [-10.71, -10.71 + 7.51 / 3, -10.71 + 7.51 * 2 / 3, -3.2] + [10.71 * i / 7 for i in range(8)]
+        self.assertEqual(len(fine_bounds(coarse, bins)), 12)
+        self.assertTrue(np.allclose(fine_bounds(coarse, bins), expected, rtol=0, atol=1e-14))
+
+        # 功率 = 体积 × sin(轴向网格中心的相对高度 × pi)
+        sine = initial_power([0.0, 1.0], [0.0, 0.5, 2.0], [1.0, 2.0, 3.0, 4.0], 'sine')
+        self.assertTrue(np.allclose(sine, [[[0.25, 0.5, 0.25], [0.75, 1.5, 0.75]]], rtol=1e-14, atol=0))
+        bounds_x = fine_bounds([-10.71, 10.71], [17])
+        bounds_y = fine_bounds([-10.71, 0.0, 10.71], [8, 9])
+        bounds_z = fine_bounds([0.0, 50.0, 365.76], [5, 20])
+        sine = initial_power(bounds_x, bounds_y, bounds_z, 'sine')
+        self.assertEqual(sine.shape, (17, 17, 25))
+        self.assertAlmostEqual(np.sum(sine), 21.42 * 21.42 * 365.76 * 2 / np.pi, delta=1e-2 * np.sum(sine))
+
+        flat = initial_power(bounds_x, bounds_y, bounds_z, 'flat')
+        self.assertAlmostEqual(np.sum(flat), 21.42 * 21.42 * 365.76)
+        cosine = initial_power(bounds_x, bounds_x, bounds_z, 'cosine')
+        self.assertEqual(np.unravel_index(np.argmax(cosine), cosine.shape)[:2], (8, 8))
+        self.assertRaises(ValueError, initial_power, bounds_x, bounds_y, bounds_z, 'bessel')
+
+        # 外推距离为1时，轴向为截断的正弦分布：sin((网格中心 - 堆底 + 1) / (高度 + 2) × pi)
+        chopped = initial_power([0.0, 1.0], [0.0, 1.0], [0.0, 1.0, 2.0], 'sine', extrapolation=1.0)
+        self.assertTrue(np.allclose(chopped, [[[np.sin(0.375 * np.pi), np.sin(0.625 * np.pi)]]], rtol=1e-14, atol=0))
+        chopped = initial_power([0.0, 2.0], [0.0, 2.0], [0.0, 2.0], 'cosine', extrapolation=1.0)
+        self.assertAlmostEqual(chopped[0, 0, 0], 8.0)
+        self.assertRaises(ValueError, initial_power, bounds_x, bounds_y, bounds_z, 'sine', -1.0)
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_initial_power_benchmark(self):
+        bounds_x = fine_bounds([-182.0, 182.0], [60])
+        bounds_y = fine_bounds([-182.0, 182.0], [60])
+        bounds_z = fine_bounds([0.0, 365.76], [50])
+        start = time.time()
+        power = initial_power(bounds_x, bounds_y, bounds_z)
+        numpy_time = time.time() - start
+        # 径向均匀，轴向对称
+        self.assertTrue(np.allclose(power, power[:1, :1, :], rtol=1e-12, atol=0))
+        self.assertTrue(np.allclose(power, power[:, :, ::-1], rtol=1e-12, atol=0))
+        print('60x60x50 meshes: numpy %.4fs' % numpy_time)
+
+        start = time.time()
+        initial_power(fine_bounds([-182.0, 182.0], [289]), fine_bounds([-182.0, 182.0], [289]),
+                      fine_bounds([0.0, 365.76], [200]))
+        print('289x289x200 meshes: numpy %.3fs' % (time.time() - start))
+
+    def test_power_ave_chunked(self):
+        chunk_bytes = CoupleUtils.POWER_AVE_CHUNK_BYTES
+        CoupleUtils.POWER_AVE_CHUNK_BYTES = 17 * 17 * 8 * 3  # 每次读入3层
+        try:
+            rng = np.random.default_rng(1)
+            for scheme in [4, 8]:
+                powers = [rng.random((17, 17, 10)) for i in range(3)]
+                # 固定松弛因子0.5：对称平均后的功率与上一次的功率取平均
+                expected = None
+                for data in powers:
+                    write_power('chunked.h5', data)
+                    power_ave('chunked.h5', scheme)
+                    ave = symmetric_power(data, scheme)
+                    expected = ave if expected is None else (ave + expected) / 2.0
+                self.assertTrue(np.allclose(read_power('chunked.h5'), expected, rtol=1e-13, atol=0))
+                self.assertTrue(np.allclose(read_power('chunked.h5.previous'), expected, rtol=1e-13, atol=0))
+                os.remove('chunked.h5')
+                os.remove('chunked.h5.previous')
+        finally:
+            CoupleUtils.POWER_AVE_CHUNK_BYTES = chunk_bytes
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_power_ave_benchmark(self):
+        chunk_bytes = CoupleUtils.POWER_AVE_CHUNK_BYTES
+        CoupleUtils.POWER_AVE_CHUNK_BYTES = 4 * 1024 * 1024
+        data = np.random.default_rng(2).random((120, 120, 200))
+        try:
+            write_power('chunked.h5', data)
+            power_ave('chunked.h5')
+            write_power('chunked.h5', data)
+            tracemalloc.start()
+            start = time.time()
+            power_ave('chunked.h5')
+            elapsed = time.time() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('power_ave: %.3fs, %.1f MB/s, peak memory %.1f MB for %.1f MB data' %
+                  (elapsed, data.nbytes / 1e6 / elapsed, peak / 1e6, data.nbytes / 1e6))
+        finally:
+            CoupleUtils.POWER_AVE_CHUNK_BYTES = chunk_bytes
+        # 两次的功率相同，松弛后仍为对称平均后的功率
+        self.assertTrue(np.allclose(read_power('chunked.h5'), symmetric_power(data), rtol=1e-13, atol=0))
+        os.remove('chunked.h5')
+        os.remove('chunked.h5.previous')
+
+    def test_relaxation(self):
+        chunk_bytes = CoupleUtils.POWER_AVE_CHUNK_BYTES
+        CoupleUtils.POWER_AVE_CHUNK_BYTES = 8 * 8 * 8 * 2  # 每次读入2层
+        rng = np.random.default_rng(3)
+        powers = [rng.random((8, 8, 5)) + 1.0 for i in range(4)]
+        symmetric = [symmetric_power(data) for data in powers]
+        name = 'relaxation.h5'
+        try:
+            # 随机逼近：松弛后的功率为各次功率的平均
+            for index, data in enumerate(powers):
+                write_power(name, data)
+                residual = power_ave(name, relaxation=Relaxation('sa'))
+                if index == 0:
+                    self.assertIsNone(residual)
+            self.assertTrue(np.allclose(read_power(name + '.previous'), np.mean(symmetric, axis=0),
+                                        rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(residual_history(name + '.previous')[:, 2], [1 / 2, 1 / 3, 1 / 4]))
+            os.remove(name + '.previous')
+
+            # Aitken：第一次使用给定的松弛因子，之后根据前后两次的残差调整
+            relaxation = Relaxation('aitken', weight=0.8)
+            relaxed = symmetric[0]
+            weight = None
+            last_residual = None
+            for index, data in enumerate(powers):
+                write_power(name, data)
+                if index == 0:
+                    power_ave(name, relaxation=relaxation)
+                    continue
+                expected = power_residual(name)
+                residual = power_ave(name, relaxation=relaxation)
+                self.assertAlmostEqual(residual.l2, expected.l2)
+                self.assertAlmostEqual(residual.linf, expected.linf)
+
+                reference_residual = symmetric[index] - relaxed
+                self.assertAlmostEqual(residual.l2, np.linalg.norm(reference_residual) / np.linalg.norm(relaxed))
+                self.assertAlmostEqual(residual.linf, np.max(np.abs(reference_residual)) / np.max(relaxed))
+                if last_residual is None:
+                    weight = 0.8
+                else:
+                    difference = reference_residual - last_residual
+                    weight = -weight * np.vdot(last_residual, difference) / np.vdot(difference, difference)
+                    weight = min(max(weight, 0.05), 1.0)
+                relaxed = relaxed + weight * reference_residual
+                last_residual = reference_residual
+                self.assertTrue(np.allclose(read_power(name), relaxed, rtol=1e-12, atol=0))
+            history = residual_history(name + '.previous')
+            self.assertEqual(history.shape, (3, 3))
+            self.assertAlmostEqual(history[-1, 2], weight)
+            self.assertAlmostEqual(history[-1, 0], residual.l2)
+            os.remove(name + '.previous')
+
+            # 初始猜测不计入迭代，第一次RMC的结果不与其松弛
+            write_power(name, powers[0], initial_guess=True)
+            shutil.copyfile(name, name + '.previous')
+            self.assertIsNone(power_residual(name))
+            self.assertIsNone(power_ave(name, relaxation=Relaxation('sa')))
+            write_power(name, powers[1])
+            power_ave(name, relaxation=Relaxation('sa'))
+            self.assertTrue(np.allclose(read_power(name + '.previous'), symmetric[1], rtol=1e-12, atol=0))
+            self.assertEqual(residual_history(name + '.previous').shape, (1, 3))
+        finally:
+            CoupleUtils.POWER_AVE_CHUNK_BYTES = chunk_bytes
+            for file in [name, name + '.previous']:
+                if os.path.exists(file):
+                    os.remove(file)
+
+    def test_relaxation_burnup_steps(self):
+        rng = np.random.default_rng(5)
+        powers = [rng.random((8, 8, 5)) + 1.0 for i in range(5)]
+        symmetric = [symmetric_power(data) for data in powers]
+        name = 'burnup_steps.h5'
+        try:
+            # 第0燃耗步：3次耦合迭代
+            for data in powers[:3]:
+                write_power(name, data)
+                power_ave(name, relaxation=Relaxation('sa'))
+            self.assertTrue(np.allclose(residual_history(name + '.previous')[:, 2], [1 / 2, 1 / 3]))
+
+            # 第1燃耗步：松弛从头开始，只对本燃耗步的功率平均
+            reset_relaxation(name)
+            for data in powers[3:]:
+                write_power(name, data)
+                power_ave(name, relaxation=Relaxation('sa'))
+            self.assertTrue(np.allclose(read_power(name + '.previous'), np.mean(symmetric[3:], axis=0),
+                                        rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(residual_history(name + '.previous')[:, 2], [1 / 2, 1 / 3, 1, 1 / 2]))
+
+            # Aitken：新的燃耗步第一次使用给定的松弛因子，不使用上一个燃耗步的残差
+            relaxation = Relaxation('aitken', weight=0.8)
+            for data in powers[:3]:
+                write_power(name, data)
+                power_ave(name, relaxation=relaxation)
+            reset_relaxation(name)
+            with h5py.File(name + '.previous', 'r') as h5file:
+                self.assertEqual(Relaxation.state(h5file), [0, None])
+                self.assertNotIn('Residual', h5file)
+            last = read_power(name + '.previous')
+            write_power(name, powers[3])
+            power_ave(name, relaxation=relaxation)
+            self.assertAlmostEqual(residual_history(name + '.previous')[-1, 2], 0.8)
+            self.assertTrue(np.allclose(read_power(name), last + 0.8 * (symmetric[3] - last), rtol=1e-12, atol=0))
+        finally:
+            for file in [name, name + '.previous']:
+                if os.path.exists(file):
+                    os.remove(file)
+
+    def test_convergence(self):
+        relaxation = Relaxation('fixed', weight=0.5, tolerance=1e-3, norm='Linf')
+        self.assertFalse(relaxation.converged(None))
+        write_power('converged.h5', np.ones((4, 4, 3)))
+        power_ave('converged.h5')
+        write_power('converged.h5', np.ones((4, 4, 3)) * 2.0)
+        self.assertTrue(relaxation.converged(power_residual('converged.h5')))
+        self.assertFalse(Relaxation(tolerance=None).converged(power_residual('converged.h5')))
+        write_power('converged.h5', np.arange(1.0, 49.0).reshape((4, 4, 3)))
+        self.assertFalse(relaxation.converged(power_residual('converged.h5')))
+        os.remove('converged.h5')
+        os.remove('converged.h5.previous')
+
+        self.assertRaises(ValueError, Relaxation, 'newton')
+        self.assertRaises(ValueError, Relaxation, 'fixed', 1.5)
+        self.assertRaises(ValueError, Relaxation, norm='L1')
+
 
 if __name__ == '__main__':
     unittest.main()
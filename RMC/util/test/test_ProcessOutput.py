@@ -0,0 +1,96 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import tracemalloc
+
+import unittest
+from unittest import TestCase
+from RMC.util.ProcessOutput import RotatingLog, open_process, stream_lines
+from RMC.runner import Job
+
+
+def python_command(code):
+    return '"{}" -c "{}"'.format(sys.executable, code)
+
+
+class TestProcessOutput(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_stream_lines(self):
+        code = "import sys; print('out 1'); sys.stderr.write('err 1\\\\n'); print('out 2'); " \
+               "sys.stdout.write('no newline')"
+        p = open_process(python_command(code))
+        lines = list(stream_lines(p))
+        p.wait()
+        self.assertEqual([line for line, is_stderr in lines if not is_stderr],
+                         ['out 1\n', 'out 2\n', 'no newline'])
+        self.assertEqual([line for line, is_stderr in lines if is_stderr], ['err 1\n'])
+
+    def test_rotating_log(self):
+        log_file = os.path.join(self.work_dir, 'run.log')
+        with RotatingLog(log_file, max_bytes=100, backup_count=2) as log:
+            for index in range(30):
+                log.write('line %02d\n' % index)
+        self.assertEqual(sorted(os.listdir(self.work_dir)), ['run.log', 'run.log.1', 'run.log.2'])
+        for file in os.listdir(self.work_dir):
+            self.assertLessEqual(os.path.getsize(os.path.join(self.work_dir, file)), 100)
+        with open(log_file) as f:
+            self.assertTrue(f.read().endswith('line 29\n'))
+
+        # 非ASCII的输出按字节数轮换
+        for file in os.listdir(self.work_dir):
+            os.remove(os.path.join(self.work_dir, file))
+        with RotatingLog(log_file, max_bytes=100, backup_count=5) as log:
+            for index in range(30):
+                log.write('第%02d行\n' % index)
+        for file in os.listdir(self.work_dir):
+            self.assertLessEqual(os.path.getsize(os.path.join(self.work_dir, file)), 100)
+        with open(log_file, encoding='utf-8') as f:
+            self.assertTrue(f.read().endswith('第29行\n'))
+
+    def test_job_execute(self):
+        inp = os.path.join(self.work_dir, 'inp')
+        cycles = []
+        job = Job(inp=inp, print_screen=False, log_file='run.log', tail_lines=3,
+                  line_callbacks=[lambda line: cycles.append(line) if line.startswith('cycle') else None])
+        code = "import sys; [print('cycle %d keff 1.0' % i) for i in range(10)]; " \
+               "sys.stderr.write('fatal error\\\\n'); sys.exit(3)"
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            job.execute(python_command(code))
+        self.assertEqual(context.exception.returncode, 3)
+        self.assertEqual(context.exception.output.splitlines(),
+                         ['cycle 8 keff 1.0', 'cycle 9 keff 1.0', 'fatal error'])
+        self.assertEqual(len(cycles), 10)
+        with open(os.path.join(self.work_dir, 'run.log')) as f:
+            content = f.read()
+        self.assertIn('cycle 0 keff 1.0\n', content)
+        self.assertIn('fatal error\n', content)
+
+    @unittest.skipUnless(os.environ.get('RMC_BENCHMARK'), 'benchmark, set RMC_BENCHMARK=1 to run')
+    def test_execute_benchmark(self):
+        """The memory of the driver does not grow with the output of the subprocess."""
+        inp = os.path.join(self.work_dir, 'inp')
+        job = Job(inp=inp, print_screen=False, log_file='run.log', log_max_bytes=4 * 1024 * 1024)
+        code = "[print('cycle %8d  keff 1.00000  +/- 0.00010' % i) for i in range(500000)]"
+        tracemalloc.start()
+        start = time.time()
+        job.execute(python_command(code))
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = sum(os.path.getsize(os.path.join(self.work_dir, file)) for file in os.listdir(self.work_dir))
+        print('%.1f MB output: %.2fs, peak memory %.2f MB' % (size / 1e6, elapsed, peak / 1e6))
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,30 +12,69 @@ support * and ? in input (only one is supported):
 for example:
 '01?' matches ['011', '01a']
 '01*' matches ['01', '011234567']
+
+non-interactive batch mode, the files are transferred in a process pool:
+python runner.py '0*' 'm05??' --workers 8 --report report.txt
 """
 
 
 import MCNPtoRMC as M2R
 import os
 import re
+import argparse
+
+
+def match_files(filename, path=None):
+    """
+    Find the files in the path matching the filename with '*' and '?'.
+    :param filename: the filename, '*' and '?' can be used.
+    :param path: the directory to search, default to the current working directory.
+    :return: list of the matched files.
+    """
+    reg = filename.replace('?', '.')
+    reg = reg.replace('*', '.*')
+
+    if path is None:
+        path = os.getcwd()
+    processed_files = []
+    for file in os.listdir(path):
+        if re.match(r'^'+reg+'$', file) and len(file) >= len(reg)-1:
+            processed_files.append(file)
+    return processed_files
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('%s is not a positive integer' % value)
+    return number
+
 
+def _argparse(args=None):
+    parser = argparse.ArgumentParser(description='MCNP to RMC transformation tools')
+    parser.add_argument("files", nargs='*',
+                        help="the files to be transferred, '*' and '?' can be used. "
+                             "Input interactively if not given.")
+    parser.add_argument("--workers", default=None, type=_positive_int,
+                        help="the number of processes, default to the number of CPUs")
+    parser.add_argument("--report", default=None,
+                        help="the file to write the summary report")
+    return parser.parse_args(args)
 
-print("Hello! Start with the MCNP to RMC transformation tools! \nAuthor: ShenPF")
 
-# files = ['0'+str(i+1) for i in range(8)]
-# for file in files:
-#     M2R.transfer(file)
+if __name__ == '__main__':
+    args = _argparse()
 
-filename = input("\nPlease input the filename: \nnote: '*' and '?' can be used. \n")
-print("You have input : " + filename + '\n')
-reg = filename.replace('?', '.')
-reg = reg.replace('*', '.*')
+    if args.files:
+        processed_files = []
+        for filename in args.files:
+            processed_files.extend(file for file in match_files(filename) if file not in processed_files)
+        M2R.batch_transfer(sorted(processed_files), workers=args.workers, report=args.report)
+    else:
+        print("Hello! Start with the MCNP to RMC transformation tools! \nAuthor: ShenPF")
 
-processed_files = []
-path = os.getcwd()
-for file in os.listdir(path):
-    if re.match(r'^'+reg+'$', file) and len(file) >= len(reg)-1:
-        processed_files.append(file)
+        filename = input("\nPlease input the filename: \nnote: '*' and '?' can be used. \n")
+        print("You have input : " + filename + '\n')
 
-for file in processed_files:
-    M2R.transfer(file)
+        for file in match_files(filename):
+            M2R.transfer(file)